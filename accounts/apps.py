@@ -7,3 +7,4 @@ class AccountsConfig(AppConfig):
 
     def ready(self):
         import accounts.signals
+        import accounts.tasks  # Đăng ký handler outbox
@@ -0,0 +1,40 @@
+# accounts/tasks.py
+# Handler outbox của app accounts (được nạp trong AccountsConfig.ready).
+# Outbox chỉ lưu id user + domain; token được tạo lúc gửi để không nằm trong DB.
+
+from django.core.mail import EmailMessage
+from django.template.loader import render_to_string
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+from django.contrib.auth.tokens import default_token_generator
+from notifications import outbox
+from .models import User
+from .tokens import account_activation_token
+
+
+def _send_account_email(user, domain, subject, template_name, token_generator):
+    message = render_to_string(template_name, {
+        'user': user,
+        'domain': domain,
+        'uid': urlsafe_base64_encode(force_bytes(user.pk)),
+        'token': token_generator.make_token(user),
+    })
+    EmailMessage(subject, message, to=[user.email]).send()
+
+
+@outbox.handler('accounts.activation_email')
+def send_activation_email(payload):
+    user = User.objects.filter(pk=payload['user_id'], is_active=False).first()
+    if user is None:
+        return  # Tài khoản đã kích hoạt hoặc đã bị xóa
+    _send_account_email(user, payload['domain'], 'Kích hoạt tài khoản của bạn.',
+                        'accounts/acc_active_email.html', account_activation_token)
+
+
+@outbox.handler('accounts.password_reset_email')
+def send_password_reset_email(payload):
+    user = User.objects.filter(pk=payload['user_id']).first()
+    if user is None:
+        return
+    _send_account_email(user, payload['domain'], 'Yêu cầu đặt lại mật khẩu',
+                        'accounts/reset_password_email.html', default_token_generator)
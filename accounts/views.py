@@ -5,18 +5,18 @@ from django.urls import reverse_lazy
 from django.views.generic import CreateView, DetailView, UpdateView, DeleteView, ListView
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin 
 from django.contrib.auth.decorators import login_required
+from django.db import transaction
 from django.db.models import Q
 from django.contrib.auth import get_user_model
 from notifications.models import Notification 
+from notifications import outbox
 from .forms import CustomUserCreationForm, CustomUserChangeForm
 from .models import User, Friendship 
 from posts.models import Post, Reaction, Comment, PostMedia
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.sites.shortcuts import get_current_site
-from django.utils.encoding import force_bytes, force_str
-from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
-from django.template.loader import render_to_string
-from django.core.mail import EmailMessage
+from django.utils.encoding import force_str
+from django.utils.http import urlsafe_base64_decode
 from django.http import HttpResponse
 from .tokens import account_activation_token 
 from django.contrib import messages
@@ -28,25 +28,19 @@ class SignUpView(CreateView):
     template_name = 'accounts/register.html'
 
     def form_valid(self, form):
-        # Lưu user nhưng chưa commit vào DB để chỉnh sửa
-        user = form.save(commit=False)
-        user.is_active = False # Vô hiệu hóa tài khoản chưa kích hoạt email 
-        user.save() # Lưu user vào DB với is_active=False
-
-        # Gửi email xác thực
-        current_site = get_current_site(self.request)
-        mail_subject = 'Kích hoạt tài khoản của bạn.'
-        message = render_to_string('accounts/acc_active_email.html', {
-            'user': user,
-            'domain': current_site.domain,
-            'uid': urlsafe_base64_encode(force_bytes(user.pk)),
-            'token': account_activation_token.make_token(user),
-        })
-        to_email = form.cleaned_data.get('email')
-        email = EmailMessage(
-            mail_subject, message, to=[to_email]
-        )
-        email.send()
+        # Lưu user và sự kiện gửi email trong cùng một transaction:
+        # không bao giờ có user mà không có email kích hoạt (và ngược lại)
+        with transaction.atomic():
+            # Lưu user nhưng chưa commit vào DB để chỉnh sửa
+            user = form.save(commit=False)
+            user.is_active = False # Vô hiệu hóa tài khoản chưa kích hoạt email 
+            user.save() # Lưu user vào DB với is_active=False
+
+            # Email xác thực được worker outbox gửi (accounts/tasks.py)
+            outbox.enqueue('accounts.activation_email', {
+                'user_id': user.pk,
+                'domain': get_current_site(self.request).domain,
+            })
 
         # Trả về trang thông báo yêu cầu check mail
         return render(self.request, 'accounts/email_sent_confirm.html')
@@ -134,29 +128,23 @@ class ProfileView(DetailView):
             posts_on_page = context['posts']
             post_ids = [post.id for post in posts_on_page]
             
-            post_content_type = ContentType.objects.get_for_model(Post)
             user_post_reactions = Reaction.objects.filter(
                 user=self.request.user, 
-                object_id__in=post_ids,
-                content_type=post_content_type
-            ).values('object_id', 'reaction_type')
+                post_id__in=post_ids,
+            ).values('post_id', 'reaction_type')
             
             context['user_reactions_map'] = {
-                reaction['object_id']: reaction['reaction_type'] 
+                reaction['post_id']: reaction['reaction_type'] 
                 for reaction in user_post_reactions
             }
 
-            comment_ids = Comment.objects.filter(post_id__in=post_ids).values_list('id', flat=True)
-            comment_content_type = ContentType.objects.get_for_model(Comment)
-            
             user_comment_reactions = Reaction.objects.filter(
                 user=self.request.user,
-                object_id__in=comment_ids,
-                content_type=comment_content_type
-            ).values('object_id', 'reaction_type')
+                comment__post_id__in=post_ids,
+            ).values('comment_id', 'reaction_type')
             
             context['comment_user_reactions_map'] = {
-                reaction['object_id']: reaction['reaction_type']
+                reaction['comment_id']: reaction['reaction_type']
                 for reaction in user_comment_reactions
             }
 
@@ -361,20 +349,11 @@ def forgot_password(request):
         if User.objects.filter(email=email).exists():
             user = User.objects.get(email__exact=email)
 
-            # Tạo nội dung email
-            current_site = get_current_site(request)
-            mail_subject = 'Yêu cầu đặt lại mật khẩu'
-            
-            message = render_to_string('accounts/reset_password_email.html', {
-                'user': user,
-                'domain': current_site.domain,
-                'uid': urlsafe_base64_encode(force_bytes(user.pk)),
-                'token': default_token_generator.make_token(user),
+            # Email đặt lại mật khẩu được worker outbox gửi (accounts/tasks.py)
+            outbox.enqueue('accounts.password_reset_email', {
+                'user_id': user.pk,
+                'domain': get_current_site(request).domain,
             })
-            
-            to_email = email
-            send_email = EmailMessage(mail_subject, message, to=[to_email])
-            send_email.send()
 
             messages.success(request, 'Vui lòng kiểm tra email để đặt lại mật khẩu.')
             return redirect('accounts:login') 
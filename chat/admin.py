@@ -1,6 +1,11 @@
 from django.contrib import admin
-from .models import Conversation, Message, MessageReadStatus
+from .models import Conversation, ConversationState, Message, MessageArchive
 
 admin.site.register(Conversation)
 admin.site.register(Message)
-admin.site.register(MessageReadStatus)
\ No newline at end of file
+admin.site.register(ConversationState)
+
+@admin.register(MessageArchive)
+class MessageArchiveAdmin(admin.ModelAdmin):
+    list_display = ('conversation', 'first_message_id', 'last_message_id', 'message_count', 'created_at')
+    exclude = ('data',)
@@ -0,0 +1,153 @@
+# chat/archive.py
+"""
+Lưu trữ tin nhắn cũ (cold storage) cho các cuộc trò chuyện dài.
+
+archive_conversation() chuyển các tin cũ hơn một mốc thời gian sang MessageArchive theo khối
+id liên tiếp: mỗi khối là một dòng nén zlib chứa tin, người đã ẩn tin và reaction của tin,
+rồi xóa các tin đó khỏi bảng Message trong cùng transaction. Vì luôn lấy từ tin cũ nhất, mọi tin
+đã lưu trữ của một cuộc trò chuyện có id nhỏ hơn mọi tin còn trong bảng Message
+(Conversation.archived_until_id là ranh giới), nên đọc lịch sử chỉ cần đọc bảng chính trước
+rồi đọc tiếp kho lưu trữ khi hết tin (chat/views.py::_paginate_messages).
+
+Tin cuối của cuộc trò chuyện (last_message) không bao giờ bị lưu trữ. Tìm kiếm
+(chat/search.py) chỉ tìm trong các tin còn ở bảng Message: chỉ mục của tin bị lưu trữ bị xóa theo.
+Thông báo MESSAGE / MESSAGE_REACTION trỏ tới các tin này cũng bị xóa trong cùng transaction
+để không còn GenericForeignKey trỏ vào khoảng không.
+"""
+import json
+import zlib
+from collections import Counter, defaultdict
+
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import Max
+from django.utils.dateparse import parse_datetime
+from notifications.models import Notification
+from posts.models import Reaction
+from .models import Conversation, Message, MessageArchive
+
+User = get_user_model()
+
+
+def _pack(rows):
+    return zlib.compress(json.dumps(rows, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+
+
+def _unpack(data):
+    return json.loads(zlib.decompress(bytes(data)).decode('utf-8'))
+
+
+def archive_conversation(conversation, cutoff, chunk_size):
+    """
+    Chuyển các tin gửi trước `cutoff` của một cuộc trò chuyện sang kho lưu trữ, mỗi khối
+    `chunk_size` tin trong một transaction riêng (bị ngắt giữa chừng thì chạy lại tiếp được).
+    Trả về số tin đã chuyển.
+    """
+    boundary = conversation.messages.filter(timestamp__lt=cutoff).aggregate(last_id=Max('id'))['last_id']
+    if boundary is None:
+        return 0
+    if conversation.last_message_id:
+        boundary = min(boundary, conversation.last_message_id - 1)
+
+    message_type = ContentType.objects.get_for_model(Message)
+    total = 0
+    while True:
+        with transaction.atomic():
+            # Khóa các tin của khối trước khi chụp: sửa / ẩn / thả cảm xúc chạy song song phải chờ
+            # tới khi khối được lưu và xóa (rồi thất bại vì tin không còn) thay vì bị mất lặng lẽ
+            rows = list(
+                Message.objects.select_for_update().filter(conversation=conversation, id__lte=boundary)
+                .order_by('id').values('id', 'sender_id', 'text', 'file', 'timestamp')[:chunk_size]
+            )
+            if not rows:
+                break
+            message_ids = [row['id'] for row in rows]
+
+            hidden_by = defaultdict(list)
+            for message_id, user_id in Message.hidden_by.through.objects.select_for_update().filter(
+                message_id__in=message_ids
+            ).values_list('message_id', 'user_id'):
+                hidden_by[message_id].append(user_id)
+            reactions = defaultdict(list)
+            for message_id, user_id, reaction_type in Reaction.objects.select_for_update().filter(
+                message_id__in=message_ids
+            ).values_list('message_id', 'user_id', 'reaction_type'):
+                reactions[message_id].append([user_id, reaction_type])
+
+            MessageArchive.objects.create(
+                conversation=conversation,
+                first_message_id=message_ids[0],
+                last_message_id=message_ids[-1],
+                message_count=len(rows),
+                data=_pack([
+                    {
+                        'id': row['id'],
+                        'sender_id': row['sender_id'],
+                        'text': row['text'],
+                        'file': row['file'] or '',
+                        'timestamp': row['timestamp'].isoformat(),
+                        'hidden_by': hidden_by.get(row['id'], []),
+                        'reactions': reactions.get(row['id'], []),
+                    }
+                    for row in rows
+                ]),
+            )
+            # Xóa kéo theo reaction, dòng ẩn tin và chỉ mục tìm kiếm của các tin này
+            Message.objects.filter(id__in=message_ids).delete()
+            Notification.objects.filter(target_content_type=message_type, target_object_id__in=message_ids).delete()
+            Conversation.objects.filter(id=conversation.id).update(archived_until_id=message_ids[-1])
+        conversation.archived_until_id = message_ids[-1]
+        total += len(rows)
+    return total
+
+
+def archived_messages(conversation, user, before_id=None, min_id=0, limit=30):
+    """
+    Tối đa `limit` tin đã lưu trữ có min_id < id < before_id, mới nhất trước, bỏ các tin `user`
+    đã ẩn. Mỗi khối là một truy vấn; thường một trang chỉ cần một hai khối.
+    Trả về các Message chưa lưu (is_archived=True) đã gắn sender và thống kê reaction
+    giống _attach_reaction_stats.
+    """
+    chunks = MessageArchive.objects.filter(conversation=conversation, last_message_id__gt=min_id)
+    rows = []
+    senders = {}
+    upper = before_id
+    while len(rows) < limit:
+        chunk_qs = chunks if upper is None else chunks.filter(first_message_id__lt=upper)
+        chunk = chunk_qs.order_by('-first_message_id').only('first_message_id', 'data').first()
+        if chunk is None:
+            break
+        candidates = [
+            row for row in reversed(_unpack(chunk.data))
+            if (upper is None or row['id'] < upper) and row['id'] > min_id and user.id not in row['hidden_by']
+        ]
+        missing = {row['sender_id'] for row in candidates if row['sender_id']} - senders.keys()
+        if missing:
+            senders.update(User.objects.in_bulk(missing))
+        for row in candidates:
+            # Tài khoản người gửi đã bị xóa thì bỏ tin, giống tin trong bảng chính bị xóa theo
+            if row['sender_id'] and row['sender_id'] not in senders:
+                continue
+            rows.append(row)
+            if len(rows) == limit:
+                break
+        upper = chunk.first_message_id
+
+    messages = []
+    for row in rows:
+        sender = senders.get(row['sender_id'])
+        message = Message(
+            id=row['id'], conversation=conversation, sender=sender, text=row['text'],
+            file=row['file'] or None, timestamp=parse_datetime(row['timestamp']),
+        )
+        message.is_archived = True
+        message.archived_reactions = {user_id: reaction_type for user_id, reaction_type in row['reactions']}
+        counts = Counter(reaction_type for _, reaction_type in row['reactions'])
+        message.reaction_stats = [
+            {'message_id': row['id'], 'reaction_type': reaction_type, 'count': count}
+            for reaction_type, count in counts.items()
+        ]
+        message.reaction_total = len(row['reactions'])
+        messages.append(message)
+    return messages
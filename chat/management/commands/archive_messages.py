@@ -0,0 +1,40 @@
+# chat/management/commands/archive_messages.py
+
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from chat.archive import archive_conversation
+from chat.models import Conversation
+
+
+class Command(BaseCommand):
+    help = (
+        'Chuyển tin nhắn cũ hơn MESSAGE_ARCHIVE_AFTER_DAYS ngày sang bảng MessageArchive '
+        '(nén theo khối id liên tiếp của từng cuộc trò chuyện). Chạy định kỳ bằng cron; '
+        'bị ngắt giữa chừng thì chạy lại, các khối đã chuyển được giữ nguyên.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.MESSAGE_ARCHIVE_AFTER_DAYS)
+        parser.add_argument('--chunk-size', type=int, default=settings.MESSAGE_ARCHIVE_CHUNK_SIZE,
+                            help='Số tin mỗi khối lưu trữ (mỗi khối một transaction).')
+        parser.add_argument('--conversation', type=int, help='Chỉ lưu trữ một cuộc trò chuyện.')
+        parser.add_argument('--start-id', type=int, default=0, help='Tiếp tục từ id cuộc trò chuyện này.')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        conversations = Conversation.objects.filter(id__gte=options['start_id']).only(
+            'id', 'last_message_id', 'archived_until_id',
+        ).order_by('id')
+        if options['conversation']:
+            conversations = conversations.filter(id=options['conversation'])
+
+        total = 0
+        for conversation in conversations.iterator():
+            archived = archive_conversation(conversation, cutoff, options['chunk_size'])
+            if archived:
+                total += archived
+                self.stdout.write(f"Cuộc trò chuyện {conversation.id}: lưu trữ {archived} tin (tới id {conversation.archived_until_id}).")
+
+        self.stdout.write(self.style.SUCCESS(f"Xong: {total} tin nhắn."))
@@ -0,0 +1,125 @@
+# chat/management/commands/benchmark_message_archive.py
+
+import statistics
+import time
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+from chat.archive import archive_conversation
+from chat.models import Conversation, Message, MessageArchive
+from chat.utils import conversation_list, get_or_create_private_conversation, get_unread_conversation_count
+from chat.views import _paginate_messages
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Đo độ trễ các truy vấn chat thường dùng (trang tin mới nhất, tải tin cũ, badge chưa đọc, '
+        'danh sách cuộc trò chuyện) trên một cuộc trò chuyện dài, trước và sau khi lưu trữ tin cũ '
+        'sang MessageArchive; kèm thời gian đọc một trang lịch sử sâu ở mỗi trạng thái. '
+        'Dữ liệu thử được xóa khi chạy xong.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=200_000, help='Số tin cũ (sẽ bị lưu trữ).')
+        parser.add_argument('--recent', type=int, default=500, help='Số tin mới (ở lại bảng Message).')
+        parser.add_argument('--chunk-size', type=int, default=settings.MESSAGE_ARCHIVE_CHUNK_SIZE)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--repeat', type=int, default=20, help='Số lần chạy mỗi phép đo.')
+        parser.add_argument('--keep', action='store_true', help='Giữ lại dữ liệu thử.')
+        parser.add_argument('--explain', action='store_true', help='In kế hoạch thực thi của trang tin mới nhất.')
+
+    def handle(self, *args, **options):
+        suffix = uuid.uuid4().hex[:8]
+        reader = User.objects.create_user(f'bench_reader_{suffix}', password=None)
+        sender = User.objects.create_user(f'bench_sender_{suffix}', password=None)
+        conversation, _ = get_or_create_private_conversation(reader, sender)
+        try:
+            deep_id = self.populate(reader, sender, conversation, options)
+            before = self.measure('Trước khi lưu trữ', reader, conversation, deep_id, options)
+
+            started = time.perf_counter()
+            cutoff = timezone.now() - timedelta(days=settings.MESSAGE_ARCHIVE_AFTER_DAYS)
+            archived = archive_conversation(conversation, cutoff, options['chunk_size'])
+            self.stdout.write(
+                f"\nĐã lưu trữ {archived} tin thành {MessageArchive.objects.filter(conversation=conversation).count()} "
+                f"khối trong {time.perf_counter() - started:.1f}s"
+            )
+
+            conversation.refresh_from_db()
+            after = self.measure('Sau khi lưu trữ', reader, conversation, deep_id, options)
+            self.report(before, after)
+        finally:
+            if not options['keep']:
+                conversation.delete()
+                reader.delete()
+                sender.delete()
+                self.stdout.write("Đã xóa dữ liệu thử.")
+
+    def populate(self, reader, sender, conversation, options):
+        batch_size = options['batch_size']
+        started = time.perf_counter()
+        old_timestamp = timezone.now() - timedelta(days=settings.MESSAGE_ARCHIVE_AFTER_DAYS + 30)
+
+        for start in range(0, options['messages'], batch_size):
+            count = min(batch_size, options['messages'] - start)
+            Message.objects.bulk_create([
+                Message(conversation=conversation, sender=sender if (start + i) % 3 else reader, text=f'bench {start + i}')
+                for i in range(count)
+            ])
+        # auto_now_add ghi đè timestamp khi bulk_create nên lùi ngày bằng một câu UPDATE
+        Message.objects.filter(conversation=conversation).update(timestamp=old_timestamp)
+        deep_id = Message.objects.filter(conversation=conversation).order_by('-id').values_list('id', flat=True)[
+            options['messages'] // 2
+        ]
+
+        Message.objects.bulk_create([
+            Message(conversation=conversation, sender=sender, text=f'recent {i}') for i in range(options['recent'])
+        ])
+        # MySQL không trả id sau bulk_create nên đọc lại tin cuối
+        conversation.last_message = Message.objects.filter(conversation=conversation).order_by('-id').first()
+        conversation.save()
+
+        self.stdout.write(
+            f"Đã tạo {options['messages']} tin cũ + {options['recent']} tin mới "
+            f"trong {time.perf_counter() - started:.1f}s"
+        )
+        return deep_id
+
+    def measure(self, title, reader, conversation, deep_id, options):
+        first_page, _ = _paginate_messages(conversation, reader)
+        cases = [
+            ('Trang tin mới nhất', lambda: _paginate_messages(conversation, reader)),
+            ('Tải tin cũ hơn (trang 2)', lambda: _paginate_messages(conversation, reader, first_page[0].id)),
+            ('Badge cuộc trò chuyện chưa đọc', lambda: get_unread_conversation_count(reader.id)),
+            ('Danh sách cuộc trò chuyện', lambda: conversation_list(reader)),
+            ('Trang lịch sử sâu', lambda: _paginate_messages(conversation, reader, deep_id)),
+        ]
+
+        rows = Message.objects.filter(conversation=conversation).count()
+        self.stdout.write(f"\n{title}: {rows} tin trong bảng Message")
+        results = {}
+        for label, func in cases:
+            timings = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                func()
+                timings.append((time.perf_counter() - started) * 1000)
+            results[label] = (statistics.median(timings), min(timings))
+        if options['explain']:
+            queryset = Message.objects.filter(conversation=conversation).order_by('-id')[:31]
+            self.stdout.write(f"  {connection.vendor}: {queryset.explain()}")
+        return results
+
+    def report(self, before, after):
+        self.stdout.write(f"\n{'Phép đo (median ms)':<35}{'trước':>12}{'sau':>12}{'min trước':>12}{'min sau':>12}")
+        for label in before:
+            self.stdout.write(
+                f"{label:<35}{before[label][0]:>12.1f}{after[label][0]:>12.1f}"
+                f"{before[label][1]:>12.1f}{after[label][1]:>12.1f}"
+            )
@@ -0,0 +1,161 @@
+# chat/management/commands/loadtest_chat_socket.py
+
+import asyncio
+import json
+import resource
+import statistics
+import time
+import uuid
+from importlib import import_module
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, get_user_model
+from django.core.management.base import BaseCommand
+from chat import realtime
+from chat.models import Conversation
+from chat.ws import WS_PATH, chat_socket
+
+User = get_user_model()
+
+
+class VirtualClient:
+    """Một kết nối WebSocket ảo: nói chuyện trực tiếp với chat_socket qua hai hàng đợi ASGI."""
+
+    def __init__(self, session_key):
+        self.scope = {
+            'type': 'websocket',
+            'path': WS_PATH,
+            'headers': [(b'cookie', f'{settings.SESSION_COOKIE_NAME}={session_key}'.encode())],
+        }
+        self.incoming = asyncio.Queue()
+        self.outgoing = asyncio.Queue()
+        self.latencies = []
+        self.task = None
+
+    async def connect(self):
+        await self.incoming.put({'type': 'websocket.connect'})
+        self.task = asyncio.ensure_future(chat_socket(self.scope, self.incoming.get, self.outgoing.put))
+        message = await self.outgoing.get()
+        return message['type'] == 'websocket.accept'
+
+    async def command(self, **command):
+        await self.incoming.put({'type': 'websocket.receive', 'text': json.dumps(command)})
+        return json.loads((await self.outgoing.get())['text'])
+
+    async def collect(self, on_event):
+        while True:
+            message = await self.outgoing.get()
+            received_at = time.perf_counter()
+            if message['type'] != 'websocket.send':
+                return
+            event = json.loads(message['text'])
+            self.latencies.append(received_at - event['sent_at'])
+            on_event()
+
+    async def close(self):
+        await self.incoming.put({'type': 'websocket.disconnect', 'code': 1000})
+        await self.task
+
+
+class Command(BaseCommand):
+    help = (
+        'Đo tải WebSocket chat trong process: mở N kết nối ảo tới chat_socket (đi qua xác thực '
+        'session và lệnh subscribe thật), phát tin từ thread khác như view, rồi đo số kết nối '
+        'và độ trễ đẩy tin tới mọi người theo dõi. Không đo tầng mạng / máy chủ ASGI.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', type=int, default=1000)
+        parser.add_argument('--users', type=int, default=100, help='Số user thử (các kết nối chia đều).')
+        parser.add_argument('--conversations', type=int, default=10, help='Số cuộc trò chuyện được theo dõi.')
+        parser.add_argument('--messages', type=int, default=100, help='Số tin phát đi.')
+
+    def handle(self, *args, **options):
+        suffix = uuid.uuid4().hex[:8]
+        users = [User.objects.create_user(f'ws_{suffix}_{i}', password=None) for i in range(options['users'])]
+        conversations = []
+        for i in range(options['conversations']):
+            conversation = Conversation.objects.create(type='GROUP', name=f'ws-{suffix}-{i}')
+            conversation.participants.add(*users)
+            conversations.append(conversation)
+        session_keys = [self.login(user) for user in users]
+
+        try:
+            asyncio.run(self.run(session_keys, [c.id for c in conversations], options))
+        finally:
+            engine = import_module(settings.SESSION_ENGINE)
+            for key in session_keys:
+                engine.SessionStore(key).delete()
+            Conversation.objects.filter(id__in=[c.id for c in conversations]).delete()
+            User.objects.filter(id__in=[u.id for u in users]).delete()
+
+    def login(self, user):
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = 'django.contrib.auth.backends.ModelBackend'
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.save()
+        return session.session_key
+
+    async def run(self, session_keys, conversation_ids, options):
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        started = time.perf_counter()
+        clients = []
+        subscribers = {conversation_id: 0 for conversation_id in conversation_ids}
+        for i in range(options['connections']):
+            client = VirtualClient(session_keys[i % len(session_keys)])
+            if not await client.connect():
+                raise RuntimeError('Kết nối bị từ chối')
+            conversation_id = conversation_ids[i % len(conversation_ids)]
+            reply = await client.command(action='subscribe', conversation_id=conversation_id)
+            if reply['type'] != 'subscribed':
+                raise RuntimeError(reply)
+            subscribers[conversation_id] += 1
+            clients.append(client)
+        connect_seconds = time.perf_counter() - started
+
+        self.stdout.write(
+            f"Kết nối: {realtime.connection_count()} (mở trong {connect_seconds:.2f}s), "
+            f"RSS tăng ~{(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) / 1024:.1f} MB"
+        )
+
+        pending = 0
+        all_delivered = asyncio.Event()
+
+        def on_event():
+            nonlocal pending
+            pending -= 1
+            if pending == 0:
+                all_delivered.set()
+
+        collectors = [asyncio.ensure_future(client.collect(on_event)) for client in clients]
+        loop = asyncio.get_running_loop()
+        fanout_started = time.perf_counter()
+        for k in range(options['messages']):
+            conversation_id = conversation_ids[k % len(conversation_ids)]
+            pending = subscribers[conversation_id]
+            all_delivered.clear()
+            event = {'type': 'message.sent', 'conversation_id': conversation_id, 'sent_at': time.perf_counter()}
+            # Phát từ thread khác giống view đồng bộ chạy trong thread pool
+            await loop.run_in_executor(None, realtime.group_send, realtime.conversation_group(conversation_id), event)
+            await all_delivered.wait()
+        fanout_seconds = time.perf_counter() - fanout_started
+
+        latencies = sorted(latency * 1000 for client in clients for latency in client.latencies)
+        deliveries = len(latencies)
+        self.stdout.write(
+            f"Đã đẩy {options['messages']} tin -> {deliveries} lượt nhận trong {fanout_seconds:.2f}s "
+            f"({deliveries / fanout_seconds:.0f} lượt/s)"
+        )
+        if latencies:
+            def pct(p):
+                return latencies[min(len(latencies) - 1, int(len(latencies) * p))]
+            self.stdout.write(
+                f"Độ trễ (ms): median {statistics.median(latencies):.2f}, p95 {pct(0.95):.2f}, "
+                f"p99 {pct(0.99):.2f}, max {latencies[-1]:.2f}"
+            )
+
+        for client in clients:
+            await client.close()
+        for collector in collectors:
+            collector.cancel()
+        self.stdout.write(self.style.SUCCESS(f"Đã đóng; còn {realtime.connection_count()} kết nối."))
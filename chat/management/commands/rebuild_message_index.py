@@ -0,0 +1,46 @@
+# chat/management/commands/rebuild_message_index.py
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from chat.models import Message, MessageSearchTerm
+from chat.search import tokenize
+
+
+class Command(BaseCommand):
+    help = (
+        'Dựng lại chỉ mục tìm kiếm tin nhắn (MessageSearchTerm) theo lô id tăng dần. '
+        'Chạy một lần sau khi triển khai tìm kiếm, hoặc sau khi đổi cách tách từ.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--conversation', type=int, help='Chỉ dựng lại cho một cuộc trò chuyện.')
+        parser.add_argument('--start-id', type=int, default=0, help='Tiếp tục từ id tin nhắn này (lần chạy trước bị ngắt).')
+
+    def handle(self, *args, **options):
+        messages = Message.objects.exclude(text__isnull=True).exclude(text='')
+        if options['conversation']:
+            messages = messages.filter(conversation_id=options['conversation'])
+
+        last_id = options['start_id']
+        total = 0
+        while True:
+            batch = list(
+                messages.filter(id__gt=last_id).order_by('id')
+                .values_list('id', 'conversation_id', 'text')[:options['batch_size']]
+            )
+            if not batch:
+                break
+            terms = [
+                MessageSearchTerm(message_id=message_id, conversation_id=conversation_id, term=term)
+                for message_id, conversation_id, text in batch
+                for term in tokenize(text)
+            ]
+            with transaction.atomic():
+                MessageSearchTerm.objects.filter(message_id__in=[row[0] for row in batch]).delete()
+                MessageSearchTerm.objects.bulk_create(terms, batch_size=5000)
+            last_id = batch[-1][0]
+            total += len(batch)
+            self.stdout.write(f"Đã lập chỉ mục {total} tin nhắn (tới id {last_id}).")
+
+        self.stdout.write(self.style.SUCCESS(f"Xong: {total} tin nhắn."))
@@ -0,0 +1,61 @@
+# Generated by Django 4.2.24 on 2026-10-19 14:22
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+
+
+def create_states(apps, schema_editor):
+    # Mỗi thành viên hiện có một dòng; số chưa đọc lấy từ các thông báo MESSAGE chưa đọc
+    Conversation = apps.get_model('chat', 'Conversation')
+    ConversationState = apps.get_model('chat', 'ConversationState')
+    Notification = apps.get_model('notifications', 'Notification')
+    Participant = Conversation.participants.through
+
+    unread = {
+        (row['recipient_id'], row['conversation_id']): row['total']
+        for row in Notification.objects.filter(
+            notification_type='MESSAGE', is_read=False, conversation__isnull=False,
+        ).values('recipient_id', 'conversation_id').annotate(total=Count('id'))
+    }
+    activity = dict(Conversation.objects.values_list('id', 'updated_at'))
+
+    batch = []
+    for user_id, conversation_id in Participant.objects.values_list('user_id', 'conversation_id').iterator():
+        batch.append(ConversationState(
+            user_id=user_id, conversation_id=conversation_id,
+            unread_count=unread.get((user_id, conversation_id), 0),
+            last_activity_at=activity.get(conversation_id),
+        ))
+        if len(batch) >= 1000:
+            ConversationState.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    ConversationState.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('chat', '0006_conversation_hidden_by'),
+        ('notifications', '0010_notification_conversation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConversationState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('unread_count', models.PositiveIntegerField(default=0)),
+                ('last_activity_at', models.DateTimeField(blank=True, null=True)),
+                ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='states', to='chat.conversation')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversation_states', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'unread_count'], name='conv_state_user_unread_idx')],
+                'unique_together': {('user', 'conversation')},
+            },
+        ),
+        migrations.RunPython(create_states, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.24 on 2026-10-19 14:34
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def hidden_by_to_watermark(apps, schema_editor):
+    # Mỗi (user, cuộc trò chuyện) đang bị "xóa phía tôi": mốc = tin lớn nhất user đã ẩn,
+    # rồi bỏ các dòng ẩn từng tin nằm dưới mốc (mốc đã thay cho chúng)
+    Conversation = apps.get_model('chat', 'Conversation')
+    ConversationState = apps.get_model('chat', 'ConversationState')
+    Message = apps.get_model('chat', 'Message')
+    HiddenConversation = Conversation.hidden_by.through
+    HiddenMessage = Message.hidden_by.through
+
+    for user_id, conversation_id in HiddenConversation.objects.values_list('user_id', 'conversation_id').iterator():
+        last_id = HiddenMessage.objects.filter(
+            user_id=user_id, message__conversation_id=conversation_id,
+        ).aggregate(last_id=Max('message_id'))['last_id']
+        if last_id is None:
+            last_id = Message.objects.filter(conversation_id=conversation_id).aggregate(last_id=Max('id'))['last_id'] or 0
+        ConversationState.objects.filter(user_id=user_id, conversation_id=conversation_id).update(cleared_before_id=last_id)
+        message_ids = list(Message.objects.filter(conversation_id=conversation_id, id__lte=last_id).values_list('id', flat=True))
+        for start in range(0, len(message_ids), 1000):
+            HiddenMessage.objects.filter(user_id=user_id, message_id__in=message_ids[start:start + 1000]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0007_conversation_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversationstate',
+            name='cleared_before_id',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.RunPython(hidden_by_to_watermark, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='conversation',
+            name='hidden_by',
+        ),
+    ]
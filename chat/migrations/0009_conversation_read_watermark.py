@@ -0,0 +1,51 @@
+# Generated by Django 4.2.24 on 2026-10-19 14:37
+
+from django.db import migrations, models
+from django.db.models import Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def unread_count_to_watermark(apps, schema_editor):
+    # Đã đọc hết: mốc = tin mới nhất của cuộc trò chuyện (một câu UPDATE).
+    # Còn n tin chưa đọc: mốc nằm ngay trước tin thứ n (tính từ mới nhất) của người khác.
+    ConversationState = apps.get_model('chat', 'ConversationState')
+    Message = apps.get_model('chat', 'Message')
+
+    latest = Message.objects.filter(conversation=OuterRef('conversation_id')).values('conversation').annotate(last_id=Max('id')).values('last_id')
+    ConversationState.objects.filter(unread_count=0).update(last_read_message_id=Coalesce(Subquery(latest), 0))
+
+    for state in ConversationState.objects.filter(unread_count__gt=0).iterator():
+        ids = list(
+            Message.objects.filter(conversation_id=state.conversation_id).exclude(sender_id=state.user_id)
+            .order_by('-id').values_list('id', flat=True)[:state.unread_count]
+        )
+        state.last_read_message_id = ids[-1] - 1 if ids else 0
+        state.save(update_fields=['last_read_message_id'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0008_conversation_cleared_before'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversationstate',
+            name='last_read_message_id',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.RunPython(unread_count_to_watermark, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='conversationstate',
+            name='conv_state_user_unread_idx',
+        ),
+        migrations.RemoveField(
+            model_name='conversationstate',
+            name='unread_count',
+        ),
+        # Không có gì ghi vào bảng này; "Đã xem" giờ suy ra từ last_read_message_id
+        migrations.DeleteModel(
+            name='MessageReadStatus',
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 4.2.24 on 2026-10-19 14:41
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_pair_keys(apps, schema_editor):
+    # Gắn khóa cặp cho cuộc trò chuyện PRIVATE có đúng 2 thành viên. Nếu một cặp đã lỡ có
+    # nhiều cuộc (do race cũ) thì chỉ cuộc hoạt động gần nhất nhận khóa; các cuộc còn lại
+    # giữ nguyên, vẫn mở được từ danh sách nhưng không còn được "Nhắn tin" trả về.
+    Conversation = apps.get_model('chat', 'Conversation')
+    Participant = Conversation.participants.through
+
+    members = {}
+    private_ids = Conversation.objects.filter(type='PRIVATE').values_list('id', flat=True)
+    for conversation_id, user_id in Participant.objects.filter(conversation_id__in=private_ids).values_list('conversation_id', 'user_id').iterator():
+        members.setdefault(conversation_id, []).append(user_id)
+
+    keyed = set()
+    for conversation in Conversation.objects.filter(id__in=list(members)).order_by('-updated_at', '-id').iterator():
+        user_ids = members[conversation.id]
+        if len(user_ids) != 2 or user_ids[0] == user_ids[1]:
+            continue
+        pair = tuple(sorted(user_ids))
+        if pair in keyed:
+            continue
+        keyed.add(pair)
+        Conversation.objects.filter(id=conversation.id).update(user_low_id=pair[0], user_high_id=pair[1])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('chat', '0009_conversation_read_watermark'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='user_high',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='user_low',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(fill_pair_keys, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='conversation',
+            constraint=models.UniqueConstraint(fields=('user_low', 'user_high'), name='unique_private_pair'),
+        ),
+    ]
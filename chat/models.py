@@ -1,7 +1,6 @@
 import os
 from django.db import models
 from django.conf import settings
-from django.contrib.contenttypes.fields import GenericRelation
 
 class Conversation(models.Model):
     CONVERSATION_TYPES = [
@@ -14,7 +13,6 @@ class Conversation(models.Model):
     avatar = models.ImageField(upload_to='group_avatars/', default='group_default.png')
     admin_only_management = models.BooleanField(default=True)
     participants = models.ManyToManyField(settings.AUTH_USER_MODEL, related_name='conversations')
-    hidden_by = models.ManyToManyField(settings.AUTH_USER_MODEL, related_name='hidden_conversations', blank=True)
     updated_at = models.DateTimeField(auto_now=True)
     last_message = models.ForeignKey(
         'Message',
@@ -22,10 +20,27 @@ class Conversation(models.Model):
         on_delete=models.SET_NULL,
         null=True, blank=True
     )
+    # Khóa cặp của cuộc trò chuyện PRIVATE (id nhỏ, id lớn): tìm bằng một lần dò unique index
+    # và chặn hai request tạo trùng. Nhóm để NULL (unique index cho phép nhiều NULL).
+    user_low = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    user_high = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    # Id tin lớn nhất đã chuyển sang MessageArchive (0 = chưa lưu trữ); đọc lịch sử chỉ chạm tới
+    # kho lưu trữ khi đã hết tin trong bảng Message và còn tin cũ hơn mốc này
+    archived_until_id = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user_low', 'user_high'], name='unique_private_pair'),
+        ]
 
     def __str__(self):
         return f"Conversation {self.id}"
 
+    @property
+    def cursor(self):
+        # Con trỏ phân trang danh sách cuộc trò chuyện theo cặp (updated_at, id)
+        return f"{self.updated_at.isoformat()}|{self.id}"
+
 class GroupMembershipRequest(models.Model):
     conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='membership_requests')
     invited_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='invitations_sent')
@@ -48,12 +63,17 @@ class Message(models.Model):
     file = models.FileField(upload_to='chat_files/', blank=True, null=True)
 
     timestamp = models.DateTimeField(auto_now_add=True)
-    reactions = GenericRelation('posts.Reaction')
+    # `reactions` là quan hệ ngược từ posts.Reaction.message
     
     hidden_by = models.ManyToManyField(settings.AUTH_USER_MODEL, related_name='hidden_messages', blank=True)
+
+    # True với tin đọc lại từ MessageArchive (chat/archive.py): chỉ để hiển thị, không sửa/xóa/thả cảm xúc
+    is_archived = False
     
     class Meta:
-        ordering = ['timestamp']
+        # Sắp theo id (khóa chính, index (conversation_id, id)) thay vì timestamp không có index;
+        # id tăng dần nên thứ tự vẫn là thứ tự gửi
+        ordering = ['id']
 
     def __str__(self):
         sender_name = self.sender.username if self.sender else "System"
@@ -72,13 +92,61 @@ class Message(models.Model):
         ext = os.path.splitext(self.file.name)[1].lower()
         return ext in ['.mp4', '.mov', '.avi', '.wmv', '.mkv', '.webm']
     
-class MessageReadStatus(models.Model):
-    message = models.ForeignKey(Message, on_delete=models.CASCADE, related_name='read_statuses')
-    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='read_messages')
-    read_at = models.DateTimeField(auto_now_add=True)
+class ConversationState(models.Model):
+    """
+    Trạng thái của một người trong một cuộc trò chuyện: mốc đã đọc, thời điểm có hoạt động
+    cuối và mốc "xóa cuộc trò chuyện phía tôi". Số tin chưa đọc và "Đã xem" đều suy ra từ
+    last_read_message_id (chat/utils.py), không cần Notification hay dòng cho từng tin.
+    Dòng được tạo tự động khi thêm thành viên (chat/signals.py).
+    """
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='states')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='conversation_states')
+    # Id tin mới nhất người dùng đã xem (0 = chưa xem tin nào)
+    last_read_message_id = models.PositiveBigIntegerField(default=0)
+    last_activity_at = models.DateTimeField(null=True, blank=True)
+    # Người dùng chỉ còn thấy các tin có id > mốc này (0 = chưa từng xóa)
+    cleared_before_id = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('user', 'conversation')
+
+    def __str__(self):
+        return f"{self.user_id} @ {self.conversation_id}: đã đọc tới {self.last_read_message_id}"
+
+class MessageSearchTerm(models.Model):
+    """
+    Chỉ mục ngược cho tìm kiếm tin nhắn: mỗi dòng là một từ (đã bỏ dấu, chữ thường) của một tin.
+    Tìm theo (conversation, term) thay vì LIKE '%...%' quét bảng Message; xem chat/search.py.
+    """
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='+')
+    message = models.ForeignKey(Message, on_delete=models.CASCADE, related_name='search_terms')
+    term = models.CharField(max_length=64)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['conversation', 'term', 'message'], name='msg_search_term_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.term} -> {self.message_id}"
+
+class MessageArchive(models.Model):
+    """
+    Một khối tin nhắn cũ đã chuyển khỏi bảng Message (python manage.py archive_messages): các tin
+    liên tiếp có id trong [first_message_id, last_message_id] của một cuộc trò chuyện, nén zlib
+    dạng JSON kèm người đã ẩn và reaction của từng tin. Đọc lại qua chat/archive.py.
+    """
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='archives')
+    first_message_id = models.PositiveBigIntegerField()
+    last_message_id = models.PositiveBigIntegerField()
+    message_count = models.PositiveIntegerField()
+    data = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
-        unique_together = ('message', 'user')
+        constraints = [
+            models.UniqueConstraint(fields=['conversation', 'first_message_id'], name='unique_message_archive_chunk'),
+        ]
 
     def __str__(self):
-        return f"{self.user.username} read message {self.message.id}"
\ No newline at end of file
+        return f"Archive {self.conversation_id}: {self.first_message_id}-{self.last_message_id}"
@@ -0,0 +1,132 @@
+# chat/realtime.py
+"""
+Channel layer chạy trong process cho WebSocket chat (chat/ws.py).
+
+Mỗi kết nối là một `Channel` (hàng đợi asyncio gắn với event loop của nó) và có thể
+tham gia nhiều nhóm:
+  - `conversation:<id>` : sự kiện của một cuộc trò chuyện (tin mới, sửa, thu hồi, cảm xúc)
+  - `user:<id>`         : sự kiện riêng của một người (cuộc trò chuyện có hoạt động, bị mời ra)
+
+View (đồng bộ, chạy trong thread) gọi `publish_*` -> sự kiện được gửi sau khi transaction
+commit, qua `loop.call_soon_threadsafe`. Chỉ phục vụ các kết nối trong cùng process:
+khi chạy nhiều worker ASGI cần thay bằng channel layer dùng chung (Redis...).
+
+Mỗi sự kiện của cuộc trò chuyện còn tăng một số phiên bản trong cache dùng chung, để long-poll
+(api_wait_new_messages) ở process khác vẫn phát hiện được thay đổi bằng cách so phiên bản.
+Cache riêng từng process (chưa đặt REDIS_URL) thì phiên bản là id tin mới nhất đọc từ DB.
+"""
+import asyncio
+import threading
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max
+from core.cache import is_shared_cache
+
+CHANNEL_QUEUE_SIZE = 100
+
+_groups = defaultdict(set)
+_lock = threading.Lock()
+
+
+def conversation_group(conversation_id):
+    return f"conversation:{conversation_id}"
+
+
+def user_group(user_id):
+    return f"user:{user_id}"
+
+
+class Channel:
+    """Hàng đợi sự kiện của một kết nối WebSocket."""
+
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=CHANNEL_QUEUE_SIZE)
+        self.groups = set()
+        # Client đọc không kịp: bỏ sự kiện và đóng kết nối để client tải lại từ đầu
+        self.overflowed = False
+
+    def deliver(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+
+def group_add(group, channel):
+    with _lock:
+        _groups[group].add(channel)
+    channel.groups.add(group)
+
+
+def group_discard(group, channel):
+    with _lock:
+        members = _groups.get(group)
+        if members is not None:
+            members.discard(channel)
+            if not members:
+                del _groups[group]
+    channel.groups.discard(group)
+
+
+def discard_all(channel):
+    for group in list(channel.groups):
+        group_discard(group, channel)
+
+
+def group_send(group, event):
+    """Gửi sự kiện tới mọi kết nối của nhóm; gọi được từ bất kỳ thread nào."""
+    with _lock:
+        members = list(_groups.get(group, ()))
+    for channel in members:
+        try:
+            channel.loop.call_soon_threadsafe(channel.deliver, event)
+        except RuntimeError:
+            pass  # Event loop của kết nối đã đóng
+
+
+def connection_count():
+    with _lock:
+        return len({channel for members in _groups.values() for channel in members})
+
+
+def _version_key(conversation_id):
+    return f"chat:conversation:version:{conversation_id}"
+
+
+def get_conversation_version(conversation_id):
+    if not is_shared_cache():
+        # Không thấy được phiên bản do process khác tăng: so id tin mới nhất (index conversation_id, id)
+        from .models import Message
+        return Message.objects.filter(conversation_id=conversation_id).aggregate(last_id=Max('id'))['last_id'] or 0
+    return cache.get(_version_key(conversation_id), 0)
+
+
+def _bump_conversation_version(conversation_id):
+    if not is_shared_cache():
+        return
+    try:
+        cache.incr(_version_key(conversation_id))
+    except ValueError:
+        cache.add(_version_key(conversation_id), 1, timeout=None)
+
+
+def publish_to_conversation(conversation_id, event_type, **data):
+    event = {'type': event_type, 'conversation_id': conversation_id, **data}
+
+    def send():
+        _bump_conversation_version(conversation_id)
+        group_send(conversation_group(conversation_id), event)
+    transaction.on_commit(send)
+
+
+def publish_to_users(user_ids, event_type, **data):
+    user_ids = list(user_ids)
+    event = {'type': event_type, **data}
+
+    def send():
+        for user_id in user_ids:
+            group_send(user_group(user_id), event)
+    transaction.on_commit(send)
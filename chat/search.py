@@ -0,0 +1,66 @@
+# chat/search.py
+"""
+Tìm kiếm tin nhắn trong một cuộc trò chuyện bằng chỉ mục ngược (MessageSearchTerm).
+
+Mỗi tin được tách thành các từ đã "gấp dấu" (chữ thường, bỏ dấu tiếng Việt, đ -> d):
+"Đi ăn phở không?" -> di, an, pho, khong. Nhờ vậy gõ "pho" hay "phở" đều tìm ra.
+Chỉ mục được ghi lại khi gửi / sửa tin (signal post_save trong chat/signals.py) và tự mất
+theo tin khi thu hồi hoặc lưu trữ (CASCADE; tin đã lưu trữ ở chat/archive.py không được tìm,
+API báo `has_archived` để giao diện ghi chú). Mỗi từ của câu tìm là một lần dò index (conversation, term);
+từ cuối được so theo tiền tố để gõ dở vẫn có kết quả.
+"""
+import re
+import unicodedata
+
+from django.db import transaction
+
+from .models import MessageSearchTerm
+
+MAX_TERM_LENGTH = 64
+MAX_QUERY_TERMS = 8
+SEARCH_PAGE_SIZE = 20
+
+
+def fold(text):
+    """Chữ thường, bỏ dấu: 'Đường phố' -> 'duong pho'."""
+    text = text.lower().replace('đ', 'd')
+    return ''.join(ch for ch in unicodedata.normalize('NFD', text) if not unicodedata.combining(ch))
+
+
+def tokenize(text):
+    """Các từ (không trùng, giữ thứ tự) của một đoạn văn bản sau khi gấp dấu."""
+    return list(dict.fromkeys(term[:MAX_TERM_LENGTH] for term in re.findall(r'\w+', fold(text or ''))))
+
+
+def index_message(message, created=False):
+    """Ghi lại các từ của tin nhắn vào chỉ mục (tin mới thì không cần xóa dòng cũ)."""
+    terms = [
+        MessageSearchTerm(conversation_id=message.conversation_id, message_id=message.id, term=term)
+        for term in tokenize(message.text)
+    ]
+    if created:
+        MessageSearchTerm.objects.bulk_create(terms)
+        return
+    with transaction.atomic():
+        MessageSearchTerm.objects.filter(message_id=message.id).delete()
+        MessageSearchTerm.objects.bulk_create(terms)
+
+
+def search_messages(messages, conversation, query, before_id=None, limit=SEARCH_PAGE_SIZE):
+    """
+    Tin nhắn trong `messages` (queryset đã lọc theo quyền xem của người tìm) chứa mọi từ
+    của `query`, mới nhất trước. Phân trang keyset theo id; trả về (tin nhắn, has_more).
+    """
+    terms = tokenize(query)[:MAX_QUERY_TERMS]
+    if not terms:
+        return [], False
+
+    for position, term in enumerate(terms):
+        lookup = {'term__startswith': term} if position == len(terms) - 1 else {'term': term}
+        matching = MessageSearchTerm.objects.filter(conversation=conversation, **lookup).values('message_id')
+        messages = messages.filter(id__in=matching)
+    if before_id is not None:
+        messages = messages.filter(id__lt=before_id)
+
+    rows = list(messages.select_related('sender').order_by('-id')[:limit + 1])
+    return rows[:limit], len(rows) > limit
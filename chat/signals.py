@@ -0,0 +1,45 @@
+# chat/signals.py
+from django.db.models.signals import m2m_changed, post_save
+from django.dispatch import receiver
+from . import realtime
+from .models import Conversation, ConversationState, Message
+from .search import index_message
+
+
+@receiver(m2m_changed, sender=Conversation.participants.through)
+def sync_conversation_states(sender, instance, action, reverse, pk_set, **kwargs):
+    # Giữ mỗi (thành viên, cuộc trò chuyện) đúng một dòng ConversationState,
+    # dù thêm từ phía conversation.participants hay user.conversations
+    if action == 'post_add' and pk_set:
+        if reverse:
+            pairs = [(instance.pk, conversation_id) for conversation_id in pk_set]
+        else:
+            pairs = [(user_id, instance.pk) for user_id in pk_set]
+        ConversationState.objects.bulk_create(
+            [ConversationState(user_id=user_id, conversation_id=conversation_id) for user_id, conversation_id in pairs],
+            ignore_conflicts=True,
+        )
+    elif action == 'post_remove' and pk_set:
+        if reverse:
+            ConversationState.objects.filter(user_id=instance.pk, conversation_id__in=pk_set).delete()
+            for conversation_id in pk_set:
+                realtime.publish_to_users([instance.pk], 'conversation.removed', conversation_id=conversation_id)
+        else:
+            ConversationState.objects.filter(conversation_id=instance.pk, user_id__in=pk_set).delete()
+            # Socket của người bị mời ra / rời nhóm ngừng nhận sự kiện của nhóm
+            realtime.publish_to_users(pk_set, 'conversation.removed', conversation_id=instance.pk)
+    elif action == 'post_clear':
+        if reverse:
+            ConversationState.objects.filter(user_id=instance.pk).delete()
+        else:
+            ConversationState.objects.filter(conversation_id=instance.pk).delete()
+
+
+@receiver(post_save, sender=Message)
+def index_message_text(sender, instance, created, update_fields=None, **kwargs):
+    # Cập nhật chỉ mục tìm kiếm khi gửi tin (kể cả tin hệ thống) và khi sửa nội dung
+    if update_fields is not None and 'text' not in update_fields:
+        return
+    if created and not instance.text:
+        return
+    index_message(instance, created=created)
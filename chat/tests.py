@@ -1,3 +1,473 @@
+import asyncio
+import json
+import time
+from datetime import timedelta
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models.query import QuerySet
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from accounts.models import User
+from notifications.models import Notification
+from posts.models import Reaction
+from . import realtime, ws
+from .archive import archive_conversation
+from .models import Conversation, ConversationState, Message, MessageArchive
+from .search import SEARCH_PAGE_SIZE, search_messages
+from .utils import (
+    CONVERSATION_PAGE_SIZE, clear_conversation, conversation_list, get_or_create_private_conversation,
+    get_unread_conversation_count, mark_conversation_read, record_new_message,
+)
+from .views import MESSAGE_PAGE_SIZE, _paginate_messages, _visible_messages
+
+
+class ChatTestCase(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', password='x')
+        self.bob = User.objects.create_user('bob', password='x')
+        self.conversation, _ = get_or_create_private_conversation(self.alice, self.bob)
+
+    def send(self, sender, text='hi'):
+        message = Message.objects.create(conversation=self.conversation, sender=sender, text=text)
+        record_new_message(self.conversation, message)
+        return message
+
+    def state(self, user):
+        return ConversationState.objects.get(conversation=self.conversation, user=user)
+
+
+class ClearWatermarkTests(ChatTestCase):
+    def test_clear_hides_history_only_for_that_user(self):
+        old = [self.send(self.bob), self.send(self.alice)]
+        clear_conversation(self.alice, self.conversation)
+
+        state = self.state(self.alice)
+        self.assertEqual(state.cleared_before_id, old[-1].id)
+        self.assertGreaterEqual(state.last_read_message_id, old[-1].id)
+        self.assertFalse(_visible_messages(self.conversation, self.alice).exists())
+        self.assertQuerySetEqual(_visible_messages(self.conversation, self.bob), old)
+
+        newer = self.send(self.bob)
+        self.assertQuerySetEqual(_visible_messages(self.conversation, self.alice), [newer])
+
+    def test_clear_never_moves_read_watermark_back(self):
+        self.send(self.bob)
+        ConversationState.objects.filter(conversation=self.conversation, user=self.alice).update(
+            last_read_message_id=10**9,
+        )
+        clear_conversation(self.alice, self.conversation)
+        self.assertEqual(self.state(self.alice).last_read_message_id, 10**9)
+
+    def test_clear_empty_conversation(self):
+        clear_conversation(self.alice, self.conversation)
+        self.assertEqual(self.state(self.alice).cleared_before_id, 0)
+
+
+class ReadWatermarkTests(ChatTestCase):
+    def unread(self, user):
+        conversations, _ = conversation_list(user)
+        return conversations[0].unread_count
+
+    def test_own_messages_are_never_unread(self):
+        self.send(self.alice)
+        self.assertEqual(self.unread(self.alice), 0)
+        self.assertEqual(get_unread_conversation_count(self.alice.id), 0)
+        self.assertEqual(self.unread(self.bob), 1)
+
+    def test_mark_read_up_to_message(self):
+        first, second, third = self.send(self.bob), self.send(self.bob), self.send(self.bob)
+        self.assertEqual(self.unread(self.alice), 3)
+        self.assertEqual(get_unread_conversation_count(self.alice.id), 1)
+
+        mark_conversation_read(self.alice, self.conversation, second.id)
+        self.assertEqual(self.unread(self.alice), 1)
+        # Mốc chỉ tiến lên: đánh dấu một tin cũ hơn không làm tăng lại số chưa đọc
+        mark_conversation_read(self.alice, self.conversation, first.id)
+        self.assertEqual(self.state(self.alice).last_read_message_id, second.id)
+
+        mark_conversation_read(self.alice, self.conversation)
+        self.assertEqual(self.state(self.alice).last_read_message_id, third.id)
+        self.assertEqual(self.unread(self.alice), 0)
+        self.assertEqual(get_unread_conversation_count(self.alice.id), 0)
+
+    def test_replying_marks_earlier_messages_read(self):
+        self.send(self.bob)
+        reply = self.send(self.alice)
+        self.assertEqual(self.state(self.alice).last_read_message_id, reply.id)
+        self.assertEqual(self.unread(self.alice), 0)
+
+    def test_mark_read_empty_conversation(self):
+        mark_conversation_read(self.alice, self.conversation)
+        self.assertEqual(self.state(self.alice).last_read_message_id, 0)
+
+
+class PrivatePairTests(ChatTestCase):
+    def test_pair_key_is_order_independent(self):
+        conversation, created = get_or_create_private_conversation(self.bob, self.alice)
+        self.assertEqual((conversation, created), (self.conversation, False))
+        self.assertEqual(
+            (conversation.user_low_id, conversation.user_high_id),
+            tuple(sorted([self.alice.id, self.bob.id])),
+        )
+
+    def test_concurrent_create_returns_existing_row(self):
+        # Request song song chưa thấy dòng của bên kia lúc tra cứu: create đụng unique index
+        with mock.patch.object(QuerySet, 'first', return_value=None):
+            conversation, created = get_or_create_private_conversation(self.bob, self.alice)
+        self.assertEqual((conversation, created), (self.conversation, False))
+        self.assertEqual(Conversation.objects.filter(type='PRIVATE').count(), 1)
+        self.assertEqual(set(conversation.participants.values_list('id', flat=True)), {self.alice.id, self.bob.id})
+
+
+class MessageCursorTests(ChatTestCase):
+    def setUp(self):
+        super().setUp()
+        self.messages = [self.send(self.bob, f'm{i}') for i in range(MESSAGE_PAGE_SIZE + 5)]
+        self.client.force_login(self.alice)
+
+    def load_older(self, cursor):
+        return self.client.get(reverse('chat:load_older_messages', args=[self.conversation.id]), {'cursor': cursor})
+
+    def test_cursor_continues_from_oldest_shown_message(self):
+        page, has_more = _paginate_messages(self.conversation, self.alice)
+        self.assertTrue(has_more)
+        self.assertEqual(page, self.messages[5:])
+
+        data = self.load_older(page[0].id).json()
+        self.assertFalse(data['has_more'])
+        self.assertEqual(data['next_cursor'], self.messages[0].id)
+
+    def test_rejects_invalid_cursor(self):
+        for cursor in ('abc', '1.5', '12|34'):
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.load_older(cursor).status_code, 400)
+
+
+class ConversationListCursorTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('owner', password='x')
+        self.conversations = []
+        for i in range(CONVERSATION_PAGE_SIZE + 3):
+            other = User.objects.create_user(f'friend{i}', password='x')
+            conversation, _ = get_or_create_private_conversation(self.user, other)
+            message = Message.objects.create(conversation=conversation, sender=other, text='hi')
+            record_new_message(conversation, message)
+            self.conversations.append(conversation)
+        self.client.force_login(self.user)
+
+    def test_cursor_walks_every_conversation_once(self):
+        first, has_more = conversation_list(self.user)
+        self.assertTrue(has_more)
+        rest, has_more = conversation_list(self.user, first[-1].cursor)
+        self.assertFalse(has_more)
+        self.assertEqual(
+            sorted(c.id for c in first + rest), sorted(c.id for c in self.conversations),
+        )
+
+    def test_rejects_invalid_cursor(self):
+        for cursor in ('garbage', '2026-01-01T00:00:00|abc', '2026-13-45T00:00:00|1'):
+            with self.subTest(cursor=cursor):
+                response = self.client.get(reverse('chat:load_more_conversations'), {'cursor': cursor})
+                self.assertEqual(response.status_code, 400)
+
+
+class LongPollTests(ChatTestCase):
+    def setUp(self):
+        super().setUp()
+        self.last = self.send(self.bob, 'old')
+        self.client.force_login(self.alice)
+        self.async_client.force_login(self.alice)
+
+    async def wait(self, timeout):
+        response = await self.async_client.get(
+            reverse('chat:api_wait_new_messages', args=[self.conversation.id]),
+            {'last_message_id': self.last.id, 'timeout': timeout},
+        )
+        return [item['message_id'] for item in response.json()['messages']]
+
+    async def send_later(self, delay, publish):
+        await asyncio.sleep(delay)
+        message = await Message.objects.acreate(conversation=self.conversation, sender=self.bob, text='new')
+        if publish:
+            realtime.group_send(
+                realtime.conversation_group(self.conversation.id),
+                {'type': 'message.new', 'conversation_id': self.conversation.id},
+            )
+        return message
+
+    async def test_returns_immediately_when_newer_message_exists(self):
+        message = await Message.objects.acreate(conversation=self.conversation, sender=self.bob, text='new')
+        started = time.monotonic()
+        self.assertEqual(await self.wait(5), [message.id])
+        self.assertLess(time.monotonic() - started, 1)
+
+    async def test_wakes_on_in_process_publish(self):
+        with mock.patch('chat.views.LONG_POLL_VERSION_CHECK', 30):
+            started = time.monotonic()
+            sender = asyncio.ensure_future(self.send_later(0.2, publish=True))
+            received = await self.wait(5)
+            message = await sender
+        self.assertEqual(received, [message.id])
+        self.assertLess(time.monotonic() - started, 2)
+
+    async def test_sees_message_from_other_process_without_shared_cache(self):
+        # Không có publish trong process này: chỉ phiên bản đọc từ DB phát hiện được tin mới
+        with mock.patch('chat.views.LONG_POLL_VERSION_CHECK', 0.1):
+            sender = asyncio.ensure_future(self.send_later(0.2, publish=False))
+            received = await self.wait(5)
+            message = await sender
+        self.assertEqual(received, [message.id])
+
+    async def test_times_out_with_empty_list(self):
+        started = time.monotonic()
+        self.assertEqual(await self.wait(0.3), [])
+        self.assertGreaterEqual(time.monotonic() - started, 0.3)
+
+
+class ArchiveTests(ChatTestCase):
+    def setUp(self):
+        super().setUp()
+        self.messages = [self.send(self.alice if i % 2 else self.bob, f'm{i}') for i in range(7)]
+        self.conversation.last_message = self.messages[-1]
+        self.conversation.save()
+        # Mọi tin đều "cũ": chỉ last_message được giữ lại trong bảng Message
+        Message.objects.update(timestamp=timezone.now() - timedelta(days=400))
+        self.cutoff = timezone.now() - timedelta(days=180)
+
+    def archive(self, chunk_size=3):
+        return archive_conversation(self.conversation, self.cutoff, chunk_size)
+
+    def history(self, user):
+        ids, before_id = [], None
+        while True:
+            rows, has_more = _paginate_messages(self.conversation, user, before_id=before_id, limit=2)
+            ids = [row.id for row in rows] + ids
+            if not has_more:
+                return ids
+            before_id = rows[0].id
+
+    def test_round_trip_through_pagination(self):
+        Reaction.objects.create(user=self.alice, message=self.messages[0], reaction_type='LOVE')
+
+        self.assertEqual(self.archive(), 6)
+        self.assertEqual(MessageArchive.objects.filter(conversation=self.conversation).count(), 2)
+        self.assertEqual(list(Message.objects.values_list('id', flat=True)), [self.messages[-1].id])
+
+        self.assertEqual(self.history(self.alice), [m.id for m in self.messages])
+        rows, _ = _paginate_messages(self.conversation, self.alice, before_id=self.messages[1].id)
+        self.assertEqual([row.text for row in rows], ['m0'])
+        self.assertTrue(rows[0].is_archived)
+        self.assertEqual(rows[0].archived_reactions, {self.alice.id: 'LOVE'})
+
+    def test_last_message_is_never_archived(self):
+        self.archive(chunk_size=100)
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.archived_until_id, self.messages[-2].id)
+        self.assertTrue(Message.objects.filter(id=self.messages[-1].id).exists())
+        self.assertEqual(self.archive(), 0)
+
+    def test_hidden_and_cleared_messages_stay_hidden(self):
+        self.messages[2].hidden_by.add(self.alice)
+        clear_conversation(self.bob, self.conversation)
+        self.archive()
+
+        self.assertEqual(self.history(self.alice), [m.id for m in self.messages if m != self.messages[2]])
+        self.assertEqual(self.history(self.bob), [])
+        tail = self.send(self.alice, 'after clear')
+        self.assertEqual(self.history(self.bob), [tail.id])
+
+    def test_rerun_after_interruption(self):
+        create = MessageArchive.objects.create
+        calls = []
+
+        def fail_second_chunk(**kwargs):
+            calls.append(kwargs['first_message_id'])
+            if len(calls) == 2:
+                raise RuntimeError('boom')
+            return create(**kwargs)
+
+        with mock.patch.object(MessageArchive.objects, 'create', side_effect=fail_second_chunk):
+            with self.assertRaises(RuntimeError):
+                self.archive()
+        # Khối đầu đã commit, khối hỏng được hoàn tác nguyên vẹn
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.archived_until_id, self.messages[2].id)
+        self.assertEqual(Message.objects.count(), 4)
+
+        self.assertEqual(self.archive(), 3)
+        self.assertEqual(self.history(self.alice), [m.id for m in self.messages])
+
+    def test_removes_notifications_of_archived_messages(self):
+        reacted = Notification.objects.create(
+            recipient=self.bob, sender=self.alice, notification_type='MESSAGE_REACTION', target=self.messages[0],
+        )
+        kept = Notification.objects.create(
+            recipient=self.bob, sender=self.alice, notification_type='MESSAGE', target=self.messages[-1],
+            conversation=self.conversation,
+        )
+        self.archive()
+        self.assertFalse(Notification.objects.filter(id=reacted.id).exists())
+        self.assertTrue(Notification.objects.filter(id=kept.id).exists())
+
+    def test_edit_of_archived_message_is_not_resurrected(self):
+        self.client.force_login(self.bob)
+        message = self.messages[0]
+        # Lưu trữ xảy ra giữa lúc view đọc tin và lúc ghi
+        with mock.patch('chat.views.get_object_or_404', return_value=message):
+            self.archive()
+            response = self.client.post(
+                reverse('chat:edit_message_api', args=[message.id]), {'text': 'sửa'}, content_type='application/json',
+            )
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(Message.objects.filter(id=message.id).exists())
+
+
+class ChatSocketTests(ChatTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.alice)
+        self.session_cookie = f"{settings.SESSION_COOKIE_NAME}={self.client.cookies[settings.SESSION_COOKIE_NAME].value}"
+
+    async def connect(self, cookie=True, origin=b'http://testserver'):
+        headers = [(b'host', b'testserver')]
+        if origin:
+            headers.append((b'origin', origin))
+        if cookie:
+            headers.append((b'cookie', self.session_cookie.encode()))
+        incoming, outgoing = asyncio.Queue(), asyncio.Queue()
+        await incoming.put({'type': 'websocket.connect'})
+        task = asyncio.ensure_future(ws.chat_socket(
+            {'type': 'websocket', 'path': ws.WS_PATH, 'headers': headers}, incoming.get, outgoing.put,
+        ))
+        return incoming, outgoing, task
+
+    async def next_sent(self, outgoing):
+        return await asyncio.wait_for(outgoing.get(), 5)
+
+    async def command(self, incoming, outgoing, **command):
+        await incoming.put({'type': 'websocket.receive', 'text': json.dumps(command)})
+        return json.loads((await self.next_sent(outgoing))['text'])
+
+    async def disconnect(self, incoming, task):
+        await incoming.put({'type': 'websocket.disconnect'})
+        await asyncio.wait_for(task, 5)
+
+    async def test_rejects_anonymous_and_cross_site(self):
+        for options in ({'cookie': False}, {'origin': b'https://evil.example'}):
+            with self.subTest(**options):
+                _, outgoing, task = await self.connect(**options)
+                self.assertEqual(await self.next_sent(outgoing), {'type': 'websocket.close', 'code': ws.CLOSE_FORBIDDEN})
+                await asyncio.wait_for(task, 5)
+
+    async def test_subscribe_requires_participation(self):
+        incoming, outgoing, task = await self.connect()
+        self.assertEqual((await self.next_sent(outgoing))['type'], 'websocket.accept')
+        carol = await User.objects.acreate(username='carol')
+        dave = await User.objects.acreate(username='dave')
+        other, _ = await sync_to_async(get_or_create_private_conversation)(carol, dave)
+
+        reply = await self.command(incoming, outgoing, action='subscribe', conversation_id=self.conversation.id)
+        self.assertEqual(reply['type'], 'subscribed')
+        reply = await self.command(incoming, outgoing, action='subscribe', conversation_id=other.id)
+        self.assertEqual(reply['type'], 'error')
+        await self.disconnect(incoming, task)
+        self.assertEqual(realtime.connection_count(), 0)
+
+    async def test_subscription_limit_counts_only_conversations(self):
+        others = []
+        for name in ('carol', 'dave'):
+            user = await User.objects.acreate(username=name)
+            others.append((await sync_to_async(get_or_create_private_conversation)(self.alice, user))[0])
+        incoming, outgoing, task = await self.connect()
+        await self.next_sent(outgoing)
+
+        with mock.patch('chat.ws.MAX_SUBSCRIPTIONS', 2):
+            for conversation in (self.conversation, others[0]):
+                reply = await self.command(incoming, outgoing, action='subscribe', conversation_id=conversation.id)
+                self.assertEqual(reply['type'], 'subscribed')
+            reply = await self.command(incoming, outgoing, action='subscribe', conversation_id=others[1].id)
+            self.assertEqual(reply['type'], 'error')
+            # Theo dõi lại cuộc trò chuyện đã theo dõi vẫn được
+            reply = await self.command(incoming, outgoing, action='subscribe', conversation_id=self.conversation.id)
+            self.assertEqual(reply['type'], 'subscribed')
+        await self.disconnect(incoming, task)
+
+    async def test_slow_consumer_is_closed(self):
+        with mock.patch('chat.realtime.CHANNEL_QUEUE_SIZE', 2):
+            incoming, outgoing, task = await self.connect()
+            await self.next_sent(outgoing)
+            # Sự kiện dồn tới trước khi kết nối kịp gửi đi
+            for _ in range(3):
+                realtime.group_send(realtime.user_group(self.alice.id), {'type': 'conversation.updated'})
+            self.assertEqual(await self.next_sent(outgoing), {'type': 'websocket.close', 'code': ws.CLOSE_TOO_SLOW})
+        await self.disconnect(incoming, task)
+
+
+class MessageSearchTests(ChatTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.alice)
+
+    def find(self, query, user=None):
+        results, _ = search_messages(_visible_messages(self.conversation, user or self.alice), self.conversation, query)
+        return [message.id for message in results]
+
+    def search_api(self, query, cursor=None):
+        params = {'q': query}
+        if cursor:
+            params['cursor'] = cursor
+        return self.client.get(reverse('chat:search_messages_api', args=[self.conversation.id]), params).json()
+
+    def test_accent_folding(self):
+        message = self.send(self.bob, 'Đi ăn phở không?')
+        for query in ('pho', 'PHỞ', 'di an', 'đi'):
+            with self.subTest(query=query):
+                self.assertEqual(self.find(query), [message.id])
+
+    def test_prefix_match_on_last_term_only(self):
+        message = self.send(self.bob, 'Đi ăn phở không?')
+        self.assertEqual(self.find('kh'), [message.id])
+        self.assertEqual(self.find('an kh'), [message.id])
+        self.assertEqual(self.find('ph khong'), [])
+
+    def test_reindexes_on_edit(self):
+        message = self.send(self.bob, 'ăn phở')
+        message.text = 'bún chả'
+        message.save(update_fields=['text'])
+        self.assertEqual(self.find('pho'), [])
+        self.assertEqual(self.find('bun cha'), [message.id])
+
+    def test_excludes_hidden_and_cleared_messages(self):
+        old = self.send(self.bob, 'phở cũ')
+        hidden = self.send(self.bob, 'phở ẩn')
+        shown = self.send(self.bob, 'phở mới')
+        hidden.hidden_by.add(self.alice)
+        self.assertEqual(self.find('pho'), [shown.id, old.id])
+
+        clear_conversation(self.bob, self.conversation)
+        self.assertEqual(self.find('pho', user=self.bob), [])
+        self.assertEqual([item['message_id'] for item in self.search_api('pho')['results']], [shown.id, old.id])
+
+    def test_cursor_pages_without_overlap(self):
+        ids = [self.send(self.bob, f'phở {i}').id for i in range(SEARCH_PAGE_SIZE + 5)]
+        first = self.search_api('pho')
+        self.assertTrue(first['has_more'])
+        second = self.search_api('pho', cursor=first['next_cursor'])
+        self.assertFalse(second['has_more'])
+        found = [item['message_id'] for item in first['results'] + second['results']]
+        self.assertEqual(found, ids[::-1])
+
+    def test_reports_archived_messages(self):
+        self.assertFalse(self.search_api('pho')['has_archived'])
+        self.send(self.bob, 'phở cũ')
+        self.conversation.last_message = self.send(self.bob, 'phở mới')
+        self.conversation.save()
+        Message.objects.update(timestamp=timezone.now() - timedelta(days=400))
+        archive_conversation(self.conversation, timezone.now(), 10)
 
-# Create your tests here.
+        data = self.search_api('pho')
+        self.assertEqual(len(data['results']), 1)
+        self.assertTrue(data['has_archived'])
@@ -8,6 +8,7 @@ app_name = 'chat'
 urlpatterns = [
     # Danh sách các cuộc hội thoại
     path('', views.conversation_list_view, name='conversation_list'),
+    path('more/', views.load_more_conversations, name='load_more_conversations'),
     path('new-group/', views.create_group_view, name='create_group'),
 
     path('<int:conversation_id>/manage/', views.manage_group_view, name='manage_group'),
@@ -21,6 +22,7 @@ urlpatterns = [
 
     # Chi tiết một cuộc hội thoại (phòng chat)
     path('<int:conversation_id>/', views.conversation_detail_view, name='conversation_detail'),
+    path('<int:conversation_id>/older/', views.load_older_messages, name='load_older_messages'),
     
     # API nội bộ để gửi tin nhắn (sử dụng với JavaScript)
     path('api/message/send/<int:conversation_id>/', views.send_message_api, name='send_message_api'),
@@ -36,8 +38,11 @@ urlpatterns = [
     path('api/search-users/', views.api_search_users, name='api_search_users'),
     path('api/message/react/<int:message_id>/', views.react_to_message_api, name='react_to_message_api'),
     path('api/conversation/<int:conversation_id>/messages/', views.api_get_messages, name='api_get_messages'),
+    path('api/conversation/<int:conversation_id>/search/', views.search_messages_api, name='search_messages_api'),
     path('api/start-conversation/', views.api_start_conversation, name='api_start_conversation'),
     path('api/get-new-messages/<int:conversation_id>/', views.api_get_new_messages, name='api_get_new_messages'),
+    path('api/wait-new-messages/<int:conversation_id>/', views.api_wait_new_messages, name='api_wait_new_messages'),
+    path('api/conversation/<int:conversation_id>/read/', views.api_mark_conversation_read, name='api_mark_conversation_read'),
     path('<int:conversation_id>/delete/', views.delete_conversation_view, name='delete_conversation'),
     path('api/message/<int:message_id>/reactions/', views.get_message_reactions, name='message_reactions'),
 ]
\ No newline at end of file
@@ -0,0 +1,195 @@
+# chat/utils.py
+
+from django.db import IntegrityError, transaction
+from django.db.models import (
+    Case, Count, Exists, F, Max, OuterRef, PositiveBigIntegerField, Q, Subquery, Value, When,
+)
+from django.db.models.functions import Coalesce, Greatest
+from django.contrib.auth import get_user_model
+from django.utils.dateparse import parse_datetime
+from notifications import events
+from django.utils import timezone
+from . import realtime
+from .models import Conversation, ConversationState, Message
+
+User = get_user_model()
+
+CONVERSATION_PAGE_SIZE = 20  # Số cuộc trò chuyện mỗi trang danh sách
+OTHER_USER_FIELDS = ('id', 'username', 'first_name', 'last_name', 'avatar')
+
+
+def get_or_create_private_conversation(user, other_user):
+    """
+    Cuộc trò chuyện 1-1 giữa hai người, tạo nếu chưa có. Trả về (conversation, created).
+    Tra theo khóa (user_low, user_high); hai request chạy song song thì unique index chỉ cho
+    một bên tạo, bên kia bắt IntegrityError và đọc lại dòng vừa được tạo.
+    """
+    low, high = sorted([user.id, other_user.id])
+    conversation = Conversation.objects.filter(user_low_id=low, user_high_id=high).first()
+    if conversation:
+        return conversation, False
+    try:
+        with transaction.atomic():
+            conversation = Conversation.objects.create(type='PRIVATE', user_low_id=low, user_high_id=high)
+            conversation.participants.add(low, high)
+        return conversation, True
+    except IntegrityError:
+        return Conversation.objects.get(user_low_id=low, user_high_id=high), False
+
+
+def record_new_message(conversation, message):
+    """
+    Một tin nhắn mới: cập nhật last_activity_at cho cả cuộc trò chuyện và dời mốc đã đọc
+    của người gửi tới chính tin đó, trong một câu UPDATE. Số chưa đọc của người khác
+    tự tăng vì được tính từ mốc (xem _unread_messages), không cần ghi gì thêm.
+    """
+    sender_id = message.sender_id
+    ConversationState.objects.filter(conversation=conversation).update(
+        last_read_message_id=Case(
+            When(user_id=sender_id, then=Value(message.id)),
+            default=F('last_read_message_id'),
+            output_field=PositiveBigIntegerField(),
+        ),
+        last_activity_at=message.timestamp,
+    )
+
+    # Báo cho luồng SSE của người nhận để badge tin nhắn cập nhật ngay,
+    # và cho socket của mọi thành viên để danh sách cuộc trò chuyện đổi thứ tự
+    participant_ids = list(conversation.participants.values_list('id', flat=True))
+    receiver_ids = [user_id for user_id in participant_ids if user_id != sender_id]
+    transaction.on_commit(lambda: [events.publish(user_id) for user_id in receiver_ids])
+    realtime.publish_to_users(participant_ids, 'conversation.updated', conversation_id=conversation.id)
+
+
+def mark_conversation_read(user, conversation, message_id=None):
+    """
+    Người dùng đã xem tới tin `message_id` (mặc định: tin mới nhất): dời mốc
+    last_read_message_id bằng một câu UPDATE. Mốc chỉ tiến lên, và không ghi gì nếu
+    đã đọc tới đó. Các thành viên khác nhận sự kiện `conversation.read` để cập nhật "Đã xem".
+    """
+    if message_id is None:
+        message_id = conversation.messages.aggregate(last_id=Max('id'))['last_id']
+        if message_id is None:
+            return
+    updated = ConversationState.objects.filter(
+        conversation=conversation, user=user, last_read_message_id__lt=message_id,
+    ).update(last_read_message_id=message_id)
+    if updated:
+        transaction.on_commit(lambda: events.publish(user.id))
+        realtime.publish_to_conversation(
+            conversation.id, 'conversation.read',
+            user_id=user.id, last_read_message_id=message_id,
+            user_name=user.get_full_name() or user.username,
+        )
+
+
+def clear_conversation(user, conversation):
+    """
+    "Xóa cuộc trò chuyện phía tôi": dời mốc cleared_before_id (và mốc đã đọc) tới tin
+    mới nhất hiện có. Một câu UPDATE, không phụ thuộc số tin nhắn; tin cũ vẫn còn cho
+    các thành viên khác.
+    """
+    last_id = conversation.messages.aggregate(last_id=Max('id'))['last_id'] or 0
+    ConversationState.objects.filter(conversation=conversation, user=user).update(
+        cleared_before_id=last_id, last_read_message_id=Greatest(
+            'last_read_message_id', Value(last_id), output_field=PositiveBigIntegerField(),
+        ),
+    )
+    transaction.on_commit(lambda: events.publish(user.id))
+
+
+def get_cleared_before_id(user, conversation):
+    return ConversationState.objects.filter(
+        conversation=conversation, user=user,
+    ).values_list('cleared_before_id', flat=True).first() or 0
+
+
+def _unread_messages(user_id):
+    # Tin của người khác (kể cả tin hệ thống) nằm sau mốc đã đọc; dò theo index (conversation_id, id)
+    return Message.objects.filter(
+        conversation=OuterRef('conversation_id'), id__gt=OuterRef('last_read_message_id'),
+    ).exclude(sender_id=user_id)
+
+
+def conversation_list(user, cursor=None, limit=CONVERSATION_PAGE_SIZE):
+    """
+    Một trang danh sách cuộc trò chuyện của user (hoạt động gần nhất trước) trong một truy vấn,
+    dùng chung cho trang danh sách, sidebar trang chat và api_get_conversations.
+
+    Đi từ ConversationState của user (quyền thành viên, mốc xóa, mốc đã đọc), join tin cuối
+    và người gửi; người còn lại của cuộc 1-1 và số tin chưa đọc lấy bằng subquery.
+    Mỗi conversation trả về có thêm `other_user` (None với nhóm) và `unread_count`.
+    Phân trang keyset theo (updated_at, id); trả về (conversations, has_more).
+    Ném ValueError nếu con trỏ không hợp lệ.
+    """
+    states = ConversationState.objects.filter(user=user).filter(
+        # Cuộc đã "xóa phía tôi" ẩn đi tới khi có tin mới vượt mốc
+        Q(cleared_before_id=0) | Q(cleared_before_id__lt=Coalesce(F('conversation__last_message_id'), 0))
+    )
+    if cursor:
+        updated_at_raw, _, id_raw = cursor.rpartition('|')
+        updated_at = parse_datetime(updated_at_raw)
+        if updated_at is None:
+            raise ValueError('Invalid cursor')
+        last_id = int(id_raw)
+        states = states.filter(
+            Q(conversation__updated_at__lt=updated_at)
+            | Q(conversation__updated_at=updated_at, conversation_id__lt=last_id)
+        )
+
+    Participant = Conversation.participants.through
+    others = (
+        Participant.objects.filter(conversation_id=OuterRef('conversation_id'))
+        .exclude(user_id=user.id).order_by('user_id')
+    )
+    unread = _unread_messages(user.id).order_by().values('conversation').annotate(total=Count('id')).values('total')
+    states = states.select_related('conversation__last_message__sender').annotate(
+        unread=Coalesce(Subquery(unread), 0),
+        **{f'other_{field}': Subquery(others.values(f'user__{field}')[:1]) for field in OTHER_USER_FIELDS},
+    ).order_by('-conversation__updated_at', '-conversation_id')
+
+    rows = list(states[:limit + 1])
+    conversations = []
+    for state in rows[:limit]:
+        conversation = state.conversation
+        conversation.unread_count = state.unread
+        conversation.other_user = None
+        if conversation.type == 'PRIVATE' and state.other_id is not None:
+            conversation.other_user = User(**{field: getattr(state, f'other_{field}') for field in OTHER_USER_FIELDS})
+        conversations.append(conversation)
+    return conversations, len(rows) > limit
+
+
+def get_unread_conversation_count(user_id):
+    """Số cuộc trò chuyện còn tin chưa đọc (badge "Tin nhắn")."""
+    return ConversationState.objects.filter(user_id=user_id).filter(Exists(_unread_messages(user_id))).count()
+
+
+def get_read_receipts(conversation, exclude_user):
+    """Mốc đã đọc của các thành viên khác, để hiện "Đã xem" mà không cần dòng cho từng tin."""
+    return list(
+        ConversationState.objects.filter(conversation=conversation, last_read_message_id__gt=0)
+        .exclude(user=exclude_user).select_related('user')
+    )
+
+
+def serialize_message(msg):
+    """Dữ liệu một tin nhắn cho client (API lấy tin mới và sự kiện WebSocket `message.sent`)."""
+    local_ts = timezone.localtime(msg.timestamp)
+    file_url = msg.file.url if msg.file else None
+    file_type = None
+    if msg.file:
+        if msg.is_image: file_type = 'image'
+        elif msg.is_video: file_type = 'video'
+        else: file_type = 'file'
+
+    return {
+        'message_id': msg.id,
+        'sender_id': msg.sender.id if msg.sender else None,
+        'sender_avatar': msg.sender.avatar.url if msg.sender and msg.sender.avatar else '/static/images/default.jpg',
+        'sender_username': msg.sender.username if msg.sender else 'System',
+        'text': msg.text,
+        'timestamp': local_ts.strftime('%H:%M, %d-%m-%Y'),
+        'file_url': file_url,
+        'file_type': file_type,
+    }
@@ -1,4 +1,5 @@
 from django.utils import timezone
+from django.db import DatabaseError, IntegrityError, transaction
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse, HttpResponseForbidden
@@ -7,16 +8,32 @@ from django.contrib.auth import get_user_model
 from django.db.models import OuterRef, Subquery, F
 from django.contrib.contenttypes.models import ContentType
 from notifications.models import Notification
+from notifications.utils import dispatch_notifications, notify_reaction, withdraw_reaction
+from . import realtime
+from .utils import (
+    clear_conversation, conversation_list, get_cleared_before_id, get_or_create_private_conversation,
+    get_read_receipts, get_unread_conversation_count, mark_conversation_read, record_new_message,
+    serialize_message,
+)
 from .models import Conversation, Message, GroupMembershipRequest
+from .archive import archived_messages
+from .search import search_messages
 from .forms import MessageForm, GroupCreationForm, GroupUpdateForm, AddMembersForm, AdminSettingsForm
+import asyncio
 import json
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from posts.models import Reaction
+from posts.uploads import UploadError, claim_uploads
 from django.urls import reverse
+from django.template.loader import render_to_string
 from django.views.decorators.http import require_POST
 from django.contrib import messages
 
 User = get_user_model()
 
+LONG_POLL_VERSION_CHECK = 2  # giây
+
 # ============================================================================
 # 1. CÁC VIEW QUẢN LÝ NHÓM (LOGIC BACKEND)
 # ============================================================================
@@ -81,15 +98,16 @@ def manage_group_view(request, conversation_id):
                 
                 # TH 1: Cần duyệt (User thường + Chế độ admin on)
                 if conversation.admin_only_management and not is_admin:
-                    conv_content_type = ContentType.objects.get_for_model(Conversation)
-                    for member in new_members:
-                        # Kiểm tra xem đã có request chưa để tránh duplicate
-                        if not GroupMembershipRequest.objects.filter(conversation=conversation, user_to_add=member).exists():
-                            GroupMembershipRequest.objects.create(conversation=conversation, invited_by=request.user, user_to_add=member)
-                            Notification.objects.create(
-                                recipient=conversation.admin, sender=request.user, notification_type='GROUP_INVITE_REQUEST',
-                                target_content_type=conv_content_type, target_object_id=conversation.id
-                            )
+                    # Bỏ qua người đã có yêu cầu chờ duyệt để tránh duplicate
+                    pending_ids = set(conversation.membership_requests.values_list('user_to_add_id', flat=True))
+                    new_requests = [
+                        GroupMembershipRequest(conversation=conversation, invited_by=request.user, user_to_add=member)
+                        for member in new_members if member.id not in pending_ids
+                    ]
+                    GroupMembershipRequest.objects.bulk_create(new_requests)
+                    if new_requests:
+                        # Admin nhận một thông báo cho cả lượt đề xuất
+                        dispatch_notifications([conversation.admin], request.user, 'GROUP_INVITE_REQUEST', conversation)
                     messages.info(request, f"Đã gửi yêu cầu thêm {new_members.count()} thành viên. Chờ Admin phê duyệt.")
                 
                 # TH 2: Thêm trực tiếp
@@ -98,12 +116,7 @@ def manage_group_view(request, conversation_id):
                     names = ", ".join([u.get_full_name() or u.username for u in new_members])
                     Message.objects.create(conversation=conversation, sender=None, text=f"{request.user.get_full_name()} đã thêm {names} vào nhóm.")
                     
-                    conv_content_type = ContentType.objects.get_for_model(Conversation)
-                    for member in new_members:
-                        Notification.objects.create(
-                            recipient=member, sender=request.user, notification_type='ADDED_TO_GROUP',
-                            target_content_type=conv_content_type, target_object_id=conversation.id
-                        )
+                    dispatch_notifications(new_members, request.user, 'ADDED_TO_GROUP', conversation)
                     messages.success(request, 'Đã thêm thành viên mới.')
 
     # Redirect về trang chat chi tiết để thấy thay đổi ngay lập tức
@@ -122,10 +135,7 @@ def handle_membership_request(request, request_id, action):
     if action == 'approve':
         conversation.participants.add(req.user_to_add)
         Message.objects.create(conversation=conversation, sender=None, text=f"Admin đã duyệt yêu cầu thêm {req.user_to_add.get_full_name()} vào nhóm.")
-        Notification.objects.create(
-            recipient=req.user_to_add, sender=request.user, notification_type='ADDED_TO_GROUP',
-            target_content_type=ContentType.objects.get_for_model(Conversation), target_object_id=conversation.id
-        )
+        dispatch_notifications([req.user_to_add], request.user, 'ADDED_TO_GROUP', conversation)
         req.delete()
         messages.success(request, f"Đã thêm {req.user_to_add.username} vào nhóm.")
     elif action == 'reject':
@@ -180,12 +190,7 @@ def create_group_view(request):
             
             Message.objects.create(conversation=group, sender=None, text=f"{request.user.get_full_name()} đã tạo nhóm '{group.name}'." )
             
-            conv_content_type = ContentType.objects.get_for_model(Conversation)
-            for member in participants:
-                 Notification.objects.create(
-                    recipient=member, sender=request.user, notification_type='ADDED_TO_GROUP',
-                    target_content_type=conv_content_type, target_object_id=group.id
-                )
+            dispatch_notifications(participants, request.user, 'ADDED_TO_GROUP', group)
             messages.success(request, "Tạo nhóm thành công!")
             return redirect('chat:conversation_detail', conversation_id=group.id)
         else:
@@ -228,13 +233,32 @@ def remove_member(request, conversation_id, user_id):
 # ------------------- VIEW TRANG DANH SÁCH -------------------
 @login_required
 def conversation_list_view(request):
-    conversations = request.user.conversations.exclude(hidden_by=request.user).order_by('-updated_at')
+    conversations, has_more = conversation_list(request.user)
     group_creation_form = GroupCreationForm(user=request.user)
     return render(request, 'chat/conversation_list.html', {
         'conversations': conversations,
+        'has_more_conversations': has_more,
+        'conversations_cursor': conversations[-1].cursor if conversations else None,
         'group_creation_form': group_creation_form
     })
 
+@login_required
+def load_more_conversations(request):
+    # Trang tiếp theo của danh sách cuộc trò chuyện (trang danh sách và sidebar trang chat)
+    try:
+        conversations, has_more = conversation_list(request.user, request.GET.get('cursor'))
+        active_conversation_id = int(request.GET.get('active') or 0)
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Con trỏ không hợp lệ'}, status=400)
+    if not conversations:
+        return JsonResponse({'html': '', 'has_more': False, 'next_cursor': None})
+
+    html = render_to_string('chat/_conversation_list.html', {
+        'conversations': conversations,
+        'active_conversation_id': active_conversation_id,
+    }, request=request)
+    return JsonResponse({'html': html, 'has_more': has_more, 'next_cursor': conversations[-1].cursor})
+
 
 # ------------------- BẮT ĐẦU CONVERSATION -------------------
 @login_required
@@ -244,24 +268,92 @@ def start_conversation_view(request, user_id):
     if other_user == request.user:
         return redirect('chat:conversation_list')
 
-    conversation = Conversation.objects.filter(
-        type='PRIVATE', participants=request.user
-    ).filter(
-        participants=other_user
-    ).first()
+    conversation, _ = get_or_create_private_conversation(request.user, other_user)
+    return redirect('chat:conversation_detail', conversation_id=conversation.id)
 
-    if not conversation:
-        conversation = Conversation.objects.create(type='PRIVATE')
-        conversation.participants.add(request.user, other_user)
+MESSAGE_PAGE_SIZE = 30  # Số tin nhắn mỗi trang lịch sử
 
-    return redirect('chat:conversation_detail', conversation_id=conversation.id)
+def _visible_messages(conversation, user, cleared_before_id=None):
+    # Bỏ các tin trước mốc "xóa cuộc trò chuyện" và các tin ẩn lẻ từng cái
+    if cleared_before_id is None:
+        cleared_before_id = get_cleared_before_id(user, conversation)
+    return conversation.messages.filter(id__gt=cleared_before_id).exclude(hidden_by=user)
+
+def _paginate_messages(conversation, user, before_id=None, limit=MESSAGE_PAGE_SIZE, cleared_before_id=None):
+    """
+    Phân trang keyset theo id tin nhắn, mới nhất trước: trang đầu là `limit` tin cuối cùng,
+    trang sau lấy các tin có id < before_id. Lấy dư 1 dòng để biết còn tin cũ hơn không.
+    Hết tin trong bảng Message thì đọc tiếp từ kho lưu trữ (chat/archive.py), nên client
+    không cần biết tin nằm ở đâu. Trả về (danh sách theo thứ tự cũ -> mới để hiển thị, has_more).
+    """
+    if cleared_before_id is None:
+        cleared_before_id = get_cleared_before_id(user, conversation)
+    queryset = _visible_messages(conversation, user, cleared_before_id)
+    if before_id is not None:
+        queryset = queryset.filter(id__lt=before_id)
+    rows = list(
+        queryset.select_related('sender').order_by('-id')[:limit + 1]
+    )
+    # Tin lưu trữ luôn cũ hơn tin trong bảng chính: chỉ đọc khi trang còn thiếu
+    if len(rows) <= limit and conversation.archived_until_id > cleared_before_id:
+        rows += archived_messages(
+            conversation, user, before_id=rows[-1].id if rows else before_id,
+            min_id=cleared_before_id, limit=limit + 1 - len(rows),
+        )
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    rows.reverse()
+    return rows, has_more
+
+def _attach_reaction_stats(messages, user):
+    """Gắn thống kê reaction cho một trang tin nhắn; trả về {message_id: reaction của user}."""
+    # Tin lưu trữ đã có sẵn thống kê từ khối nén (chat/archive.py), chỉ truy vấn tin trong bảng chính
+    archived = [msg for msg in messages if msg.is_archived]
+    messages = [msg for msg in messages if not msg.is_archived]
+    message_ids = [msg.id for msg in messages]
+    # Thống kê reaction của cả trang bằng một truy vấn GROUP BY thay vì mỗi tin nhắn một truy vấn
+    stats_by_message = {}
+    reaction_stats = Reaction.objects.filter(message_id__in=message_ids).values('message_id', 'reaction_type').annotate(count=Count('id'))
+    for item in reaction_stats:
+        stats_by_message.setdefault(item['message_id'], []).append(item)
+    for message in messages:
+        message.reaction_stats = stats_by_message.get(message.id, [])
+        message.reaction_total = sum(item['count'] for item in message.reaction_stats)
+
+    user_reactions = Reaction.objects.filter(
+        user=user,
+        message_id__in=message_ids
+    ).values('message_id', 'reaction_type')
+    user_reactions_map = {item['message_id']: item['reaction_type'] for item in user_reactions}
+    for message in archived:
+        if user.id in message.archived_reactions:
+            user_reactions_map[message.id] = message.archived_reactions[user.id]
+    return user_reactions_map
+
+def _messages_around(conversation, user, message_id, limit=MESSAGE_PAGE_SIZE, cleared_before_id=None):
+    """
+    Một trang tin nhắn quanh `message_id` (để nhảy tới kết quả tìm kiếm): nửa trang tính tới
+    tin đó và nửa trang sau nó. Trả về (tin nhắn theo thứ tự cũ -> mới, has_older, has_newer).
+    """
+    older, has_older = _paginate_messages(
+        conversation, user, message_id + 1, limit=limit - limit // 2, cleared_before_id=cleared_before_id,
+    )
+    queryset = _visible_messages(conversation, user, cleared_before_id)
+    newer = list(queryset.filter(id__gt=message_id).select_related('sender').order_by('id')[:limit // 2 + 1])
+    has_newer = len(newer) > limit // 2
+    return older + newer[:limit // 2], has_older, has_newer
+
+def _parse_message_cursor(request):
+    """Con trỏ `cursor` = id tin nhắn cũ nhất đang hiển thị; ném ValueError nếu không hợp lệ."""
+    cursor = request.GET.get('cursor')
+    return int(cursor) if cursor else None
 
 # ------------------- CHI TIẾT CONVERSATION -------------------
 @login_required
 def conversation_detail_view(request, conversation_id):
     conversation = get_object_or_404(Conversation, id=conversation_id, participants=request.user)
-    # Lấy danh sách tất cả cuộc hội thoại của user để hiển thị bên sidebar trái
-    conversations = Conversation.objects.filter(participants=request.user).order_by('-last_message__timestamp')
+    # Trang đầu danh sách cuộc hội thoại cho sidebar trái (trang sau tải thêm qua load_more_conversations)
+    conversations, has_more_conversations = conversation_list(request.user)
     other_participant = None
     if conversation.type == 'PRIVATE':
         other_participant = conversation.participants.exclude(id=request.user.id).first()
@@ -276,30 +368,53 @@ def conversation_detail_view(request, conversation_id):
             conversation.last_message = message
             conversation.updated_at = timezone.now()
             conversation.save()
+            record_new_message(conversation, message)
+            realtime.publish_to_conversation(conversation.id, 'message.sent', message=serialize_message(message))
             return redirect('chat:conversation_detail', conversation_id=conversation.id)
 
     # --- Logic chuẩn bị dữ liệu cho GET request ---
-    messages = conversation.messages.exclude(hidden_by=request.user).order_by('timestamp')
+    # Chỉ render trang tin nhắn mới nhất; tin cũ hơn tải thêm qua load_older_messages.
+    # `?around=<id>` (từ kết quả tìm kiếm) render trang quanh tin đó thay vì trang mới nhất.
+    cleared_before_id = get_cleared_before_id(request.user, conversation)
+    visible_messages = _visible_messages(conversation, request.user, cleared_before_id)
+    highlight_message_id = None
+    has_newer_messages = False
+    around = request.GET.get('around', '')
+    if around.isdigit() and visible_messages.filter(id=int(around)).exists():
+        highlight_message_id = int(around)
+        messages, has_more_messages, has_newer_messages = _messages_around(
+            conversation, request.user, highlight_message_id, cleared_before_id=cleared_before_id,
+        )
+    else:
+        messages, has_more_messages = _paginate_messages(
+            conversation, request.user, cleared_before_id=cleared_before_id,
+        )
+    if messages and not has_newer_messages:
+        mark_conversation_read(request.user, conversation, messages[-1].id)
+    user_reactions_map = _attach_reaction_stats(messages, request.user)
     form = MessageForm()
 
-    for message in messages:
-        message.reaction_stats = message.reactions.values('reaction_type').annotate(count=Count('id'))
-
-    message_ids = [msg.id for msg in messages]
-    message_content_type = ContentType.objects.get_for_model(Message)
-    user_reactions = Reaction.objects.filter(
-        user=request.user,
-        content_type=message_content_type,
-        object_id__in=message_ids
-    ).values('object_id', 'reaction_type')
-    user_reactions_map = {item['object_id']: item['reaction_type'] for item in user_reactions}
-
     participants = conversation.participants.all().order_by('first_name')
 
     context = {
         'conversation': conversation,
         'conversations': conversations,
+        'has_more_conversations': has_more_conversations,
+        'conversations_cursor': conversations[-1].cursor if conversations else None,
         'chat_messages': messages,
+        'has_more_messages': has_more_messages,
+        'older_cursor': messages[0].id if messages else None,
+        'has_newer_messages': has_newer_messages,
+        'highlight_message_id': highlight_message_id,
+        # "Đã xem" suy ra từ mốc đã đọc của các thành viên khác (JS tự cập nhật qua WebSocket)
+        'read_receipts': [
+            {
+                'user_id': state.user_id,
+                'name': state.user.get_full_name() or state.user.username,
+                'last_read_message_id': state.last_read_message_id,
+            }
+            for state in get_read_receipts(conversation, request.user)
+        ],
         'form': form,
         'other_participant': other_participant,
         'user_reactions_map': user_reactions_map,
@@ -317,6 +432,52 @@ def conversation_detail_view(request, conversation_id):
 
     return render(request, 'chat/conversation_detail.html', context)
 
+@login_required
+def load_older_messages(request, conversation_id):
+    conversation = get_object_or_404(Conversation, id=conversation_id, participants=request.user)
+    try:
+        messages, has_more = _paginate_messages(conversation, request.user, _parse_message_cursor(request))
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Con trỏ không hợp lệ'}, status=400)
+
+    if not messages:
+        return JsonResponse({'html': '', 'has_more': False, 'next_cursor': None})
+
+    # Render cả trang bằng một lần gọi template, cùng markup với trang chi tiết
+    user_reactions_map = _attach_reaction_stats(messages, request.user)
+    html = render_to_string('chat/_message_list.html', {
+        'chat_messages': messages,
+        'conversation': conversation,
+        'user_reactions_map': user_reactions_map,
+    }, request=request)
+    return JsonResponse({'html': html, 'has_more': has_more, 'next_cursor': messages[0].id})
+
+@login_required
+def search_messages_api(request, conversation_id):
+    # Tìm tin nhắn trong cuộc trò chuyện qua chỉ mục ngược; chỉ trong các tin người tìm còn thấy
+    conversation = get_object_or_404(Conversation, id=conversation_id, participants=request.user)
+    try:
+        results, has_more = search_messages(
+            _visible_messages(conversation, request.user), conversation,
+            request.GET.get('q', ''), _parse_message_cursor(request),
+        )
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Con trỏ không hợp lệ'}, status=400)
+
+    detail_url = reverse('chat:conversation_detail', kwargs={'conversation_id': conversation.id})
+    data = []
+    for msg in results:
+        item = serialize_message(msg)
+        item['context_url'] = f"{detail_url}?around={msg.id}#msg-row-{msg.id}"
+        data.append(item)
+    return JsonResponse({
+        'results': data,
+        'has_more': has_more,
+        'next_cursor': results[-1].id if results else None,
+        # Tin đã lưu trữ (chat/archive.py) không có chỉ mục: báo để giao diện ghi chú khi hết kết quả
+        'has_archived': conversation.archived_until_id > get_cleared_before_id(request.user, conversation),
+    })
+
 # ------------------- API GỬI TIN NHẮN (AJAX) -------------------
 @login_required
 def send_message_api(request, conversation_id):
@@ -327,28 +488,29 @@ def send_message_api(request, conversation_id):
             message = form.save(commit=False)
             message.conversation = conversation
             message.sender = request.user
-            if not message.text and not message.file:
+            # File lớn được tải trước theo mảnh (posts/uploads.py) rồi gắn vào tin bằng upload_id
+            upload_id = request.POST.get('upload_id')
+            if not message.text and not message.file and not upload_id:
                  return JsonResponse({'status': 'error', 'message': 'Tin nhắn rỗng'}, status=400)
-            message.save()
-
-            conversation.hidden_by.clear()
+            if upload_id:
+                try:
+                    with transaction.atomic():
+                        upload, = claim_uploads(request.user, [upload_id])
+                        message.file = upload.file.name
+                        message.save()
+                except UploadError as e:
+                    return JsonResponse({'status': 'error', 'message': e.message}, status=e.status)
+            else:
+                message.save()
 
-            # Cập nhật last_message
+            # Cập nhật last_message (cuộc trò chuyện đã bị xóa phía ai đó sẽ hiện lại)
             conversation.last_message = message
             conversation.updated_at = timezone.now()
             conversation.save()
 
-            # === Notification ===
-            receivers = conversation.participants.exclude(id=request.user.id)
-            ct = ContentType.objects.get_for_model(message)
-            for receiver in receivers:
-                Notification.objects.create(
-                    recipient=receiver,
-                    sender=request.user,
-                    notification_type='MESSAGE',
-                    target_content_type=ct,
-                    target_object_id=message.id
-                )
+            # Tin nhắn không tạo Notification: số chưa đọc suy ra từ mốc đã đọc của từng người
+            record_new_message(conversation, message)
+            realtime.publish_to_conversation(conversation.id, 'message.sent', message=serialize_message(message))
 
             local_ts = timezone.localtime(message.timestamp)
             formatted_ts = local_ts.strftime('%H:%M, %d-%m-%Y')
@@ -392,14 +554,21 @@ def delete_message_api(request, message_id):
         if delete_type == 'everyone':
             # CHỈ NGƯỜI GỬI mới được thu hồi
             if message.sender == request.user:
+                conversation_id = message.conversation_id
                 message.delete()
+                realtime.publish_to_conversation(conversation_id, 'message.recalled', message_id=message_id)
                 return JsonResponse({'status': 'ok', 'message_id': message_id, 'type': 'everyone'})
             else:
                 return JsonResponse({'status': 'error', 'message': 'Bạn không thể thu hồi tin nhắn của người khác.'}, status=403)
         
         elif delete_type == 'me':
             # AI CŨNG ĐƯỢC QUYỀN XÓA PHÍA MÌNH (Kể cả không phải người gửi)
-            message.hidden_by.add(request.user)
+            try:
+                with transaction.atomic():
+                    message.hidden_by.add(request.user)
+            except IntegrityError:
+                # Tin vừa bị lưu trữ / thu hồi giữa lúc đọc và ghi
+                return JsonResponse({'status': 'error', 'message': 'Tin nhắn không còn tồn tại'}, status=404)
             return JsonResponse({'status': 'ok', 'message_id': message_id, 'type': 'me'})
 
     return JsonResponse({'status': 'error', 'message': 'Invalid request'}, status=400)
@@ -419,7 +588,15 @@ def edit_message_api(request, message_id):
             new_text = data.get('text', '')
             if new_text:
                 message.text = new_text
-                message.save()
+                try:
+                    with transaction.atomic():
+                        # update_fields: tin vừa bị lưu trữ (chat/archive.py) thì báo lỗi thay vì INSERT lại
+                        message.save(update_fields=['text'])
+                except DatabaseError:
+                    return JsonResponse({'status': 'error', 'message': 'Tin nhắn không còn tồn tại'}, status=404)
+                realtime.publish_to_conversation(
+                    message.conversation_id, 'message.edited', message_id=message.id, text=new_text,
+                )
 
                 return JsonResponse({
                     'status': 'ok',
@@ -438,7 +615,10 @@ def edit_message_api(request, message_id):
 @login_required
 def api_get_conversations(request):
     try:
-        conversations = request.user.conversations.exclude(hidden_by=request.user).order_by('-updated_at')[:15]
+        try:
+            conversations, has_more = conversation_list(request.user, request.GET.get('cursor'))
+        except ValueError:
+            return JsonResponse({'status': 'error', 'message': 'Con trỏ không hợp lệ'}, status=400)
         data = []
         for conv in conversations:
             conv_name = ''
@@ -453,7 +633,7 @@ def api_get_conversations(request):
                     else:
                         conv_avatar_url = '/static/images/group_default.png' # Ảnh mặc định nếu thiếu
                 else:
-                    other_participant = conv.participants.exclude(id=request.user.id).first()
+                    other_participant = conv.other_user
                     if not other_participant: 
                         continue
                     
@@ -477,7 +657,7 @@ def api_get_conversations(request):
             last_message_text = ''
             if conv.last_message:
                 sender_prefix = ""
-                if conv.last_message.sender == request.user: 
+                if conv.last_message.sender_id == request.user.id: 
                     sender_prefix = "Bạn: "
                 elif conv.type == 'GROUP' and conv.last_message.sender: 
                     sender_prefix = f"{conv.last_message.sender.first_name}: "
@@ -501,10 +681,16 @@ def api_get_conversations(request):
                 'avatar_url': conv_avatar_url,
                 'last_message': last_message_text,
                 'last_message_timestamp': last_message_ts,
+                'unread_count': conv.unread_count,
                 'detail_url': reverse('chat:conversation_detail', kwargs={'conversation_id': conv.id})
             })
 
-        return JsonResponse({'conversations': data})
+        return JsonResponse({
+            'conversations': data,
+            'has_more': has_more,
+            'next_cursor': conversations[-1].cursor if conversations else None,
+            'unread_conversations': get_unread_conversation_count(request.user.id),
+        })
         
     except Exception as e:
         print(f"Lỗi API Conversations: {e}") # In lỗi ra terminal để debug
@@ -565,16 +751,15 @@ def react_to_message_api(request, message_id):
     except json.JSONDecodeError:
         return JsonResponse({'status': 'error', 'message': 'Invalid JSON'}, status=400)
 
-    content_type = ContentType.objects.get_for_model(Message)
-    existing_reaction = Reaction.objects.filter(
-        user=request.user, content_type=content_type, object_id=message.id
-    ).first()
+    existing_reaction = Reaction.objects.filter(user=request.user, message=message).first()
 
     current_user_reaction = None
     if existing_reaction:
         if existing_reaction.reaction_type == reaction_type:
             existing_reaction.delete() # Bỏ react
             current_user_reaction = None
+            if message.sender:
+                withdraw_reaction(message.sender, request.user, 'MESSAGE_REACTION', message)
         else:
             existing_reaction.reaction_type = reaction_type
             existing_reaction.save() # Thay đổi reaction
@@ -582,21 +767,21 @@ def react_to_message_api(request, message_id):
     else:
         Reaction.objects.create(
             user=request.user,
-            content_type=content_type,
-            object_id=message.id,
+            message=message,
             reaction_type=reaction_type
         ) # React mới
         current_user_reaction = reaction_type
-        if request.user != message.sender:
-            Notification.objects.create(
-                recipient=message.sender, sender=request.user, notification_type='MESSAGE_REACTION',
-                target_content_type=content_type, target_object_id=message.id
-            )
+        if message.sender:
+            notify_reaction(message.sender, request.user, 'MESSAGE_REACTION', message)
             
     # Lấy lại thống kê reaction cho tin nhắn này
     reaction_stats = message.reactions.values('reaction_type').annotate(count=Count('id'))
     stats_dict = {item['reaction_type']: item['count'] for item in reaction_stats}
     total_reactions = message.reactions.count()
+    realtime.publish_to_conversation(
+        message.conversation_id, 'message.reacted',
+        message_id=message.id, reaction_stats=stats_dict, total_reactions=total_reactions,
+    )
     
     return JsonResponse({
         'status': 'ok',
@@ -610,8 +795,13 @@ def api_get_messages(request, conversation_id):
     # Kiểm tra quyền truy cập
     conversation = get_object_or_404(Conversation, id=conversation_id, participants=request.user)
     
-    # Lấy danh sách Object tin nhắn để có thể truy cập msg.file, msg.sender...
-    messages = conversation.messages.exclude(hidden_by=request.user).order_by('timestamp')
+    # Chỉ trả về một trang (mới nhất, hoặc cũ hơn `cursor`) thay vì toàn bộ lịch sử
+    try:
+        messages, has_more = _paginate_messages(conversation, request.user, _parse_message_cursor(request))
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Con trỏ không hợp lệ'}, status=400)
+    if request.GET.get('cursor') is None and messages:
+        mark_conversation_read(request.user, conversation, messages[-1].id)
     
     messages_data = []
     for msg in messages:
@@ -636,6 +826,7 @@ def api_get_messages(request, conversation_id):
         formatted_time = timezone.localtime(msg.timestamp).strftime('%H:%M, %d-%m-%Y')
 
         messages_data.append({
+            'message_id': msg.id,
             'author_id': msg.sender_id, # Lấy ID người gửi
             'text': msg.text,
             'timestamp': formatted_time,
@@ -643,7 +834,11 @@ def api_get_messages(request, conversation_id):
             'file_type': file_type
         })
 
-    return JsonResponse({'messages': messages_data})
+    return JsonResponse({
+        'messages': messages_data,
+        'has_more': has_more,
+        'next_cursor': messages[0].id if messages else None,
+    })
 
 @require_POST
 @login_required
@@ -652,15 +847,12 @@ def api_start_conversation(request):
         data = json.loads(request.body)
         target_user_id = data.get('target_user_id')
         target_user = User.objects.get(id=target_user_id)
-        
-        # Tìm cuộc hội thoại cũ
-        conversation = Conversation.objects.filter(participants=request.user).filter(participants=target_user).first()
-        
-        # Nếu chưa có thì tạo mới
-        if not conversation:
-            conversation = Conversation.objects.create()
-            conversation.participants.add(request.user, target_user)
-            
+        if target_user == request.user:
+            return JsonResponse({'status': 'error', 'message': 'Không thể trò chuyện với chính mình'}, status=400)
+
+        # Tìm cuộc hội thoại 1-1 cũ (chỉ PRIVATE, không bao giờ trả về nhóm), chưa có thì tạo mới
+        conversation, _ = get_or_create_private_conversation(request.user, target_user)
+
         return JsonResponse({
             'status': 'ok', 
             'conversation_id': conversation.id
@@ -668,6 +860,24 @@ def api_start_conversation(request):
     except Exception as e:
         return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
     
+def _new_messages_payload(user, conversation, last_message_id):
+    # Tìm những tin nhắn có ID lớn hơn ID cuối cùng (tức là tin nhắn mới)
+    new_messages = (
+        _visible_messages(conversation, user).filter(id__gt=last_message_id)
+        .select_related('sender').order_by('timestamp')
+    )
+
+    data = []
+    for msg in new_messages:
+        item = serialize_message(msg)
+        item['is_me'] = (msg.sender_id == user.id) # Đánh dấu xem có phải tin của mình không
+        data.append(item)
+
+    if data:
+        # Tin mới hiện ngay trên màn hình đang mở nên coi như đã đọc
+        mark_conversation_read(user, conversation, data[-1]['message_id'])
+    return data
+
 @login_required
 def api_get_new_messages(request, conversation_id):
     conversation = get_object_or_404(Conversation, id=conversation_id, participants=request.user)
@@ -678,48 +888,74 @@ def api_get_new_messages(request, conversation_id):
     if not last_message_id:
         return JsonResponse({'messages': []})
 
-    # Tìm những tin nhắn có ID lớn hơn ID cuối cùng (tức là tin nhắn mới)
-    new_messages = conversation.messages.filter(id__gt=last_message_id).exclude(hidden_by=request.user).order_by('timestamp')
-    
-    data = []
-    for msg in new_messages:
-        # Format thời gian
-        local_ts = timezone.localtime(msg.timestamp)
-        formatted_ts = local_ts.strftime('%H:%M, %d-%m-%Y') 
-        file_url = msg.file.url if msg.file else None
-        file_type = None
-        if msg.file:
-            if msg.is_image: file_type = 'image'
-            elif msg.is_video: file_type = 'video'
-            else: file_type = 'file'
+    return JsonResponse({'messages': _new_messages_payload(request.user, conversation, last_message_id)})
+
+def _authenticated_user(request):
+    user = request.user
+    return user if user.is_authenticated else None
+
+async def api_wait_new_messages(request, conversation_id):
+    """
+    Long-poll của api_get_new_messages: trả về ngay khi có tin mới hơn last_message_id,
+    nếu không thì chờ (không giữ thread khi chạy ASGI) tối đa CHAT_LONG_POLL_TIMEOUT giây.
+    Dùng khi không mở được WebSocket.
+    """
+    user = await sync_to_async(_authenticated_user)(request)
+    if user is None:
+        return JsonResponse({'status': 'error', 'message': 'Chưa đăng nhập'}, status=403)
+    try:
+        last_message_id = int(request.GET.get('last_message_id', ''))
+        timeout = min(float(request.GET.get('timeout', settings.CHAT_LONG_POLL_TIMEOUT)), settings.CHAT_LONG_POLL_TIMEOUT)
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Tham số không hợp lệ'}, status=400)
+
+    conversation = await sync_to_async(
+        Conversation.objects.filter(id=conversation_id, participants=user).first
+    )()
+    if conversation is None:
+        return JsonResponse({'status': 'error', 'message': 'Không tìm thấy cuộc trò chuyện'}, status=404)
+
+    # Đăng ký nhận sự kiện TRƯỚC khi đọc DB để không lỡ tin đến giữa hai bước
+    channel = realtime.Channel()
+    realtime.group_add(realtime.conversation_group(conversation.id), channel)
+    try:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + max(timeout, 0)
+        version = await sync_to_async(realtime.get_conversation_version)(conversation.id)
+        data = await sync_to_async(_new_messages_payload)(user, conversation, last_message_id)
+        while not data and loop.time() < deadline:
+            try:
+                # Sự kiện trong process đánh thức ngay; phiên bản (cache dùng chung hoặc id tin mới nhất
+                # trong DB) bắt thay đổi từ process khác sau tối đa LONG_POLL_VERSION_CHECK giây
+                await asyncio.wait_for(channel.queue.get(), min(deadline - loop.time(), LONG_POLL_VERSION_CHECK))
+            except asyncio.TimeoutError:
+                current = await sync_to_async(realtime.get_conversation_version)(conversation.id)
+                if current == version:
+                    continue
+            version = await sync_to_async(realtime.get_conversation_version)(conversation.id)
+            data = await sync_to_async(_new_messages_payload)(user, conversation, last_message_id)
+    finally:
+        realtime.discard_all(channel)
 
-        data.append({
-            'message_id': msg.id,
-            'sender_id': msg.sender.id if msg.sender else None,
-            'sender_avatar': msg.sender.avatar.url if msg.sender and msg.sender.avatar else '/static/images/default.jpg',
-            'sender_username': msg.sender.username if msg.sender else 'System',
-            'text': msg.text,
-            'timestamp': formatted_ts,
-            'file_url': file_url,
-            'file_type': file_type,
-            'is_me': (msg.sender == request.user) # Đánh dấu xem có phải tin của mình không
-        })
-        
     return JsonResponse({'messages': data})
 
+@login_required
+@require_POST
+def api_mark_conversation_read(request, conversation_id):
+    # Client nhận tin qua WebSocket (không gọi API lấy tin mới) báo đã đọc
+    conversation = get_object_or_404(Conversation, id=conversation_id, participants=request.user)
+    mark_conversation_read(request.user, conversation)
+    return JsonResponse({'status': 'ok'})
+
 @login_required
 @require_POST
 def delete_conversation_view(request, conversation_id):
     conversation = get_object_or_404(Conversation, id=conversation_id, participants=request.user)
     
-    # 1. Ẩn cuộc trò chuyện khỏi danh sách bên trái của người bấm xóa
-    conversation.hidden_by.add(request.user)
-    
-    # 2. Ẩn TOÀN BỘ tin nhắn CŨ đối với người bấm xóa
-    # (Để sau này chat lại, tin nhắn cũ không hiện ra nữa)
-    for msg in conversation.messages.all():
-        msg.hidden_by.add(request.user)
-        
+    # Dời mốc cleared_before_id: cuộc trò chuyện biến khỏi danh sách của người bấm xóa,
+    # và khi chat lại thì tin nhắn cũ không hiện ra nữa
+    clear_conversation(request.user, conversation)
+
     messages.success(request, "Đã xóa cuộc trò chuyện.")
     return redirect('chat:conversation_list')
 
@@ -0,0 +1,106 @@
+# chat/ws.py
+"""
+WebSocket cho chat: /chat/ws/
+
+Được gắn trực tiếp trong core/asgi.py giống luồng SSE thông báo. Sau khi kết nối,
+socket tự nhận sự kiện của nhóm `user:<id>`; client gửi thêm lệnh JSON:
+  {"action": "subscribe",   "conversation_id": 12}
+  {"action": "unsubscribe", "conversation_id": 12}
+  {"action": "ping"}
+Server đẩy về các sự kiện `message.sent`, `message.edited`, `message.recalled`,
+`message.reacted`, `conversation.read` (nhóm cuộc trò chuyện) và `conversation.updated`,
+`conversation.removed` (nhóm người dùng), mỗi sự kiện là một object JSON có `type`.
+"""
+import asyncio
+import json
+from urllib.parse import urlparse
+
+from asgiref.sync import sync_to_async
+
+from notifications.sse import load_user
+from . import realtime
+from .models import Conversation
+
+WS_PATH = '/chat/ws/'
+MAX_SUBSCRIPTIONS = 50
+CLOSE_FORBIDDEN = 4403
+CLOSE_TOO_SLOW = 1013  # "Try again later": client đọc không kịp, cần kết nối và tải lại
+
+
+def _origin_allowed(scope):
+    """Chặn trang web khác mở socket bằng cookie của người dùng (cross-site WebSocket hijacking)."""
+    headers = dict(scope.get('headers', []))
+    origin = headers.get(b'origin')
+    if origin is None:
+        return True  # Không phải trình duyệt
+    return urlparse(origin.decode('latin-1')).netloc == headers.get(b'host', b'').decode('latin-1')
+
+
+def _is_participant(user, conversation_id):
+    return Conversation.objects.filter(id=conversation_id, participants=user).exists()
+
+
+async def _handle_command(text, user, channel):
+    try:
+        command = json.loads(text or '')
+        action = command.get('action')
+    except (ValueError, AttributeError):
+        return {'type': 'error', 'message': 'Lệnh không hợp lệ.'}
+
+    if action == 'ping':
+        return {'type': 'pong'}
+
+    if action in ('subscribe', 'unsubscribe'):
+        conversation_id = command.get('conversation_id')
+        if not isinstance(conversation_id, int):
+            return {'type': 'error', 'message': 'Thiếu conversation_id.'}
+        group = realtime.conversation_group(conversation_id)
+        if action == 'unsubscribe':
+            realtime.group_discard(group, channel)
+            return {'type': 'unsubscribed', 'conversation_id': conversation_id}
+        # Chỉ đếm nhóm cuộc trò chuyện (không tính nhóm `user:<id>` tự có); theo dõi lại nhóm cũ không tính thêm
+        subscribed = sum(1 for name in channel.groups if name.startswith(realtime.conversation_group('')))
+        if group not in channel.groups and subscribed >= MAX_SUBSCRIPTIONS:
+            return {'type': 'error', 'message': 'Đã theo dõi quá nhiều cuộc trò chuyện.'}
+        if not await sync_to_async(_is_participant)(user, conversation_id):
+            return {'type': 'error', 'message': 'Bạn không ở trong cuộc trò chuyện này.'}
+        realtime.group_add(group, channel)
+        return {'type': 'subscribed', 'conversation_id': conversation_id}
+
+    return {'type': 'error', 'message': f"Không hỗ trợ lệnh '{action}'."}
+
+
+async def chat_socket(scope, receive, send):
+    if (await receive())['type'] != 'websocket.connect':
+        return
+    user = await sync_to_async(load_user)(scope)
+    if not user.is_authenticated or not _origin_allowed(scope):
+        await send({'type': 'websocket.close', 'code': CLOSE_FORBIDDEN})
+        return
+    await send({'type': 'websocket.accept'})
+
+    channel = realtime.Channel()
+    realtime.group_add(realtime.user_group(user.id), channel)
+
+    async def pump():
+        # Chỉ task này gọi send, nên các khung không bao giờ bị gửi chen nhau
+        while True:
+            event = await channel.queue.get()
+            if channel.overflowed:
+                await send({'type': 'websocket.close', 'code': CLOSE_TOO_SLOW})
+                return
+            if event['type'] == 'conversation.removed':
+                realtime.group_discard(realtime.conversation_group(event['conversation_id']), channel)
+            await send({'type': 'websocket.send', 'text': json.dumps(event, ensure_ascii=False)})
+
+    pump_task = asyncio.ensure_future(pump())
+    try:
+        while True:
+            message = await receive()
+            if message['type'] == 'websocket.disconnect':
+                break
+            if message['type'] == 'websocket.receive':
+                channel.deliver(await _handle_command(message.get('text'), user, channel))
+    finally:
+        realtime.discard_all(channel)
+        pump_task.cancel()
@@ -13,4 +13,20 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Import sau get_asgi_application() vì các module này cần app registry đã sẵn sàng
+from notifications.sse import STREAM_PATH, notification_stream  # noqa: E402
+from chat.ws import WS_PATH, chat_socket  # noqa: E402
+
+
+async def application(scope, receive, send):
+    # Luồng SSE giữ kết nối lâu nên được phục vụ trực tiếp, không đi qua middleware Django
+    if scope['type'] == 'http' and scope['path'] == STREAM_PATH:
+        return await notification_stream(scope, receive, send)
+    if scope['type'] == 'websocket':
+        if scope['path'] == WS_PATH:
+            return await chat_socket(scope, receive, send)
+        await receive()  # websocket.connect
+        return await send({'type': 'websocket.close'})
+    return await django_application(scope, receive, send)
@@ -0,0 +1,30 @@
+# core/cache.py
+"""
+Kiểm tra cache mặc định có dùng chung giữa các process hay không.
+
+LocMemCache / FileBasedCache / DummyCache là riêng từng worker: giá trị ghi ở worker này
+không thấy được ở worker khác, nên các bộ đếm và trạng thái chờ chỉ được giữ trong cache
+khi backend là Redis hoặc Memcached.
+"""
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+SHARED_CACHE_BACKENDS = (
+    'django.core.cache.backends.redis.RedisCache',
+    'django.core.cache.backends.memcached.PyMemcacheCache',
+    'django.core.cache.backends.memcached.PyLibMCCache',
+)
+
+
+def is_shared_cache(alias='default'):
+    backend = settings.CACHES.get(alias, {}).get('BACKEND', '')
+    return backend in SHARED_CACHE_BACKENDS
+
+
+def require_shared_cache(feature, alias='default'):
+    if not is_shared_cache(alias):
+        raise ImproperlyConfigured(
+            f"{feature} cần CACHES['{alias}'] dùng chung giữa các process "
+            f"(Redis/Memcached, ví dụ đặt REDIS_URL); backend hiện tại: "
+            f"{settings.CACHES.get(alias, {}).get('BACKEND')}"
+        )
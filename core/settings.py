@@ -98,6 +98,24 @@ DATABASES = {
     }
 }
 
+# Cache dùng chung giữa các worker (bộ đệm reaction, badge thông báo, phiên bản SSE).
+# Không đặt REDIS_URL thì dùng LocMemCache riêng từng process: chỉ hợp khi chạy một process,
+# các tính năng cần cache chung sẽ tự quay về đọc DB (xem core/cache.py).
+REDIS_URL = os.getenv('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -162,4 +180,49 @@ EMAIL_HOST = 'smtp.gmail.com'
 EMAIL_PORT = 587
 EMAIL_USE_TLS = True
 EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER')
-EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD')
\ No newline at end of file
+EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD')
+
+# Bộ đệm ghi trễ cho reaction khi bài viết "viral" (xem posts/reaction_buffer.py).
+# Khi bật cần chạy kèm: python manage.py flush_reaction_buffer
+# và CACHES chung giữa các process (đặt REDIS_URL); bật với LocMemCache sẽ báo ImproperlyConfigured.
+REACTION_WRITE_BEHIND = os.getenv('REACTION_WRITE_BEHIND', 'False') == 'True'
+REACTION_BUFFER_LOG = BASE_DIR / 'reaction_buffer.log'
+
+# Thông báo gửi cho nhiều người (tin nhắn nhóm, thêm thành viên...) được ghi bằng bulk_create
+# theo lô; từ ngưỡng này trở lên thì chuyển sang outbox cho worker process_outbox xử lý.
+NOTIFICATION_FANOUT_CHUNK_SIZE = 500
+NOTIFICATION_FANOUT_DEFER_THRESHOLD = int(os.getenv('NOTIFICATION_FANOUT_DEFER_THRESHOLD', '50'))
+
+# Badge số thông báo chưa đọc được giữ trong cache dùng chung tối đa bấy nhiêu giây rồi đếm lại
+# trong DB; không có cache dùng chung (chưa đặt REDIS_URL) thì luôn đếm trong DB.
+NOTIFICATION_UNREAD_CACHE_TTL = int(os.getenv('NOTIFICATION_UNREAD_CACHE_TTL', '300'))
+
+# Thông báo đã đọc cũ hơn số ngày này sẽ bị lưu trữ / xóa bởi: python manage.py prune_notifications
+NOTIFICATION_RETENTION_DAYS = int(os.getenv('NOTIFICATION_RETENTION_DAYS', '90'))
+
+# Transactional outbox (notifications/outbox.py): email kích hoạt / quên mật khẩu, tách hashtag,
+# thông báo hàng loạt được ghi cùng transaction rồi xử lý bởi: python manage.py process_outbox
+# OUTBOX_EAGER=True xử lý ngay sau commit, trong chính request (chỉ nên bật khi dev không chạy worker).
+OUTBOX_EAGER = os.getenv('OUTBOX_EAGER', 'False') == 'True'
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '8'))
+OUTBOX_BACKOFF_BASE = 5  # giây, nhân đôi sau mỗi lần lỗi
+OUTBOX_BACKOFF_MAX = 3600
+OUTBOX_LEASE_SECONDS = 300  # worker giữ một lô tối đa bấy nhiêu giây trước khi lô được trả lại
+
+# Long-poll tin nhắn (chat.views.api_wait_new_messages) cho môi trường không giữ được WebSocket:
+# số giây tối đa một request chờ tin mới
+CHAT_LONG_POLL_TIMEOUT = int(os.getenv('CHAT_LONG_POLL_TIMEOUT', '25'))
+
+# Tải file theo mảnh (posts/uploads.py): client gửi từng mảnh tối đa UPLOAD_CHUNK_SIZE byte,
+# server ghi thẳng xuống UPLOAD_TEMP_DIR nên bộ nhớ mỗi request không phụ thuộc kích thước file.
+# Upload dở dang / không được đính kèm quá UPLOAD_EXPIRY_HOURS giờ bị xóa bởi: python manage.py prune_uploads
+UPLOAD_MAX_SIZE = int(os.getenv('UPLOAD_MAX_SIZE', str(500 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', str(5 * 1024 * 1024)))
+UPLOAD_TEMP_DIR = os.getenv('UPLOAD_TEMP_DIR', str(BASE_DIR / 'upload_tmp'))
+UPLOAD_EXPIRY_HOURS = int(os.getenv('UPLOAD_EXPIRY_HOURS', '24'))
+
+# Lưu trữ tin nhắn cũ (chat/archive.py): tin cũ hơn MESSAGE_ARCHIVE_AFTER_DAYS ngày được nén theo khối
+# MESSAGE_ARCHIVE_CHUNK_SIZE tin sang bảng MessageArchive bởi: python manage.py archive_messages
+# Lịch sử (trang chat, tải tin cũ, api_get_messages) vẫn đọc liền mạch qua cả hai nơi.
+MESSAGE_ARCHIVE_AFTER_DAYS = int(os.getenv('MESSAGE_ARCHIVE_AFTER_DAYS', '180'))
+MESSAGE_ARCHIVE_CHUNK_SIZE = int(os.getenv('MESSAGE_ARCHIVE_CHUNK_SIZE', '500'))
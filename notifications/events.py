@@ -0,0 +1,72 @@
+# notifications/events.py
+"""
+Kênh phát sự kiện "hộp thông báo của user X vừa thay đổi" cho luồng SSE.
+
+- Trong cùng process: đánh thức ngay các kết nối SSE đang chờ (asyncio.Event).
+- Giữa nhiều process: với CACHES dùng chung (Redis/Memcached) thì tăng số phiên bản trong cache,
+  kết nối SSE ở process khác so sánh phiên bản định kỳ mà không chạm DB. Cache riêng từng process
+  thì phiên bản là "dấu vân tay" đọc từ DB (updated_at mới nhất, số chưa đọc) nên thay đổi từ
+  worker khác vẫn được thấy ở lần kiểm tra kế tiếp.
+"""
+import asyncio
+import threading
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db.models import Count, Max, Q
+from core.cache import is_shared_cache
+
+_subscribers = defaultdict(set)  # user_id -> {(loop, asyncio.Event)}
+_lock = threading.Lock()
+
+
+def _version_key(user_id):
+    return f"notifications:version:{user_id}"
+
+
+def _db_version(user_id):
+    from chat.utils import get_unread_conversation_count
+    from .models import Notification
+
+    state = Notification.objects.filter(recipient_id=user_id).aggregate(
+        last_change=Max('updated_at'), unread=Count('id', filter=Q(is_read=False)),
+    )
+    return (state['last_change'], state['unread'], get_unread_conversation_count(user_id))
+
+
+def get_version(user_id):
+    if not is_shared_cache():
+        return _db_version(user_id)
+    return cache.get(_version_key(user_id), 0)
+
+
+def publish(user_id):
+    """Báo cho mọi kết nối của user rằng thông báo / số chưa đọc đã thay đổi."""
+    if is_shared_cache():
+        try:
+            cache.incr(_version_key(user_id))
+        except ValueError:
+            cache.add(_version_key(user_id), 1, timeout=None)
+
+    with _lock:
+        waiters = list(_subscribers.get(user_id, ()))
+    for loop, event in waiters:
+        # publish có thể được gọi từ thread của view đồng bộ
+        loop.call_soon_threadsafe(event.set)
+
+
+def subscribe(user_id):
+    event = asyncio.Event()
+    with _lock:
+        _subscribers[user_id].add((asyncio.get_running_loop(), event))
+    return event
+
+
+def unsubscribe(user_id, event):
+    with _lock:
+        waiters = _subscribers.get(user_id)
+        if not waiters:
+            return
+        waiters.difference_update({w for w in waiters if w[1] is event})
+        if not waiters:
+            del _subscribers[user_id]
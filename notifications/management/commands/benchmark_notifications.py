@@ -0,0 +1,136 @@
+# notifications/management/commands/benchmark_notifications.py
+
+import random
+import statistics
+import time
+import uuid
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.db import connection
+from chat.models import Message
+from chat.utils import get_or_create_private_conversation
+from notifications.models import Notification
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Đo các truy vấn thông báo trên một hộp thư lớn (mặc định 1 triệu dòng): đếm chưa đọc, '
+        'trang mới nhất, và đánh dấu đã đọc một cuộc trò chuyện theo cách cũ (IN danh sách id '
+        'tin nhắn) so với cách mới (theo conversation). Dữ liệu thử được xóa khi chạy xong.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000, help='Số thông báo của người nhận thử.')
+        parser.add_argument('--messages', type=int, default=20_000, help='Số tin nhắn trong cuộc trò chuyện thử.')
+        parser.add_argument('--message-share', type=float, default=0.2,
+                            help='Tỉ lệ thông báo là MESSAGE của cuộc trò chuyện thử.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--repeat', type=int, default=5, help='Số lần chạy mỗi phép đo.')
+        parser.add_argument('--keep', action='store_true', help='Giữ lại dữ liệu thử.')
+        parser.add_argument('--explain', action='store_true', help='In kế hoạch thực thi của từng truy vấn.')
+
+    def handle(self, *args, **options):
+        suffix = uuid.uuid4().hex[:8]
+        recipient = User.objects.create_user(f'bench_recipient_{suffix}', password=None)
+        sender = User.objects.create_user(f'bench_sender_{suffix}', password=None)
+        conversation, _ = get_or_create_private_conversation(recipient, sender)
+        try:
+            self.populate(recipient, sender, conversation, options)
+            self.measure(recipient, conversation, options)
+        finally:
+            if not options['keep']:
+                self.cleanup(recipient, sender, conversation, options['batch_size'])
+
+    def populate(self, recipient, sender, conversation, options):
+        batch_size = options['batch_size']
+        started = time.perf_counter()
+
+        for start in range(0, options['messages'], batch_size):
+            count = min(batch_size, options['messages'] - start)
+            Message.objects.bulk_create([
+                Message(conversation=conversation, sender=sender, text=f'bench {start + i}') for i in range(count)
+            ])
+        # MySQL không trả id sau bulk_create nên đọc lại
+        message_ids = list(Message.objects.filter(conversation=conversation).values_list('id', flat=True))
+
+        message_ct = ContentType.objects.get_for_model(Message)
+        rng = random.Random(42)
+        for start in range(0, options['rows'], batch_size):
+            batch = []
+            for i in range(start, min(start + batch_size, options['rows'])):
+                notification = Notification(
+                    recipient=recipient, sender=sender, actor_name=sender.username,
+                    is_read=rng.random() < 0.9,
+                )
+                if rng.random() < options['message_share']:
+                    notification.notification_type = 'MESSAGE'
+                    notification.target_content_type = message_ct
+                    notification.target_object_id = rng.choice(message_ids)
+                    notification.conversation = conversation
+                else:
+                    notification.notification_type = rng.choice(['FRIEND_REQUEST', 'POST_COMMENT', 'POST_SHARE'])
+                batch.append(notification)
+            Notification.objects.bulk_create(batch)
+
+        self.stdout.write(
+            f"Đã tạo {options['rows']} thông báo, {options['messages']} tin nhắn "
+            f"trong {time.perf_counter() - started:.1f}s"
+        )
+
+    def measure(self, recipient, conversation, options):
+        def reset_conversation_unread():
+            Notification.objects.filter(conversation=conversation, recipient=recipient).update(is_read=False)
+
+        def mark_read_by_message_ids():
+            # Cách cũ của redirect_notification
+            message_ids = Message.objects.filter(conversation_id=conversation.id).values_list('id', flat=True)
+            Notification.objects.filter(
+                recipient=recipient, notification_type='MESSAGE',
+                target_content_type=ContentType.objects.get_for_model(Message),
+                target_object_id__in=list(message_ids), is_read=False,
+            ).update(is_read=True)
+
+        def mark_read_by_conversation():
+            Notification.objects.filter(
+                conversation_id=conversation.id, recipient=recipient, notification_type='MESSAGE', is_read=False,
+            ).update(is_read=True)
+
+        cases = [
+            ('Đếm chưa đọc', lambda: Notification.objects.filter(recipient=recipient, is_read=False).count(), None,
+             Notification.objects.filter(recipient=recipient, is_read=False)),
+            ('Trang 20 thông báo mới nhất', lambda: list(
+                Notification.objects.filter(recipient=recipient).order_by('-timestamp', '-id')[:20]
+            ), None, Notification.objects.filter(recipient=recipient).order_by('-timestamp', '-id')[:20]),
+            ('Đọc cuộc trò chuyện (IN id tin nhắn)', mark_read_by_message_ids, reset_conversation_unread, None),
+            ('Đọc cuộc trò chuyện (theo conversation)', mark_read_by_conversation, reset_conversation_unread,
+             Notification.objects.filter(conversation_id=conversation.id, recipient=recipient,
+                                         notification_type='MESSAGE', is_read=False)),
+        ]
+
+        self.stdout.write(f"\n{'Phép đo':<45}{'median (ms)':>14}{'min (ms)':>12}")
+        for label, func, setup, queryset in cases:
+            timings = []
+            for _ in range(options['repeat']):
+                if setup:
+                    setup()
+                started = time.perf_counter()
+                func()
+                timings.append((time.perf_counter() - started) * 1000)
+            self.stdout.write(f"{label:<45}{statistics.median(timings):>14.1f}{min(timings):>12.1f}")
+            if options['explain'] and queryset is not None:
+                self.stdout.write(f"  {connection.vendor}: {queryset.explain()}")
+
+    def cleanup(self, recipient, sender, conversation, batch_size):
+        # Xóa theo lô để không phải nạp cả triệu dòng vào bộ nhớ một lần
+        while True:
+            ids = list(Notification.objects.filter(recipient=recipient).values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            Notification.objects.filter(id__in=ids).delete()
+        conversation.delete()
+        recipient.delete()
+        sender.delete()
+        self.stdout.write("Đã xóa dữ liệu thử.")
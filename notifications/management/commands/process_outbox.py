@@ -0,0 +1,63 @@
+# notifications/management/commands/process_outbox.py
+
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+from notifications import outbox
+from notifications.models import OutboxEvent
+
+
+class Command(BaseCommand):
+    help = (
+        'Worker xử lý transactional outbox: gửi email kích hoạt / quên mật khẩu, tách hashtag, '
+        'tạo thông báo hàng loạt. Sự kiện lỗi được thử lại với thời gian chờ tăng dần '
+        '(OUTBOX_BACKOFF_BASE x 2^n), quá OUTBOX_MAX_ATTEMPTS lần thì chuyển sang FAILED.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Số sự kiện nhận trong mỗi lô.')
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Số giây nghỉ khi outbox trống trước khi kiểm tra lại.')
+        parser.add_argument('--once', action='store_true',
+                            help='Xử lý hết các sự kiện đang đến hạn rồi thoát (dùng cho cron).')
+        parser.add_argument('--keep-days', type=int, default=7,
+                            help='Xóa các sự kiện đã xử lý xong cũ hơn số ngày này.')
+
+    def handle(self, *args, **options):
+        total_done = total_failed = 0
+        last_purge = 0.0
+        try:
+            while True:
+                if time.monotonic() - last_purge >= 3600:
+                    self.purge(options['keep_days'])
+                    last_purge = time.monotonic()
+
+                done, failed = outbox.drain(options['batch_size'])
+                total_done += done
+                total_failed += failed
+                if done or failed:
+                    self.stdout.write(f"Lô: {done} thành công, {failed} lỗi")
+                    continue
+
+                if options['once']:
+                    break
+                close_old_connections()
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS(f"Đã xử lý {total_done} sự kiện, {total_failed} lần lỗi."))
+
+    def purge(self, keep_days):
+        cutoff = timezone.now() - timedelta(days=keep_days)
+        # Xóa theo lô nhỏ để không khóa bảng lâu
+        while True:
+            ids = list(
+                OutboxEvent.objects.filter(status=OutboxEvent.STATUS_DONE, processed_at__lt=cutoff)
+                .values_list('id', flat=True)[:1000]
+            )
+            if not ids:
+                break
+            OutboxEvent.objects.filter(id__in=ids).delete()
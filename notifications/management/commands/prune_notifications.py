@@ -0,0 +1,61 @@
+# notifications/management/commands/prune_notifications.py
+
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from notifications.models import ArchivedNotification, Notification
+
+
+class Command(BaseCommand):
+    help = (
+        'Chuyển các thông báo ĐÃ ĐỌC cũ hơn N ngày sang bảng lưu trữ (hoặc xóa hẳn với --delete), '
+        'theo từng lô nhỏ để không khóa bảng lâu.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.NOTIFICATION_RETENTION_DAYS,
+                            help='Giữ lại thông báo trong bao nhiêu ngày gần nhất.')
+        parser.add_argument('--delete', action='store_true',
+                            help='Xóa hẳn thay vì chuyển sang bảng lưu trữ.')
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Số dòng xử lý trong mỗi transaction.')
+        parser.add_argument('--sleep', type=float, default=0.0,
+                            help='Số giây nghỉ giữa các lô để giảm tải cho database.')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        expired = Notification.objects.filter(is_read=True, timestamp__lt=cutoff)
+        total = 0
+        last_pk = 0
+
+        # Duyệt theo khóa chính tăng dần: mỗi lô chỉ khóa vài nghìn dòng trong một transaction ngắn
+        while True:
+            with transaction.atomic():
+                # Khóa lô đang xử lý để thông báo vừa bị đánh dấu "chưa đọc" không bị lưu trữ nhầm
+                rows = list(
+                    expired.filter(pk__gt=last_pk).order_by('pk').select_for_update()
+                    .values('pk', *ArchivedNotification.COPIED_FIELDS)[:options['chunk_size']]
+                )
+                if not rows:
+                    break
+                last_pk = rows[-1]['pk']
+
+                if not options['delete']:
+                    ArchivedNotification.objects.bulk_create([
+                        ArchivedNotification(
+                            original_id=row['pk'],
+                            **{field: row[field] for field in ArchivedNotification.COPIED_FIELDS},
+                        )
+                        for row in rows
+                    ], ignore_conflicts=True)
+                Notification.objects.filter(pk__in=[row['pk'] for row in rows]).delete()
+
+            total += len(rows)
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        action = 'Đã xóa' if options['delete'] else 'Đã lưu trữ'
+        self.stdout.write(self.style.SUCCESS(f"{action} {total} thông báo đã đọc cũ hơn {options['days']} ngày."))
@@ -0,0 +1,93 @@
+# notifications/management/commands/sweep_orphans.py
+
+import time
+from django.apps import apps
+from django.contrib.contenttypes.fields import GenericForeignKey
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+
+def generic_foreign_keys():
+    """Liệt kê (model, GenericForeignKey) của mọi model trong project."""
+    for model in apps.get_models():
+        for field in model._meta.private_fields:
+            if isinstance(field, GenericForeignKey):
+                yield model, field
+
+
+class Command(BaseCommand):
+    help = (
+        'Xóa dần các bản ghi trỏ tới đối tượng đã bị xóa qua GenericForeignKey '
+        '(ví dụ Notification của bài viết / tin nhắn / bình luận đã xóa).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='Số dòng kiểm tra và xóa trong mỗi transaction ngắn.')
+        parser.add_argument('--sleep', type=float, default=0.0,
+                            help='Số giây nghỉ giữa các lô để giảm tải cho database.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Chỉ đếm, không xóa.')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        total_removed = 0
+
+        for model, gfk in generic_foreign_keys():
+            ct_field = model._meta.get_field(gfk.ct_field).attname
+            content_type_ids = (
+                model.objects.filter(**{f'{ct_field}__isnull': False})
+                .order_by().values_list(ct_field, flat=True).distinct()
+            )
+            for content_type_id in list(content_type_ids):
+                scanned, removed = self.sweep(model, ct_field, gfk.fk_field, content_type_id, chunk_size, options)
+                total_removed += removed
+                content_type = ContentType.objects.get_for_id(content_type_id)
+                self.stdout.write(
+                    f"{model._meta.label} -> {content_type.app_label}.{content_type.model}: "
+                    f"kiểm tra {scanned}, {'sẽ xóa' if options['dry_run'] else 'đã xóa'} {removed}"
+                )
+
+        self.stdout.write(self.style.SUCCESS(f"Tổng cộng: {total_removed} bản ghi mồ côi."))
+
+    def sweep(self, model, ct_field, fk_field, content_type_id, chunk_size, options):
+        target_model = ContentType.objects.get_for_id(content_type_id).model_class()
+        scanned = removed = 0
+        last_pk = 0
+
+        # Duyệt theo khoảng khóa chính (keyset) để mỗi lô chỉ khóa vài trăm dòng trong thời gian ngắn.
+        # Dòng có object_id NULL không trỏ tới đối tượng nào nên không phải mồ côi
+        base = model.objects.filter(**{ct_field: content_type_id, f'{fk_field}__isnull': False})
+        while True:
+            rows = list(
+                base.filter(pk__gt=last_pk).order_by('pk').values_list('pk', fk_field)[:chunk_size]
+            )
+            if not rows:
+                break
+            last_pk = rows[-1][0]
+            scanned += len(rows)
+
+            object_ids = {object_id for _, object_id in rows}
+            if target_model is None:
+                # Model đích không còn tồn tại trong code: mọi dòng đều mồ côi
+                missing_ids = object_ids
+            else:
+                # So sánh dạng chuỗi: object_id có thể là cột ký tự trong khi khóa chính đích là số
+                existing = {
+                    str(pk) for pk in
+                    target_model._default_manager.filter(pk__in=object_ids).values_list('pk', flat=True)
+                }
+                missing_ids = {object_id for object_id in object_ids if str(object_id) not in existing}
+            orphan_pks = [pk for pk, object_id in rows if object_id in missing_ids]
+
+            if orphan_pks and not options['dry_run']:
+                with transaction.atomic():
+                    # Lọc lại theo object_id: chỉ xóa dòng vẫn trỏ tới id đã không còn trong bảng đích
+                    base.filter(pk__in=orphan_pks, **{f'{fk_field}__in': missing_ids}).delete()
+            removed += len(orphan_pks)
+
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        return scanned, removed
@@ -0,0 +1,62 @@
+# Generated by Django 4.2.24 on 2026-10-19 13:56
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+AGGREGATED_TYPES = ('POST_REACTION', 'COMMENT_REACTION', 'MESSAGE_REACTION')
+
+
+def coalesce_reaction_notifications(apps, schema_editor):
+    # Gộp các thông báo cảm xúc trùng lặp hiện có thành một dòng cho mỗi (người nhận, đối tượng, loại)
+    Notification = apps.get_model('notifications', 'Notification')
+    groups = (
+        Notification.objects.filter(notification_type__in=AGGREGATED_TYPES)
+        .order_by()
+        .values('recipient_id', 'notification_type', 'target_content_type_id', 'target_object_id')
+        .annotate(rows=Count('id'))
+        .filter(rows__gt=1)
+    )
+    for group in groups:
+        rows = Notification.objects.filter(
+            recipient_id=group['recipient_id'],
+            notification_type=group['notification_type'],
+            target_content_type_id=group['target_content_type_id'],
+            target_object_id=group['target_object_id'],
+        ).order_by('-timestamp', '-id')
+        sender_ids = []
+        for sender_id in rows.values_list('sender_id', flat=True):
+            if sender_id not in sender_ids:
+                sender_ids.append(sender_id)
+        latest = rows.first()
+        Notification.objects.filter(pk=latest.pk).update(
+            actor_count=len(sender_ids),
+            recent_actor_ids=sender_ids[:3],
+            is_read=not rows.filter(is_read=False).exists(),
+        )
+        rows.exclude(pk=latest.pk).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0005_alter_notification_notification_type'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='actor_count',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='recent_actor_ids',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['recipient', 'notification_type', 'target_content_type', 'target_object_id'], name='notif_aggregate_lookup_idx'),
+        ),
+        migrations.RunPython(coalesce_reaction_notifications, migrations.RunPython.noop),
+    ]
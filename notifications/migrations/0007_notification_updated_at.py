@@ -0,0 +1,30 @@
+# Generated by Django 4.2.24 on 2026-10-19 14:07
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def copy_timestamp(apps, schema_editor):
+    # Dữ liệu cũ: coi thời điểm tạo là lần thay đổi gần nhất
+    Notification = apps.get_model('notifications', 'Notification')
+    Notification.objects.update(updated_at=F('timestamp'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0006_notification_aggregation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(copy_timestamp, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['recipient', 'updated_at'], name='notif_recipient_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.24 on 2026-10-19 14:14
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('notifications', '0008_notification_render_snapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedNotification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('original_id', models.BigIntegerField(unique=True)),
+                ('notification_type', models.CharField(choices=[('FRIEND_REQUEST', 'Yêu cầu kết bạn'), ('FRIEND_ACCEPT', 'Chấp nhận lời mời kết bạn'), ('POST_LIKE', 'Thích bài viết'), ('POST_COMMENT', 'Bình luận bài viết'), ('COMMENT_REACTION', 'Bày tỏ cảm xúc về bình luận'), ('MESSAGE', 'Tin nhắn mới'), ('MESSAGE_REACTION', 'Bày tỏ cảm xúc về tin nhắn'), ('ADDED_TO_GROUP', 'Được thêm vào nhóm'), ('GROUP_INVITE_REQUEST', 'Yêu cầu phê duyệt thành viên'), ('POST_SHARE', 'Chia sẻ bài viết')], max_length=50)),
+                ('timestamp', models.DateTimeField()),
+                ('target_object_id', models.PositiveIntegerField(blank=True, null=True)),
+                ('actor_count', models.PositiveIntegerField(default=1)),
+                ('actor_name', models.CharField(blank=True, max_length=150)),
+                ('excerpt', models.CharField(blank=True, max_length=255)),
+                ('target_url', models.CharField(blank=True, max_length=255)),
+                ('media_kind', models.CharField(blank=True, max_length=10)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('recipient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_notifications', to=settings.AUTH_USER_MODEL)),
+                ('sender', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('target_content_type', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='contenttypes.contenttype')),
+            ],
+            options={
+                'ordering': ['-timestamp'],
+                'indexes': [models.Index(fields=['recipient', 'timestamp'], name='archived_notif_recipient_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 4.2.24 on 2026-10-19 14:15
+
+from django.db import migrations, models
+from django.db.models import Max, OuterRef, Subquery
+import django.db.models.deletion
+
+
+def backfill_conversation(apps, schema_editor):
+    # Gán cuộc trò chuyện cho các thông báo MESSAGE cũ theo từng khoảng id
+    Notification = apps.get_model('notifications', 'Notification')
+    Message = apps.get_model('chat', 'Message')
+    max_id = Notification.objects.aggregate(max_id=Max('id'))['max_id'] or 0
+    conversation_of_message = Message.objects.filter(pk=OuterRef('target_object_id')).values('conversation_id')[:1]
+    step = 10000
+    for start in range(0, max_id + 1, step):
+        Notification.objects.filter(
+            id__gte=start, id__lt=start + step, notification_type='MESSAGE', conversation__isnull=True,
+        ).update(conversation_id=Subquery(conversation_of_message))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0006_conversation_hidden_by'),
+        ('notifications', '0009_archived_notification'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='conversation',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to='chat.conversation'),
+        ),
+        migrations.RunPython(backfill_conversation, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['recipient', 'is_read'], name='notif_recipient_read_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['recipient', 'timestamp'], name='notif_recipient_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['conversation', 'recipient', 'is_read'], name='notif_conversation_read_idx'),
+        ),
+    ]
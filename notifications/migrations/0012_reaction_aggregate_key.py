@@ -0,0 +1,65 @@
+# Generated by Django 4.2.24 on 2026-10-19 15:14
+
+from django.db import migrations, models
+from django.db.models import Count, F, Max
+
+
+AGGREGATED_TYPES = ('POST_REACTION', 'COMMENT_REACTION', 'MESSAGE_REACTION')
+RECENT_ACTORS_LIMIT = 3
+
+
+def fill_aggregate_key(apps, schema_editor):
+    # Gộp các dòng trùng do hai lượt thả cảm xúc đầu tiên chạy song song (giữ dòng mới nhất),
+    # rồi chép target_object_id sang khóa gộp để thêm được unique constraint
+    Notification = apps.get_model('notifications', 'Notification')
+    groups = (
+        Notification.objects.filter(notification_type__in=AGGREGATED_TYPES)
+        .order_by()
+        .values('recipient_id', 'notification_type', 'target_content_type_id', 'target_object_id')
+        .annotate(rows=Count('id'), actor_count=Max('actor_count'))
+        .filter(rows__gt=1)
+    )
+    for group in groups:
+        rows = Notification.objects.filter(
+            recipient_id=group['recipient_id'],
+            notification_type=group['notification_type'],
+            target_content_type_id=group['target_content_type_id'],
+            target_object_id=group['target_object_id'],
+        ).order_by('-timestamp', '-id')
+        sender_ids, actor_ids = set(), []
+        for sender_id, recent_actor_ids in rows.values_list('sender_id', 'recent_actor_ids'):
+            sender_ids.add(sender_id)
+            for user_id in [sender_id] + list(recent_actor_ids or []):
+                if user_id not in actor_ids:
+                    actor_ids.append(user_id)
+        latest = rows.first()
+        Notification.objects.filter(pk=latest.pk).update(
+            actor_count=max(group['actor_count'], len(sender_ids)),
+            recent_actor_ids=actor_ids[:RECENT_ACTORS_LIMIT],
+            is_read=not rows.filter(is_read=False).exists(),
+        )
+        rows.exclude(pk=latest.pk).delete()
+
+    Notification.objects.filter(notification_type__in=AGGREGATED_TYPES).update(
+        aggregate_object_id=F('target_object_id'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0011_outbox_event'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='aggregate_object_id',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(fill_aggregate_key, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='notification',
+            constraint=models.UniqueConstraint(fields=('recipient', 'notification_type', 'target_content_type', 'aggregate_object_id'), name='unique_reaction_aggregate'),
+        ),
+    ]
@@ -2,6 +2,10 @@ from django.db import models
 from django.conf import settings
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
+from django.urls import NoReverseMatch, reverse
+from django.utils import timezone
+from django.utils.functional import cached_property
+from django.utils.text import Truncator
 
 class Notification(models.Model):
     NOTIFICATION_TYPES = [
@@ -22,13 +26,222 @@ class Notification(models.Model):
     notification_type = models.CharField(max_length=50, choices=NOTIFICATION_TYPES)
     is_read = models.BooleanField(default=False)
     timestamp = models.DateTimeField(auto_now_add=True)
+    # Thời điểm thay đổi gần nhất (tạo, đọc/chưa đọc, gộp thêm người tương tác).
+    # Các lệnh .update() hàng loạt phải tự gán updated_at vì auto_now không chạy.
+    updated_at = models.DateTimeField(auto_now=True)
 
     target_content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE, null=True, blank=True)
     target_object_id = models.PositiveIntegerField(null=True, blank=True)
     target = GenericForeignKey('target_content_type', 'target_object_id')
+    # Cuộc trò chuyện của thông báo MESSAGE: đánh dấu đã đọc cả cuộc trò chuyện bằng một câu UPDATE.
+    # Index riêng bằng notif_conversation_read_idx (cột đầu là conversation) nên tắt db_index.
+    conversation = models.ForeignKey(
+        'chat.Conversation', on_delete=models.CASCADE, null=True, blank=True,
+        related_name='notifications', db_index=False,
+    )
+
+    # Thông báo cảm xúc được gộp theo (người nhận, đối tượng, loại):
+    # sender là người tương tác gần nhất, actor_count là tổng số người đã tương tác
+    actor_count = models.PositiveIntegerField(default=1)
+    recent_actor_ids = models.JSONField(default=list, blank=True)
+    # Khóa gộp: bằng target_object_id với các loại trong AGGREGATED_TYPES, NULL với các loại khác.
+    # NULL được phép trùng trong unique index nên unique_reaction_aggregate chỉ ràng buộc thông báo gộp
+    aggregate_object_id = models.PositiveIntegerField(null=True, blank=True, editable=False)
+
+    # Các loại thông báo được gộp thành một dòng duy nhất cho mỗi đối tượng
+    AGGREGATED_TYPES = ('POST_REACTION', 'COMMENT_REACTION', 'MESSAGE_REACTION')
+    RECENT_ACTORS_LIMIT = 3
+
+    # Ảnh chụp dữ liệu hiển thị, ghi một lần lúc tạo thông báo để khi đọc
+    # không phải join sender hay tra target nữa (xem fill_render_snapshot)
+    actor_name = models.CharField(max_length=150, blank=True)
+    actor_avatar_url = models.CharField(max_length=255, blank=True)
+    excerpt = models.CharField(max_length=255, blank=True)      # Trích đoạn nội dung hoặc tên nhóm
+    target_url = models.CharField(max_length=255, blank=True)   # Trang đích khi bấm vào thông báo
+    media_kind = models.CharField(max_length=10, blank=True)    # 'image' / 'video' / 'file' với tin nhắn có tệp
+    EXCERPT_WORDS = 15
+
+    class Meta:
+        ordering = ['-timestamp']
+        indexes = [
+            models.Index(
+                fields=['recipient', 'notification_type', 'target_content_type', 'target_object_id'],
+                name='notif_aggregate_lookup_idx',
+            ),
+            # Phục vụ ETag/Last-Modified và tham số `since` của /notifications/api/
+            models.Index(fields=['recipient', 'updated_at'], name='notif_recipient_updated_idx'),
+            # Đếm chưa đọc và danh sách mới nhất của một người
+            models.Index(fields=['recipient', 'is_read'], name='notif_recipient_read_idx'),
+            models.Index(fields=['recipient', 'timestamp'], name='notif_recipient_time_idx'),
+            models.Index(fields=['conversation', 'recipient', 'is_read'], name='notif_conversation_read_idx'),
+        ]
+        constraints = [
+            # Hai lượt thả cảm xúc đầu tiên chạy song song không thể tạo hai dòng gộp (xem notify_reaction)
+            models.UniqueConstraint(
+                fields=['recipient', 'notification_type', 'target_content_type', 'aggregate_object_id'],
+                name='unique_reaction_aggregate',
+            ),
+        ]
+
+    def __str__(self):
+        return f"Notification for {self.recipient.username} from {self.sender.username}"
+
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            self.fill_conversation()
+            if self.notification_type in self.AGGREGATED_TYPES and self.aggregate_object_id is None:
+                self.aggregate_object_id = self.target_object_id
+            if not self.has_snapshot:
+                self.fill_render_snapshot()
+        super().save(*args, **kwargs)
+
+    def fill_conversation(self):
+        if self.notification_type == 'MESSAGE' and self.conversation_id is None and self.target is not None:
+            self.conversation_id = self.target.conversation_id
+
+    @property
+    def has_snapshot(self):
+        # Thông báo tạo trước khi có snapshot thì để trống các trường này
+        return bool(self.actor_name)
+
+    @cached_property
+    def render(self):
+        """
+        Dữ liệu hiển thị: đọc từ snapshot; thông báo cũ chưa có snapshot thì tính từ
+        sender/target (nên nạp trước bằng notifications.utils.prepare_for_render).
+        """
+        if not self.has_snapshot:
+            legacy = Notification(
+                sender=self.sender, notification_type=self.notification_type,
+                target_content_type_id=self.target_content_type_id, target_object_id=self.target_object_id,
+            )
+            legacy.target = self.target
+            legacy.fill_render_snapshot()
+            source = legacy
+        else:
+            source = self
+        return {
+            'actor_name': source.actor_name,
+            'avatar_url': source.actor_avatar_url,
+            'excerpt': source.excerpt,
+            'target_url': source.target_url,
+            'media_kind': source.media_kind,
+        }
+
+    def fill_render_snapshot(self):
+        """Ghi lại tên, avatar người gửi và thông tin target tại thời điểm tạo."""
+        self.set_actor(self.sender)
+        target = self.target
+        self.excerpt = ''
+        self.media_kind = ''
+        self.target_url = ''
+        if target is None:
+            return
+
+        if self.notification_type in ('ADDED_TO_GROUP', 'GROUP_INVITE_REQUEST'):
+            self.excerpt = target.name or ''
+        elif getattr(target, 'content', None):
+            self.excerpt = Truncator(target.content).words(self.EXCERPT_WORDS, truncate='')[:255]
+
+        if self.notification_type == 'MESSAGE' and target.file:
+            self.media_kind = 'image' if target.is_image else 'video' if target.is_video else 'file'
+
+        try:
+            self.target_url = self._build_target_url(target)
+        except (AttributeError, NoReverseMatch):
+            self.target_url = ''
+
+    def set_actor(self, user):
+        self.actor_name = user.username
+        self.actor_avatar_url = user.avatar.url if user.avatar else '/static/images/default.jpg'
+
+    def _build_target_url(self, target):
+        # Cùng quy tắc điều hướng với redirect_notification
+        notification_type = self.notification_type
+        if notification_type in ('MESSAGE', 'MESSAGE_REACTION'):
+            return reverse('chat:conversation_detail', kwargs={'conversation_id': target.conversation_id})
+        if notification_type == 'FRIEND_REQUEST':
+            return reverse('accounts:friend_requests')
+        if notification_type == 'FRIEND_ACCEPT':
+            return reverse('accounts:profile', kwargs={'username': target.username})
+        if notification_type in ('POST_SHARE', 'POST_REACTION', 'POST_COMMENT', 'COMMENT_REACTION'):
+            # Bình luận (trả lời bình luận, cảm xúc về bình luận) thì mở bài viết chứa nó
+            post_id = getattr(target, 'post_id', None) or target.id
+            return reverse('posts:post_detail', kwargs={'pk': post_id})
+        if notification_type == 'ADDED_TO_GROUP':
+            return reverse('chat:conversation_detail', kwargs={'conversation_id': target.id})
+        if notification_type == 'GROUP_INVITE_REQUEST':
+            return reverse('chat:manage_group', kwargs={'conversation_id': target.id})
+        return ''
+
+    @property
+    def other_actor_count(self):
+        # Số người khác ngoài sender (dùng cho "A và N người khác ...")
+        return max(self.actor_count - 1, 0)
+
+class ArchivedNotification(models.Model):
+    """
+    Thông báo đã đọc quá hạn lưu trữ, được chuyển khỏi bảng chính bởi lệnh
+    `python manage.py prune_notifications` để bảng Notification luôn gọn.
+    """
+    original_id = models.BigIntegerField(unique=True)
+    recipient = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='archived_notifications')
+    sender = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, related_name='+')
+    notification_type = models.CharField(max_length=50, choices=Notification.NOTIFICATION_TYPES)
+    timestamp = models.DateTimeField()
+    target_content_type = models.ForeignKey(ContentType, on_delete=models.SET_NULL, null=True, blank=True)
+    target_object_id = models.PositiveIntegerField(null=True, blank=True)
+    actor_count = models.PositiveIntegerField(default=1)
+    actor_name = models.CharField(max_length=150, blank=True)
+    excerpt = models.CharField(max_length=255, blank=True)
+    target_url = models.CharField(max_length=255, blank=True)
+    media_kind = models.CharField(max_length=10, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    # Các cột được sao chép nguyên từ Notification
+    COPIED_FIELDS = (
+        'recipient_id', 'sender_id', 'notification_type', 'timestamp', 'target_content_type_id',
+        'target_object_id', 'actor_count', 'actor_name', 'excerpt', 'target_url', 'media_kind',
+    )
 
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['recipient', 'timestamp'], name='archived_notif_recipient_idx'),
+        ]
+
+    def __str__(self):
+        return f"Archived notification {self.original_id} for user {self.recipient_id}"
+
+
+class OutboxEvent(models.Model):
+    """
+    Hàng đợi tác vụ phụ (gửi email, tách hashtag, gửi thông báo hàng loạt...) được ghi
+    cùng transaction với thay đổi gốc; lệnh `python manage.py process_outbox` xử lý sau.
+    """
+    STATUS_PENDING = 'PENDING'
+    STATUS_DONE = 'DONE'
+    STATUS_FAILED = 'FAILED'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Chờ xử lý'),
+        (STATUS_DONE, 'Đã xử lý'),
+        (STATUS_FAILED, 'Thất bại (hết số lần thử)'),
+    ]
+
+    topic = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # Thời điểm sớm nhất được xử lý (lùi dần khi thử lại, hoặc khi đang được một worker giữ)
+    available_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'available_at'], name='outbox_pending_idx'),
+        ]
 
     def __str__(self):
-        return f"Notification for {self.recipient.username} from {self.sender.username}"
\ No newline at end of file
+        return f"{self.topic} #{self.pk} ({self.status})"
@@ -0,0 +1,125 @@
+# notifications/outbox.py
+"""
+Transactional outbox: thay vì gửi email / tách hashtag / tạo thông báo hàng loạt ngay
+trong request, view ghi một dòng OutboxEvent trong CÙNG transaction với thay đổi gốc.
+Nếu transaction rollback thì sự kiện cũng biến mất; nếu commit thì chắc chắn sẽ được xử lý.
+
+Worker (`python manage.py process_outbox`) lấy từng lô theo cơ chế "thuê" (lease):
+dời available_at của các dòng đã nhận ra tương lai rồi mới chạy handler, nên worker
+chết giữa chừng thì hết hạn thuê dòng sẽ được xử lý lại. Handler vì thế phải idempotent.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+_handlers = {}
+
+
+def handler(topic):
+    """Đăng ký hàm xử lý cho một topic: @outbox.handler('accounts.activation_email')."""
+    def register(func):
+        _handlers[topic] = func
+        return func
+    return register
+
+
+def enqueue(topic, payload):
+    """
+    Ghi sự kiện vào outbox. Gọi bên trong transaction.atomic() cùng với thay đổi gốc.
+    payload phải serialize được thành JSON (chỉ lưu id, không lưu object).
+    """
+    event = OutboxEvent.objects.create(topic=topic, payload=payload)
+    if settings.OUTBOX_EAGER:
+        # Môi trường dev không chạy worker: xử lý ngay sau khi commit
+        transaction.on_commit(lambda: _run_now(event))
+    return event
+
+
+def _run_now(event):
+    # Thuê dòng giống claim_batch trước khi chạy: nếu process_outbox đã nhận dòng này
+    # thì câu UPDATE có điều kiện không khớp và không chạy lần hai
+    now = timezone.now()
+    leased = OutboxEvent.objects.filter(
+        pk=event.pk, status=OutboxEvent.STATUS_PENDING, available_at__lte=now,
+    ).update(
+        attempts=F('attempts') + 1,
+        available_at=now + timedelta(seconds=settings.OUTBOX_LEASE_SECONDS),
+    )
+    if not leased:
+        return
+    event.attempts += 1
+    process_events([event])
+
+
+def backoff_delay(attempts):
+    """Số giây chờ trước lần thử tiếp theo: tăng gấp đôi sau mỗi lần lỗi, có trần."""
+    return min(settings.OUTBOX_BACKOFF_BASE * 2 ** (attempts - 1), settings.OUTBOX_BACKOFF_MAX)
+
+
+def claim_batch(batch_size):
+    """Nhận tối đa batch_size sự kiện đến hạn; các worker khác bỏ qua dòng đang bị khóa."""
+    now = timezone.now()
+    with transaction.atomic():
+        events = list(
+            OutboxEvent.objects.select_for_update(skip_locked=True)
+            .filter(status=OutboxEvent.STATUS_PENDING, available_at__lte=now)
+            .order_by('available_at', 'id')[:batch_size]
+        )
+        if events:
+            OutboxEvent.objects.filter(pk__in=[event.pk for event in events]).update(
+                attempts=F('attempts') + 1,
+                available_at=now + timedelta(seconds=settings.OUTBOX_LEASE_SECONDS),
+            )
+    for event in events:
+        event.attempts += 1
+    return events
+
+
+def process_events(events):
+    """Chạy handler cho từng sự kiện; trả về (số thành công, số lỗi)."""
+    done_ids = []
+    failed = 0
+    for event in events:
+        func = _handlers.get(event.topic)
+        try:
+            if func is None:
+                raise LookupError(f"Không có handler cho topic '{event.topic}'")
+            func(event.payload)
+        except Exception as exc:
+            failed += 1
+            logger.exception("Outbox event %s (%s) lỗi ở lần thử %s", event.pk, event.topic, event.attempts)
+            _schedule_retry(event, exc)
+        else:
+            done_ids.append(event.pk)
+
+    if done_ids:
+        OutboxEvent.objects.filter(pk__in=done_ids).update(
+            status=OutboxEvent.STATUS_DONE, processed_at=timezone.now(), last_error='',
+        )
+    return len(done_ids), failed
+
+
+def _schedule_retry(event, exc):
+    fields = {'last_error': f"{type(exc).__name__}: {exc}"[:2000]}
+    if event.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+        fields['status'] = OutboxEvent.STATUS_FAILED
+        fields['processed_at'] = timezone.now()
+    else:
+        fields['available_at'] = timezone.now() + timedelta(seconds=backoff_delay(event.attempts))
+    OutboxEvent.objects.filter(pk=event.pk).update(**fields)
+
+
+def drain(batch_size=100):
+    """Xử lý một lô; trả về (số thành công, số lỗi), (0, 0) khi outbox trống."""
+    events = claim_batch(batch_size)
+    if not events:
+        return 0, 0
+    return process_events(events)
@@ -0,0 +1,29 @@
+# notifications/signals.py
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from . import events
+from .models import Notification
+from .utils import increment_unread_count, reset_unread_count
+
+
+@receiver(post_save, sender=Notification)
+def notification_saved(sender, instance, created, **kwargs):
+    recipient_id = instance.recipient_id
+    if created:
+        if not instance.is_read:
+            transaction.on_commit(lambda: increment_unread_count(recipient_id))
+    else:
+        # Có thể vừa đổi trạng thái đọc (vd. đánh dấu chưa đọc): đếm lại ở lần đọc sau
+        transaction.on_commit(lambda: reset_unread_count(recipient_id))
+    # Đợi transaction commit để luồng SSE đọc được dữ liệu mới
+    transaction.on_commit(lambda: events.publish(recipient_id))
+
+
+@receiver(post_delete, sender=Notification)
+def notification_deleted(sender, instance, **kwargs):
+    recipient_id = instance.recipient_id
+    if not instance.is_read:
+        transaction.on_commit(lambda: reset_unread_count(recipient_id))
+    transaction.on_commit(lambda: events.publish(recipient_id))
@@ -0,0 +1,171 @@
+# notifications/sse.py
+"""
+Luồng Server-Sent Events cho thông báo: /notifications/stream/
+
+Được gắn trực tiếp trong core/asgi.py (không đi qua view Django) để mỗi kết nối
+chỉ là một coroutine đang chờ, không chiếm thread. Các sự kiện gửi về:
+  - `unread`       : {"total_unread": N, "unread_conversations": M}
+  - `notification` : dữ liệu một thông báo mới hoặc vừa thay đổi (gộp thêm người thả cảm xúc,
+                     đã đọc...), giống phần tử của /notifications/api/
+và một dòng chú thích `: ping` làm heartbeat để proxy không cắt kết nối.
+
+Con trỏ là (updated_at, id) của thông báo cuối đã gửi, gửi kèm làm id sự kiện dạng "iso|id":
+thông báo gộp được cập nhật tại chỗ nên không có id mới, chỉ có updated_at mới.
+"""
+import asyncio
+import json
+import time
+from http.cookies import SimpleCookie
+from importlib import import_module
+from types import SimpleNamespace
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from . import events
+from .models import Notification
+from .utils import get_unread_count, prepare_for_render, serialize_notification
+from chat.utils import get_unread_conversation_count
+
+STREAM_PATH = '/notifications/stream/'
+HEARTBEAT_INTERVAL = 15  # giây
+VERSION_CHECK_INTERVAL = 5  # giây, để nhận thay đổi đến từ process khác
+RETRY_MS = 5000
+MAX_EVENTS_PER_PUSH = 15
+
+
+def load_user(scope):
+    """Lấy user từ cookie session giống AuthenticationMiddleware."""
+    headers = dict(scope.get('headers', []))
+    cookie = SimpleCookie()
+    cookie.load(headers.get(b'cookie', b'').decode('latin-1'))
+    morsel = cookie.get(settings.SESSION_COOKIE_NAME)
+    engine = import_module(settings.SESSION_ENGINE)
+    session = engine.SessionStore(morsel.value if morsel else None)
+    return get_user(SimpleNamespace(session=session))
+
+
+def _snapshot(user, cursor):
+    """
+    Số chưa đọc (thông báo, cuộc trò chuyện) + các thông báo thay đổi sau con trỏ (updated_at, id),
+    theo thứ tự thay đổi. Trả về kèm con trỏ mới.
+    """
+    unread = {
+        'total_unread': get_unread_count(user.id),
+        'unread_conversations': get_unread_conversation_count(user.id),
+    }
+    queryset = Notification.objects.filter(recipient=user)
+    if cursor is not None:
+        updated_at, last_id = cursor
+        queryset = queryset.filter(Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, id__gt=last_id))
+    changed = prepare_for_render(queryset.order_by('updated_at', 'id')[:MAX_EVENTS_PER_PUSH])
+    events_data = [
+        (_event_id(n.updated_at, n.id), serialize_notification(n)) for n in changed
+    ]
+    if changed:
+        cursor = (changed[-1].updated_at, changed[-1].id)
+    return unread, events_data, cursor
+
+
+def _event_id(updated_at, notification_id):
+    return f"{updated_at.isoformat()}|{notification_id}"
+
+
+def _parse_cursor(user, last_event_id):
+    """
+    Last-Event-ID dạng "iso|id"; id số thuần từ phiên bản cũ được quy về updated_at của dòng đó.
+    Không có (kết nối mới) hoặc không hợp lệ thì bắt đầu từ thay đổi mới nhất hiện tại.
+    """
+    if '|' in last_event_id:
+        raw_time, _, raw_id = last_event_id.rpartition('|')
+        try:
+            updated_at = parse_datetime(raw_time)
+        except ValueError:
+            updated_at = None
+        if updated_at is not None and raw_id.isdigit():
+            return updated_at, int(raw_id)
+    elif last_event_id.isdigit():
+        updated_at = Notification.objects.filter(
+            recipient=user, id=int(last_event_id),
+        ).values_list('updated_at', flat=True).first()
+        if updated_at is not None:
+            return updated_at, int(last_event_id)
+    return Notification.objects.filter(recipient=user).order_by(
+        '-updated_at', '-id',
+    ).values_list('updated_at', 'id').first()
+
+
+def _format_event(event, data, event_id=None):
+    lines = [f"event: {event}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False)}")
+    return ("\n".join(lines) + "\n\n").encode('utf-8')
+
+
+async def notification_stream(scope, receive, send):
+    user = await sync_to_async(load_user)(scope)
+    if not user.is_authenticated:
+        await send({'type': 'http.response.start', 'status': 403, 'headers': [(b'content-type', b'text/plain')]})
+        await send({'type': 'http.response.body', 'body': b'Forbidden'})
+        return
+
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [
+            (b'content-type', b'text/event-stream; charset=utf-8'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),  # Tắt buffer của nginx
+        ],
+    })
+
+    # Trình duyệt tự gửi lại Last-Event-ID khi kết nối lại, nhờ đó không mất thông báo
+    headers = dict(scope.get('headers', []))
+    last_event_id = headers.get(b'last-event-id', b'').decode()
+    cursor = await sync_to_async(_parse_cursor)(user, last_event_id)
+
+    wakeup = events.subscribe(user.id)
+    disconnected = asyncio.Event()
+
+    async def watch_disconnect():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+        disconnected.set()
+        wakeup.set()
+
+    watcher = asyncio.ensure_future(watch_disconnect())
+    try:
+        await send({'type': 'http.response.body', 'body': f"retry: {RETRY_MS}\n\n".encode(), 'more_body': True})
+        seen_version = None
+        last_sent = time.monotonic()
+        while not disconnected.is_set():
+            # Xóa cờ trước khi đọc phiên bản để không bỏ lỡ publish xảy ra giữa chừng
+            wakeup.clear()
+            version = await sync_to_async(events.get_version)(user.id)
+            if version != seen_version:
+                seen_version = version
+                unread, changed, cursor = await sync_to_async(_snapshot)(user, cursor)
+                body = b''.join(
+                    _format_event('notification', data, event_id=event_id) for event_id, data in changed
+                ) + _format_event('unread', unread)
+                if len(changed) == MAX_EVENTS_PER_PUSH:
+                    seen_version = None  # Còn thông báo mới: lấy tiếp ở vòng sau
+                await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+                last_sent = time.monotonic()
+            elif time.monotonic() - last_sent >= HEARTBEAT_INTERVAL:
+                await send({'type': 'http.response.body', 'body': b': ping\n\n', 'more_body': True})
+                last_sent = time.monotonic()
+
+            if seen_version is None:
+                continue
+            try:
+                await asyncio.wait_for(wakeup.wait(), timeout=VERSION_CHECK_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        events.unsubscribe(user.id, wakeup)
+        watcher.cancel()
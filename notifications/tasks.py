@@ -0,0 +1,23 @@
+# notifications/tasks.py
+# Handler outbox của app notifications (được nạp trong NotificationsConfig.ready)
+
+from django.db import transaction
+from . import outbox
+from .models import Notification
+from .utils import _create_notifications
+
+
+@outbox.handler('notifications.fanout')
+def fanout_notifications(payload):
+    fields = payload['fields']
+    recipient_ids = payload['recipient_ids']
+    with transaction.atomic():
+        # Lần thử lại sau khi đã ghi thành công một phần thì bỏ qua người đã nhận
+        already = set(Notification.objects.filter(
+            recipient_id__in=recipient_ids,
+            sender_id=fields['sender_id'],
+            notification_type=fields['notification_type'],
+            target_content_type_id=fields['target_content_type_id'],
+            target_object_id=fields['target_object_id'],
+        ).values_list('recipient_id', flat=True))
+        _create_notifications([user_id for user_id in recipient_ids if user_id not in already], fields)
@@ -1,3 +1,452 @@
-from django.test import TestCase
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models.query import QuerySet
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from accounts.models import User
+from chat.models import Conversation, Message
+from chat.utils import get_or_create_private_conversation
+from posts.models import Comment, Post, Reaction
+from . import events, outbox, sse
+from .models import Notification, OutboxEvent
+from .utils import (
+    dispatch_notifications, get_unread_count, increment_unread_count, notify_reaction, prefetch_generic_targets,
+    withdraw_reaction,
+)
+
+
+class UnreadCountTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.recipient = User.objects.create_user('recipient', password='x')
+        self.sender = User.objects.create_user('sender', password='x')
+        Notification.objects.create(recipient=self.recipient, sender=self.sender, notification_type='FRIEND_REQUEST')
+
+    def test_process_local_cache_always_counts_in_db(self):
+        self.assertEqual(get_unread_count(self.recipient.id), 1)
+        # Thay đổi từ process khác không đi qua cache của process này
+        Notification.objects.filter(recipient=self.recipient).update(is_read=True)
+        self.assertEqual(get_unread_count(self.recipient.id), 0)
+
+    def test_shared_cache_counter_expires(self):
+        with mock.patch('notifications.utils.is_shared_cache', return_value=True), \
+                mock.patch.object(cache, 'add', wraps=cache.add) as add:
+            self.assertEqual(get_unread_count(self.recipient.id), 1)
+            increment_unread_count(self.recipient.id)
+            self.assertEqual(get_unread_count(self.recipient.id), 2)
+        self.assertIsNotNone(add.call_args.kwargs['timeout'])
+
+
+class NotificationStreamCursorTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.recipient = User.objects.create_user('recipient', password='x')
+        self.sender = User.objects.create_user('sender', password='x')
+        self.notification = Notification.objects.create(
+            recipient=self.recipient, sender=self.sender, notification_type='POST_REACTION',
+        )
+
+    def test_updated_aggregate_is_sent_again(self):
+        cursor = sse._parse_cursor(self.recipient, '')
+        _, changed, cursor = sse._snapshot(self.recipient, cursor)
+        self.assertEqual(changed, [])
+
+        # Gộp thêm người thả cảm xúc: cùng id, chỉ updated_at đổi
+        self.notification.actor_count = 2
+        self.notification.save()
+        _, changed, new_cursor = sse._snapshot(self.recipient, cursor)
+        self.assertEqual([data['id'] for _, data in changed], [self.notification.id])
+        self.assertEqual(changed[0][0], sse._event_id(self.notification.updated_at, self.notification.id))
+        self.assertEqual(sse._parse_cursor(self.recipient, changed[0][0]), new_cursor)
+
+    def test_legacy_numeric_last_event_id(self):
+        cursor = sse._parse_cursor(self.recipient, str(self.notification.id))
+        self.assertEqual(cursor, (self.notification.updated_at, self.notification.id))
+
+    def test_version_sees_changes_from_other_processes(self):
+        version = events.get_version(self.recipient.id)
+        # Đổi trực tiếp trong DB, không gọi publish (như một worker khác với cache riêng)
+        Notification.objects.filter(pk=self.notification.pk).update(is_read=True)
+        self.assertNotEqual(events.get_version(self.recipient.id), version)
+
+
+@override_settings(OUTBOX_EAGER=True)
+class OutboxEagerTests(TestCase):
+    def setUp(self):
+        self.calls = []
+        outbox._handlers['tests.record'] = self.calls.append
+        self.addCleanup(outbox._handlers.pop, 'tests.record')
+
+    def test_runs_once_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            event = outbox.enqueue('tests.record', {'n': 1})
+        self.assertEqual(self.calls, [{'n': 1}])
+        event.refresh_from_db()
+        self.assertEqual((event.status, event.attempts), (OutboxEvent.STATUS_DONE, 1))
+
+    def test_skips_event_leased_by_worker(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            outbox.enqueue('tests.record', {'n': 1})
+        # process_outbox nhận dòng trước khi callback sau commit kịp chạy
+        self.assertEqual(len(outbox.claim_batch(10)), 1)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.calls, [])
+
+
+class ReactionAggregationTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('author', password='x')
+        self.first = User.objects.create_user('first', password='x')
+        self.second = User.objects.create_user('second', password='x')
+        self.post = Post.objects.create(author=self.author, content='hello')
+
+    def react(self, user):
+        Reaction.objects.create(user=user, post=self.post, reaction_type='LIKE')
+        return notify_reaction(self.author, user, 'POST_REACTION', self.post)
+
+    def test_concurrent_first_reactions_share_one_row(self):
+        self.react(self.first)
+        Reaction.objects.create(user=self.second, post=self.post, reaction_type='LIKE')
+        # Request song song chưa thấy dòng của bên kia lúc tra cứu: create đụng unique constraint
+        with mock.patch.object(QuerySet, 'first', return_value=None):
+            notify_reaction(self.author, self.second, 'POST_REACTION', self.post)
+        notification = Notification.objects.get()
+        self.assertEqual((notification.sender, notification.actor_count), (self.second, 2))
+        self.assertEqual(notification.recent_actor_ids, [self.second.id, self.first.id])
+
+    def test_withdraw_moves_sender_and_recounts(self):
+        self.react(self.first)
+        self.react(self.second)
+        Reaction.objects.filter(user=self.second).delete()
+        withdraw_reaction(self.author, self.second, 'POST_REACTION', self.post)
+        notification = Notification.objects.get()
+        self.assertEqual((notification.sender, notification.actor_count), (self.first, 1))
+        self.assertEqual(notification.recent_actor_ids, [self.first.id])
+        self.assertEqual(notification.actor_name, 'first')
+
+    def test_withdraw_last_reaction_removes_notification(self):
+        self.react(self.first)
+        Reaction.objects.filter(user=self.first).delete()
+        withdraw_reaction(self.author, self.first, 'POST_REACTION', self.post)
+        self.assertFalse(Notification.objects.exists())
+        self.assertEqual(get_unread_count(self.author.id), 0)
+
+
+class SweepOrphansTests(TestCase):
+    def test_deletes_only_rows_whose_target_is_missing(self):
+        recipient = User.objects.create_user('recipient', password='x')
+        sender = User.objects.create_user('sender', password='x')
+        live = Post.objects.create(author=recipient, content='live')
+        gone = Post.objects.create(author=recipient, content='gone')
+        post_type = ContentType.objects.get_for_model(Post)
+        kept = Notification.objects.create(
+            recipient=recipient, sender=sender, notification_type='POST_SHARE', target=live,
+        )
+        orphan = Notification.objects.create(
+            recipient=recipient, sender=sender, notification_type='POST_SHARE', target=gone,
+        )
+        without_target = Notification.objects.create(
+            recipient=recipient, sender=sender, notification_type='POST_SHARE', target_content_type=post_type,
+        )
+        Post.objects.filter(pk=gone.pk).delete()
+
+        call_command('sweep_orphans', stdout=StringIO())
+        self.assertQuerySetEqual(
+            Notification.objects.order_by('pk').values_list('pk', flat=True), [kept.pk, without_target.pk],
+        )
+        self.assertFalse(Notification.objects.filter(pk=orphan.pk).exists())
+
+
+@override_settings(OUTBOX_BACKOFF_BASE=5, OUTBOX_BACKOFF_MAX=3600, OUTBOX_MAX_ATTEMPTS=3, OUTBOX_LEASE_SECONDS=300)
+class OutboxWorkerTests(TestCase):
+    def setUp(self):
+        self.calls = []
+        self.failures = 0
+
+        def flaky(payload):
+            self.calls.append(payload)
+            if self.failures:
+                self.failures -= 1
+                raise RuntimeError('boom')
+
+        outbox._handlers['tests.flaky'] = flaky
+        self.addCleanup(outbox._handlers.pop, 'tests.flaky')
+
+    def expire(self, event):
+        # Giả lập thời gian trôi qua: hết hạn chờ / hết hạn thuê
+        OutboxEvent.objects.filter(pk=event.pk).update(available_at=timezone.now() - timedelta(seconds=1))
+
+    def test_backoff_doubles_up_to_cap(self):
+        self.assertEqual([outbox.backoff_delay(n) for n in (1, 2, 3)], [5, 10, 20])
+        self.assertEqual(outbox.backoff_delay(20), 3600)
+
+    def test_failed_event_is_retried_after_backoff(self):
+        self.failures = 1
+        event = outbox.enqueue('tests.flaky', {'n': 1})
+        started = timezone.now()
+
+        self.assertEqual(outbox.drain(), (0, 1))
+        event.refresh_from_db()
+        self.assertEqual((event.status, event.attempts), (OutboxEvent.STATUS_PENDING, 1))
+        self.assertIn('RuntimeError: boom', event.last_error)
+        self.assertGreaterEqual(event.available_at, started + timedelta(seconds=5))
+        self.assertEqual(outbox.drain(), (0, 0))  # Chưa tới hạn thử lại
+
+        self.expire(event)
+        self.assertEqual(outbox.drain(), (1, 0))
+        event.refresh_from_db()
+        self.assertEqual((event.status, event.attempts, event.last_error), (OutboxEvent.STATUS_DONE, 2, ''))
+        self.assertEqual(len(self.calls), 2)
+
+    def test_gives_up_after_max_attempts(self):
+        self.failures = 10
+        event = outbox.enqueue('tests.flaky', {'n': 1})
+        for _ in range(3):
+            self.expire(event)
+            outbox.drain()
+        event.refresh_from_db()
+        self.assertEqual((event.status, event.attempts), (OutboxEvent.STATUS_FAILED, 3))
+        self.expire(event)
+        self.assertEqual(outbox.drain(), (0, 0))
+
+    def test_expired_lease_is_claimed_again(self):
+        event = outbox.enqueue('tests.flaky', {'n': 1})
+        self.assertEqual(len(outbox.claim_batch(10)), 1)
+        # Worker chết sau khi nhận lô: dòng bị giữ tới khi hết hạn thuê
+        self.assertEqual(outbox.claim_batch(10), [])
+
+        self.expire(event)
+        self.assertEqual(outbox.drain(), (1, 0))
+        event.refresh_from_db()
+        self.assertEqual((event.status, event.attempts), (OutboxEvent.STATUS_DONE, 2))
+
+
+class NotificationApiSinceTests(TestCase):
+    def setUp(self):
+        self.recipient = User.objects.create_user('recipient', password='x')
+        self.sender = User.objects.create_user('sender', password='x')
+        Notification.objects.create(recipient=self.recipient, sender=self.sender, notification_type='FRIEND_REQUEST')
+        self.client.force_login(self.recipient)
+
+    def fetch(self, **params):
+        return self.client.get(reverse('notifications:get_notifications'), params)
+
+    def test_since_returns_only_later_changes(self):
+        cursor = self.fetch().json()['cursor']
+        self.assertEqual(self.fetch(since=cursor).json()['notifications'], [])
+        Notification.objects.create(recipient=self.recipient, sender=self.sender, notification_type='FRIEND_ACCEPT')
+        self.assertEqual(len(self.fetch(since=cursor).json()['notifications']), 1)
+
+    def test_since_pages_changes_oldest_first(self):
+        cursor = self.fetch().json()['cursor']
+        Notification.objects.bulk_create([
+            Notification(recipient=self.recipient, sender=self.sender, notification_type='FRIEND_ACCEPT')
+            for _ in range(20)
+        ])
+        # Cùng updated_at (như sau một lần "đánh dấu tất cả đã đọc"): ranh giới trang rơi giữa các dòng trùng
+        changed = Notification.objects.filter(notification_type='FRIEND_ACCEPT')
+        changed.update(updated_at=timezone.now())
+
+        first = self.fetch(since=cursor).json()
+        self.assertEqual(len(first['notifications']), 15)
+        self.assertTrue(first['has_more'])
+        second = self.fetch(since=first['cursor']).json()
+        self.assertEqual(len(second['notifications']), 5)
+        self.assertFalse(second['has_more'])
+
+        delivered = [n['id'] for n in first['notifications'] + second['notifications']]
+        self.assertCountEqual(delivered, changed.values_list('id', flat=True))
+        self.assertEqual(self.fetch(since=second['cursor']).json()['notifications'], [])
+
+    def test_rejects_invalid_since(self):
+        for since in ('garbage', '2026-13-45T00:00:00', '2026-01-01T00:00:00|abc'):
+            with self.subTest(since=since):
+                self.assertEqual(self.fetch(since=since).status_code, 400)
+
+
+class NotificationListCursorTests(TestCase):
+    def setUp(self):
+        self.recipient = User.objects.create_user('recipient', password='x')
+        self.sender = User.objects.create_user('sender', password='x')
+        self.client.force_login(self.recipient)
+
+    def test_before_cursor_walks_pages(self):
+        Notification.objects.bulk_create([
+            Notification(recipient=self.recipient, sender=self.sender, notification_type='FRIEND_REQUEST')
+            for _ in range(25)
+        ])
+        url = reverse('notifications:notification_list')
+        first = self.client.get(url).context
+        self.assertEqual(len(first['notifications']), 20)
+        self.assertIsNotNone(first['next_cursor'])
+
+        second = self.client.get(url, {'before': first['next_cursor']}).context
+        self.assertEqual(len(second['notifications']), 5)
+        self.assertIsNone(second['next_cursor'])
+        seen = {n.id for n in first['notifications']} | {n.id for n in second['notifications']}
+        self.assertEqual(len(seen), 25)
+
+    def test_invalid_before_redirects_to_first_page(self):
+        url = reverse('notifications:notification_list')
+        for before in ('garbage', '2026-01-01T00:00:00|abc', '2026-13-45T00:00:00|1'):
+            with self.subTest(before=before):
+                self.assertRedirects(self.client.get(url, {'before': before}), url)
+
+
+@override_settings(NOTIFICATION_FANOUT_CHUNK_SIZE=2, NOTIFICATION_FANOUT_DEFER_THRESHOLD=5)
+class DispatchNotificationsTests(TestCase):
+    def setUp(self):
+        self.sender = User.objects.create_user('sender', password='x')
+        self.post = Post.objects.create(author=self.sender, content='post')
+        OutboxEvent.objects.all().delete()  # Sự kiện tách hashtag của bài viết
+
+    def recipients(self, count):
+        return [User.objects.create_user(f'member{i}', password='x') for i in range(count)]
+
+    def rows(self):
+        return list(Notification.objects.order_by('recipient_id').values_list('recipient_id', flat=True))
+
+    def test_inline_branch_inserts_in_chunks(self):
+        members = self.recipients(4)
+        # Người gửi và người trùng bị loại
+        recipients = members + [members[0], self.sender]
+        with CaptureQueriesContext(connection) as queries:
+            dispatch_notifications(recipients, self.sender, 'POST_SHARE', self.post)
+        inserts = [
+            q for q in queries.captured_queries
+            if q['sql'].startswith('INSERT') and Notification._meta.db_table in q['sql'].split('(')[0]
+        ]
+        self.assertEqual(len(inserts), 2)
+        self.assertEqual(self.rows(), [member.id for member in members])
+        self.assertFalse(OutboxEvent.objects.exists())
+        self.assertEqual(Notification.objects.first().actor_name, self.sender.username)
+
+    def test_deferred_branch_at_threshold_is_idempotent(self):
+        members = self.recipients(5)
+        dispatch_notifications(User.objects.filter(id__in=[m.id for m in members]), self.sender, 'POST_SHARE', self.post)
+        self.assertEqual(self.rows(), [])
+        event = OutboxEvent.objects.get(topic='notifications.fanout')
+
+        self.assertEqual(outbox.drain(), (1, 0))
+        self.assertEqual(self.rows(), [member.id for member in members])
+
+        # Thử lại sau khi đã ghi một phần (worker chết giữa chừng): chỉ bù người còn thiếu
+        Notification.objects.filter(recipient=members[-1]).delete()
+        self.assertEqual(outbox.process_events([event]), (1, 0))
+        self.assertEqual(outbox.process_events([event]), (1, 0))
+        self.assertEqual(self.rows(), [member.id for member in members])
+
+
+class PrefetchGenericTargetsTests(TestCase):
+    def setUp(self):
+        self.recipient = User.objects.create_user('recipient', password='x')
+        self.sender = User.objects.create_user('sender', password='x')
+        # Nạp sẵn cache ContentType để chỉ đếm truy vấn lấy target
+        ContentType.objects.get_for_models(Post, Comment)
+
+    def notify(self, count):
+        for i in range(count):
+            post = Post.objects.create(author=self.recipient, content=f'p{i}')
+            comment = Comment.objects.create(post=post, author=self.sender, content=f'c{i}')
+            for target in (post, comment):
+                Notification.objects.create(
+                    recipient=self.recipient, sender=self.sender, notification_type='POST_COMMENT', target=target,
+                )
+
+    def load(self):
+        rows = list(Notification.objects.order_by('id'))
+        with self.assertNumQueries(2):  # Một truy vấn cho mỗi content type
+            prefetch_generic_targets(rows)
+        with self.assertNumQueries(0):
+            return [row.target for row in rows]
+
+    def test_query_count_is_constant(self):
+        self.notify(2)
+        self.assertEqual(len(self.load()), 4)
+        self.notify(10)
+        targets = self.load()
+        self.assertEqual(len(targets), 24)
+        self.assertEqual({type(target) for target in targets}, {Post, Comment})
+
+    def test_deleted_targets_become_none(self):
+        self.notify(2)
+        Comment.objects.filter(content='c0').delete()
+        targets = self.load()
+        self.assertEqual(sum(target is None for target in targets), 1)
+        self.assertEqual([target.content for target in targets if target is not None], ['p0', 'p1', 'c1'])
+
+
+class RenderSnapshotTests(TestCase):
+    def setUp(self):
+        self.recipient = User.objects.create_user('recipient', password='x')
+        self.sender = User.objects.create_user('sender', password='x')
+        self.client.force_login(self.recipient)
+
+    def descriptions(self):
+        data = self.client.get(reverse('notifications:get_notifications')).json()
+        return [item['type'] for item in data['notifications']]
+
+    def test_uses_snapshot_after_post_is_edited_or_deleted(self):
+        post = Post.objects.create(author=self.recipient, content='Bài viết gốc')
+        Notification.objects.create(recipient=self.recipient, sender=self.sender, notification_type='POST_COMMENT', target=post)
+        expected = self.descriptions()
+        self.assertIn('Bài viết gốc', expected[0])
+
+        post.content = 'Nội dung đã sửa'
+        post.save()
+        self.assertEqual(self.descriptions(), expected)
+        post.delete()
+        self.assertEqual(self.descriptions(), expected)
+
+    def test_uses_snapshot_after_group_is_renamed_or_deleted(self):
+        group = Conversation.objects.create(type='GROUP', name='Nhóm cũ', admin=self.sender)
+        Notification.objects.create(recipient=self.recipient, sender=self.sender, notification_type='ADDED_TO_GROUP', target=group)
+        self.assertIn('Nhóm cũ', self.descriptions()[0])
+
+        group.name = 'Nhóm mới'
+        group.save()
+        self.assertIn('Nhóm cũ', self.descriptions()[0])
+        group.delete()
+        self.assertIn('Nhóm cũ', self.descriptions()[0])
+
+
+class MessageNotificationReadTests(TestCase):
+    def setUp(self):
+        self.recipient = User.objects.create_user('recipient', password='x')
+        self.alice = User.objects.create_user('alice', password='x')
+        self.bob = User.objects.create_user('bob', password='x')
+        self.with_alice, _ = get_or_create_private_conversation(self.recipient, self.alice)
+        self.with_bob, _ = get_or_create_private_conversation(self.recipient, self.bob)
+        self.client.force_login(self.recipient)
+
+    def notify_message(self, conversation, sender):
+        message = Message.objects.create(conversation=conversation, sender=sender, text='hi')
+        return Notification.objects.create(
+            recipient=self.recipient, sender=sender, notification_type='MESSAGE', target=message,
+        )
+
+    def test_opening_message_marks_only_that_conversation_read(self):
+        from_alice = [self.notify_message(self.with_alice, self.alice) for _ in range(2)]
+        from_bob = self.notify_message(self.with_bob, self.bob)
+        friend_request = Notification.objects.create(
+            recipient=self.recipient, sender=self.alice, notification_type='FRIEND_REQUEST',
+        )
+        self.assertEqual(from_alice[0].conversation_id, self.with_alice.id)
+
+        response = self.client.get(reverse('notifications:redirect', args=[from_alice[0].id]))
+        self.assertRedirects(
+            response, reverse('chat:conversation_detail', kwargs={'conversation_id': self.with_alice.id}),
+            fetch_redirect_response=False,
+        )
+        unread = set(Notification.objects.filter(is_read=False).values_list('id', flat=True))
+        self.assertEqual(unread, {from_bob.id, friend_request.id})
+        self.assertEqual(get_unread_count(self.recipient.id), 2)
@@ -0,0 +1,327 @@
+# notifications/utils.py
+
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import prefetch_related_objects
+from django.template.defaultfilters import truncatewords
+from django.urls import reverse
+from django.utils import timezone
+from core.cache import is_shared_cache
+from . import events, outbox
+from .models import Notification
+
+
+def prefetch_generic_targets(rows, field_name='target', related=None):
+    """
+    Nạp target (GenericForeignKey) cho cả danh sách bản ghi: mỗi content type một truy vấn
+    thay vì mỗi dòng một truy vấn. Target đã bị xóa được gán None nên truy cập sau đó
+    không chạm DB nữa.
+    `related`: {Model: ('field', ...)} để select_related kèm theo target của model đó.
+    Trả về chính danh sách `rows`.
+    """
+    rows = list(rows)
+    if not rows:
+        return rows
+    gfk = rows[0]._meta.get_field(field_name)
+    ct_attname = rows[0]._meta.get_field(gfk.ct_field).attname
+
+    ids_by_content_type = defaultdict(set)
+    for row in rows:
+        content_type_id = getattr(row, ct_attname)
+        object_id = getattr(row, gfk.fk_field)
+        if content_type_id is not None and object_id is not None:
+            ids_by_content_type[content_type_id].add(object_id)
+
+    targets = {}
+    for content_type_id, object_ids in ids_by_content_type.items():
+        model = ContentType.objects.get_for_id(content_type_id).model_class()
+        if model is None:
+            continue
+        queryset = model._default_manager.all()
+        if related and model in related:
+            queryset = queryset.select_related(*related[model])
+        for obj in queryset.filter(pk__in=object_ids):
+            targets[(content_type_id, obj.pk)] = obj
+
+    for row in rows:
+        key = (getattr(row, ct_attname), getattr(row, gfk.fk_field))
+        gfk.set_cached_value(row, targets.get(key))
+    return rows
+
+
+def _unread_key(user_id):
+    return f"notifications:unread:{user_id}"
+
+
+def get_unread_count(user_id):
+    """
+    Số thông báo chưa đọc. Với cache dùng chung (Redis/Memcached) đọc bộ đếm trong cache, hết hạn
+    sau NOTIFICATION_UNREAD_CACHE_TTL giây nên lệch do mất sự kiện cũng tự sửa; cache riêng từng
+    process không thấy thay đổi từ worker khác nên luôn đếm trong DB (chỉ mục recipient, is_read).
+    """
+    if not is_shared_cache():
+        return Notification.objects.filter(recipient_id=user_id, is_read=False).count()
+    key = _unread_key(user_id)
+    count = cache.get(key)
+    if count is None:
+        count = Notification.objects.filter(recipient_id=user_id, is_read=False).count()
+        cache.add(key, count, timeout=settings.NOTIFICATION_UNREAD_CACHE_TTL)
+    return count
+
+
+def increment_unread_count(user_id):
+    if not is_shared_cache():
+        return
+    try:
+        cache.incr(_unread_key(user_id))
+    except ValueError:
+        # Chưa có bộ đếm: để lần đọc sau đếm lại từ DB
+        pass
+
+
+def reset_unread_count(user_id, value=None):
+    """Đặt lại bộ đếm: `value` là số chính xác đã biết, None để lần đọc sau đếm lại."""
+    if not is_shared_cache():
+        return
+    if value is None:
+        cache.delete(_unread_key(user_id))
+    else:
+        cache.set(_unread_key(user_id), value, timeout=settings.NOTIFICATION_UNREAD_CACHE_TTL)
+
+
+def dispatch_notifications(recipients, sender, notification_type, target=None, defer=None):
+    """
+    Gửi cùng một thông báo cho nhiều người: bulk_create theo lô thay vì mỗi người một INSERT.
+    `recipients` là QuerySet user, danh sách user hoặc danh sách id; người gửi tự động bị loại.
+    `defer=None` để tự chọn: từ NOTIFICATION_FANOUT_DEFER_THRESHOLD người nhận trở lên
+    thì chỉ ghi một sự kiện outbox (cùng transaction hiện tại), worker process_outbox tạo sau.
+    """
+    if hasattr(recipients, 'values_list'):
+        recipient_ids = list(recipients.values_list('id', flat=True))
+    else:
+        recipient_ids = [getattr(recipient, 'pk', recipient) for recipient in recipients]
+    recipient_ids = [user_id for user_id in dict.fromkeys(recipient_ids) if user_id != sender.id]
+    if not recipient_ids:
+        return
+
+    # Snapshot hiển thị giống nhau cho mọi người nhận: tính một lần
+    template = Notification(
+        sender=sender,
+        notification_type=notification_type,
+        target_content_type=ContentType.objects.get_for_model(target) if target is not None else None,
+        target_object_id=target.pk if target is not None else None,
+    )
+    if target is not None:
+        template.target = target
+    template.fill_conversation()
+    template.fill_render_snapshot()
+    fields = {
+        field: getattr(template, field) for field in (
+            'sender_id', 'notification_type', 'target_content_type_id', 'target_object_id', 'conversation_id',
+            'actor_name', 'actor_avatar_url', 'excerpt', 'target_url', 'media_kind',
+        )
+    }
+
+    if defer is None:
+        defer = len(recipient_ids) >= settings.NOTIFICATION_FANOUT_DEFER_THRESHOLD
+    if defer:
+        outbox.enqueue('notifications.fanout', {'recipient_ids': recipient_ids, 'fields': fields})
+    else:
+        _create_notifications(recipient_ids, fields)
+
+
+def _create_notifications(recipient_ids, fields):
+    chunk_size = settings.NOTIFICATION_FANOUT_CHUNK_SIZE
+    for start in range(0, len(recipient_ids), chunk_size):
+        chunk = recipient_ids[start:start + chunk_size]
+        Notification.objects.bulk_create([Notification(recipient_id=user_id, **fields) for user_id in chunk])
+
+    # bulk_create không phát post_save: tự cập nhật bộ đếm chưa đọc và báo cho luồng SSE
+    def after_commit():
+        for user_id in recipient_ids:
+            increment_unread_count(user_id)
+            events.publish(user_id)
+    transaction.on_commit(after_commit)
+
+
+def _aggregate_key(recipient, notification_type, target):
+    return {
+        'recipient': recipient,
+        'notification_type': notification_type,
+        'target_content_type': ContentType.objects.get_for_model(target),
+        'aggregate_object_id': target.pk,
+    }
+
+
+def notify_reaction(recipient, actor, notification_type, target):
+    """
+    Tạo hoặc cập nhật (upsert) thông báo cảm xúc đã gộp cho `target`.
+    Mỗi (người nhận, đối tượng, loại) chỉ có một dòng: "A và 12 người khác đã bày tỏ cảm xúc...".
+    Hai lượt thả cảm xúc đầu tiên chạy song song: unique_reaction_aggregate chỉ cho một bên tạo,
+    bên kia bắt IntegrityError rồi khóa và cập nhật dòng vừa được tạo.
+    """
+    if recipient == actor:
+        return None
+
+    key = _aggregate_key(recipient, notification_type, target)
+    # Đếm số người đang thả cảm xúc (không tính chính chủ) thay vì cộng dồn,
+    # nên việc đổi loại cảm xúc hay bỏ rồi thả lại không làm sai số
+    actor_count = max(target.reactions.exclude(user=recipient).count(), 1)
+
+    with transaction.atomic():
+        notification = Notification.objects.select_for_update().filter(**key).first()
+
+        if notification is None:
+            try:
+                with transaction.atomic():
+                    return Notification.objects.create(
+                        sender=actor,
+                        target=target,
+                        actor_count=actor_count,
+                        recent_actor_ids=[actor.id],
+                        **key,
+                    )
+            except IntegrityError:
+                notification = Notification.objects.select_for_update().get(**key)
+
+        recent_actor_ids = [actor.id] + [
+            user_id for user_id in notification.recent_actor_ids if user_id != actor.id
+        ]
+        update_fields = {
+            'sender': actor,
+            'actor_count': actor_count,
+            'recent_actor_ids': recent_actor_ids[:Notification.RECENT_ACTORS_LIMIT],
+            'updated_at': timezone.now(),
+        }
+        # Cập nhật snapshot người tương tác gần nhất
+        notification.set_actor(actor)
+        update_fields['actor_name'] = notification.actor_name
+        update_fields['actor_avatar_url'] = notification.actor_avatar_url
+        # Chỉ báo lại (chưa đọc + đưa lên đầu) khi có người mới tương tác,
+        # người vừa tương tác gần nhất đổi loại cảm xúc thì không làm phiền thêm
+        if notification.sender_id != actor.id:
+            update_fields['is_read'] = False
+            update_fields['timestamp'] = timezone.now()
+
+        Notification.objects.filter(pk=notification.pk).update(**update_fields)
+        if notification.is_read and not update_fields.get('is_read', True):
+            transaction.on_commit(lambda: increment_unread_count(recipient.id))
+        transaction.on_commit(lambda: events.publish(recipient.id))
+        return notification
+
+
+def withdraw_reaction(recipient, actor, notification_type, target):
+    """
+    `actor` vừa bỏ cảm xúc khỏi `target`: đếm lại actor_count, bỏ actor khỏi recent_actor_ids và
+    chuyển sender sang người còn thả cảm xúc gần nhất; không còn ai thì xóa thông báo gộp.
+    Gọi sau khi Reaction đã bị xóa. Không đổi trạng thái đọc hay thứ tự của thông báo.
+    """
+    if recipient == actor:
+        return None
+
+    key = _aggregate_key(recipient, notification_type, target)
+    reactions = target.reactions.exclude(user=recipient)
+
+    with transaction.atomic():
+        notification = Notification.objects.select_for_update().filter(**key).first()
+        if notification is None:
+            return None
+        actor_count = reactions.count()
+        if actor_count == 0:
+            # post_delete (notifications/signals.py) đặt lại badge và báo cho luồng SSE
+            notification.delete()
+            return None
+
+        update_fields = {
+            'actor_count': actor_count,
+            'recent_actor_ids': [user_id for user_id in notification.recent_actor_ids if user_id != actor.id],
+            'updated_at': timezone.now(),
+        }
+        if notification.sender_id == actor.id:
+            latest = reactions.select_related('user').order_by('-id').first()
+            notification.set_actor(latest.user)
+            update_fields['sender'] = latest.user
+            update_fields['actor_name'] = notification.actor_name
+            update_fields['actor_avatar_url'] = notification.actor_avatar_url
+            update_fields['recent_actor_ids'] = [latest.user_id] + [
+                user_id for user_id in update_fields['recent_actor_ids'] if user_id != latest.user_id
+            ][:Notification.RECENT_ACTORS_LIMIT - 1]
+
+        Notification.objects.filter(pk=notification.pk).update(**update_fields)
+        transaction.on_commit(lambda: events.publish(recipient.id))
+        return notification
+
+
+def describe_notification(n):
+    """Câu mô tả đứng sau tên người gửi, dùng chung cho API danh sách và luồng SSE."""
+    excerpt, media_kind = n.render['excerpt'], n.render['media_kind']
+    if n.notification_type == 'MESSAGE':
+        if media_kind == 'image': return "đã gửi cho bạn một hình ảnh."
+        if media_kind == 'video': return "đã gửi cho bạn một video."
+        if media_kind == 'file': return "đã gửi cho bạn một tập tin."
+        return "đã gửi cho bạn một tin nhắn mới."
+
+    notif_text = ""
+    target_content = truncatewords(excerpt, 7)
+    group_name = excerpt or "Nhóm chưa đặt tên"
+
+    if n.notification_type == 'FRIEND_REQUEST':
+        notif_text = "đã gửi cho bạn một lời mời kết bạn."
+    elif n.notification_type == 'FRIEND_ACCEPT':
+        notif_text = "đã chấp nhận lời mời kết bạn của bạn."
+    elif n.notification_type == 'POST_REACTION':
+        notif_text = f"đã bày tỏ cảm xúc về bài viết của bạn: \"{target_content}...\""
+    elif n.notification_type == 'POST_COMMENT':
+        notif_text = f"đã bình luận về bài viết của bạn: \"{target_content}...\""
+    elif n.notification_type == 'COMMENT_REACTION':
+        notif_text = f"đã bày tỏ cảm xúc về bình luận của bạn: \"{target_content}...\""
+    elif n.notification_type == 'MESSAGE_REACTION':
+        notif_text = f"đã bày tỏ cảm xúc về tin nhắn của bạn: \"{target_content}...\""
+    elif n.notification_type == 'POST_SHARE':
+        # Nếu người chia sẻ có viết thêm caption (target_content)
+        if target_content:
+            notif_text = f"đã chia sẻ bài viết của bạn: \"{target_content}...\""
+        else:
+            notif_text = "đã chia sẻ bài viết của bạn."
+    elif n.notification_type == 'ADDED_TO_GROUP':
+        notif_text = f"đã thêm bạn vào nhóm <strong>{group_name}</strong>."
+    elif n.notification_type == 'GROUP_INVITE_REQUEST':
+        notif_text = f"muốn thêm thành viên vào nhóm <strong>{group_name}</strong>."
+
+    # Thông báo đã gộp: "A và N người khác đã bày tỏ cảm xúc..."
+    if n.other_actor_count:
+        notif_text = f"và {n.other_actor_count} người khác {notif_text}"
+    return notif_text
+
+
+def serialize_notification(n, notif_text=None, is_read=None):
+    """Dữ liệu JSON của một thông báo."""
+    return {
+        'id': n.id,
+        'type': notif_text if notif_text is not None else describe_notification(n),
+        'sender': n.render['actor_name'],
+        'avatar_url': n.render['avatar_url'],
+        'actor_count': n.actor_count,
+        'timestamp': timezone.localtime(n.timestamp).strftime('%H:%M %d-%m-%Y'),
+        'link': reverse('notifications:redirect', args=[n.id]),
+        'target_url': n.render['target_url'],
+        'is_read': n.is_read if is_read is None else is_read,
+    }
+
+
+def prepare_for_render(notifications):
+    """
+    Chuẩn bị danh sách thông báo để hiển thị. Thông báo có snapshot không cần gì thêm;
+    chỉ thông báo cũ mới phải nạp sender và target (mỗi loại một truy vấn).
+    """
+    notifications = list(notifications)
+    legacy = [n for n in notifications if not n.has_snapshot]
+    if legacy:
+        prefetch_related_objects(legacy, 'sender')
+        prefetch_generic_targets(legacy)
+    return notifications
+
@@ -3,142 +3,170 @@
 from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse
 from django.urls import reverse
+from django.db.models import Count, Max, Q
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.shortcuts import get_object_or_404, redirect, render
 from django.contrib.contenttypes.models import ContentType
-from django.template.defaultfilters import truncatewords
 from django.contrib.auth import get_user_model
 from django.contrib import messages
+from . import events
 from .models import Notification
+from .utils import (
+    get_unread_count, prepare_for_render, reset_unread_count, serialize_notification,
+)
 from chat.models import Message
+from chat.utils import get_unread_conversation_count
 from posts.models import Comment, Post
-from django.views.decorators.http import require_POST
+from django.views.decorators.http import condition, require_POST
 
 User = get_user_model()
 
+NOTIFICATION_PAGE_SIZE = 20
+NOTIFICATION_API_LIMIT = 15  # Số thông báo mỗi lần gọi API của chuông thông báo
+
 @login_required
 def notification_list_view(request):
-    # Bước 1: Lấy ID của các thông báo CHƯA ĐỌC trước khi thay đổi bất cứ điều gì.
-    unread_ids = set(
-        Notification.objects.filter(recipient=request.user, is_read=False).values_list('id', flat=True)
-    )
+    notifications = Notification.objects.filter(recipient=request.user)
 
-    # Bước 2: Lấy toàn bộ danh sách thông báo để hiển thị.
-    notifications = Notification.objects.filter(recipient=request.user).order_by('-timestamp') 
+    # Phân trang keyset theo (timestamp, id): `before` = "<timestamp>|<id>" của dòng cuối trang trước
+    before = request.GET.get('before')
+    if before:
+        timestamp_raw, _, id_raw = before.rpartition('|')
+        try:
+            before_ts = parse_datetime(timestamp_raw)
+        except ValueError:  # Đúng định dạng nhưng sai giá trị (vd. tháng 13)
+            before_ts = None
+        if before_ts is None or not id_raw.isdigit():
+            return redirect('notifications:notification_list')
+        notifications = notifications.filter(
+            Q(timestamp__lt=before_ts) | Q(timestamp=before_ts, id__lt=int(id_raw))
+        )
+
+    # Lấy dư 1 dòng để biết còn trang sau mà không cần COUNT
+    page = list(notifications.order_by('-timestamp', '-id')[:NOTIFICATION_PAGE_SIZE + 1])
+    has_more = len(page) > NOTIFICATION_PAGE_SIZE
+    page = prepare_for_render(page[:NOTIFICATION_PAGE_SIZE])
+
+    # Ghi nhớ các thông báo chưa đọc của trang để tô nền trước khi đánh dấu đã đọc
+    unread_ids = {n.id for n in page if not n.is_read}
+    if unread_ids:
+        first, last = page[0], page[-1]
+        # Một câu UPDATE cho cả khoảng keyset của trang đang xem
+        Notification.objects.filter(recipient=request.user, is_read=False).filter(
+            Q(timestamp__lt=first.timestamp) | Q(timestamp=first.timestamp, id__lte=first.id)
+        ).filter(
+            Q(timestamp__gt=last.timestamp) | Q(timestamp=last.timestamp, id__gte=last.id)
+        ).update(is_read=True, updated_at=timezone.now())
+        reset_unread_count(request.user.id)
+        events.publish(request.user.id)
 
-    # Bước 3: Bây giờ mới thực hiện việc đánh dấu là đã đọc.
-    # Việc này không ảnh hưởng đến biến 'notifications' đã lấy ở trên.
-    Notification.objects.filter(id__in=unread_ids).update(is_read=True)
-    
-    # Bước 4: Truyền cả danh sách thông báo và danh sách ID chưa đọc vào template.
     context = {
-        'notifications': notifications,
-        'unread_ids': unread_ids
+        'notifications': page,
+        'unread_ids': unread_ids,
+        'next_cursor': f"{page[-1].timestamp.isoformat()}|{page[-1].id}" if has_more else None,
     }
     return render(request, 'notifications/notification_list.html', context)
 
+def _inbox_state(request):
+    """Một truy vấn (dùng index recipient, updated_at) mô tả trạng thái hộp thông báo."""
+    if not hasattr(request, '_inbox_state'):
+        request._inbox_state = Notification.objects.filter(recipient=request.user).aggregate(
+            last_change=Max('updated_at'), total=Count('id')
+        )
+    return request._inbox_state
+
+def _inbox_etag(request):
+    state = _inbox_state(request)
+    last_change = state['last_change'].timestamp() if state['last_change'] else 0
+    # Số lượng thay đổi khi có thông báo bị xóa; `since` khác nhau cho nội dung khác nhau
+    return f"{request.user.id}-{state['total']}-{last_change}-{request.GET.get('since', '')}"
+
+def _inbox_last_modified(request):
+    return _inbox_state(request)['last_change']
+
 @login_required
+@condition(etag_func=_inbox_etag, last_modified_func=_inbox_last_modified)
 def get_notifications(request):
     user = request.user
     notifications_data = []
 
-    recent_notifications = Notification.objects.filter(
-        recipient=user
-    ).select_related('sender', 'target_content_type').order_by('-timestamp')[:15]
+    # Snapshot nằm sẵn trên từng dòng: chỉ đọc một bảng, không join
+    notifications = Notification.objects.filter(recipient=user)
 
-    total_unread = Notification.objects.filter(recipient=user, is_read=False).count()
+    # `since` = giá trị `cursor` của lần gọi trước: chỉ trả về thông báo mới hoặc vừa thay đổi,
+    # cũ -> mới theo (updated_at, id) để cursor là dòng cuối đã giao (không bỏ sót khi has_more)
+    since = request.GET.get('since')
+    if since:
+        timestamp_raw, _, id_raw = since.partition('|')
+        try:
+            since_dt = parse_datetime(timestamp_raw)
+        except ValueError:  # Đúng định dạng nhưng sai giá trị (vd. tháng 13)
+            since_dt = None
+        if since_dt is None or (id_raw and not id_raw.isdigit()):
+            return JsonResponse({'error': 'Tham số since không hợp lệ.'}, status=400)
+        if id_raw:
+            notifications = notifications.filter(
+                Q(updated_at__gt=since_dt) | Q(updated_at=since_dt, id__gt=int(id_raw))
+            )
+        else:
+            notifications = notifications.filter(updated_at__gt=since_dt)
+        # Lấy dư 1 dòng để biết còn thay đổi chưa giao mà không cần COUNT
+        changes = list(notifications.order_by('updated_at', 'id')[:NOTIFICATION_API_LIMIT + 1])
+        has_more = len(changes) > NOTIFICATION_API_LIMIT
+        changes = changes[:NOTIFICATION_API_LIMIT]
+        cursor = f"{changes[-1].updated_at.isoformat()}|{changes[-1].id}" if changes else since
+        # Hiển thị thay đổi mới nhất trước
+        recent_notifications = prepare_for_render(reversed(changes))
+    else:
+        recent_notifications = prepare_for_render(notifications.order_by('-timestamp')[:NOTIFICATION_API_LIMIT])
+        # Lần gọi đầu: mọi thay đổi tới giờ coi như đã giao (cùng truy vấn với ETag, không tốn thêm)
+        last_change = _inbox_state(request)['last_change']
+        cursor = last_change.isoformat() if last_change else None
+        has_more = False
 
+    total_unread = get_unread_count(user.id)
+
+    # Giữ nguyên thứ tự mới nhất trước; tin nhắn cùng cuộc trò chuyện gộp vào
+    # vị trí của tin mới nhất nên không cần sắp xếp lại
+    entries = []
     message_groups = {}
-    other_notifications = []
     for n in recent_notifications:
         if n.notification_type == 'MESSAGE':
-            if not n.target: continue
-            conv_id = n.target.conversation_id
+            conv_id = n.conversation_id
+            if conv_id is None: continue
             if conv_id not in message_groups:
                 message_groups[conv_id] = {'latest_notification': n, 'count': 0, 'is_read': n.is_read}
+                entries.append(message_groups[conv_id])
             message_groups[conv_id]['count'] += 1
             # Nếu có bất kỳ tin nhắn nào chưa đọc, cả nhóm được coi là chưa đọc
             if not n.is_read:
                 message_groups[conv_id]['is_read'] = False
         else:
-            other_notifications.append(n)
+            entries.append({'latest_notification': n, 'count': 1, 'is_read': n.is_read})
 
-    for conv_id, group_data in message_groups.items():
+    for group_data in entries:
         n = group_data['latest_notification']
         count = group_data['count']
-        msg_obj = n.target
-        msg_content_desc = "một tin nhắn mới."
-        if msg_obj.file:
-            if msg_obj.is_image: msg_content_desc = "một hình ảnh."
-            elif msg_obj.is_video: msg_content_desc = "một video."
-            else: msg_content_desc = "một tập tin."
-       
-        if count > 1:
-            notif_text = f"đã gửi cho bạn {count} tin nhắn."
-        else:
-            notif_text = f"đã gửi cho bạn {msg_content_desc}"
+        notif_text = f"đã gửi cho bạn {count} tin nhắn." if count > 1 else None
+        notifications_data.append(serialize_notification(n, notif_text, is_read=group_data['is_read']))
 
-        avatar = n.sender.avatar.url if n.sender.avatar else '/static/images/default.jpg'
-
-        # notif_text = f"đã gửi cho bạn {count} tin nhắn mới." if count > 1 else "đã gửi cho bạn một tin nhắn mới."
-        notifications_data.append({
-            'id': n.id,
-            'type': notif_text,
-            'sender': n.sender.username,
-            'avatar_url': avatar,
-            'timestamp': timezone.localtime(n.timestamp).strftime('%H:%M %d-%m-%Y'),
-            'link': reverse('notifications:redirect', args=[n.id]),
-            'is_read': group_data['is_read'] 
-        })
-
-    for n in other_notifications:
-        notif_text = ""
-        target_content = ""
-        if n.target and hasattr(n.target, 'content'):
-            target_content = truncatewords(n.target.content, 7)
-            
-        if n.notification_type == 'FRIEND_REQUEST':
-            notif_text = "đã gửi cho bạn một lời mời kết bạn."
-        elif n.notification_type == 'FRIEND_ACCEPT': 
-            notif_text = "đã chấp nhận lời mời kết bạn của bạn."
-        elif n.notification_type == 'POST_REACTION':
-            notif_text = f"đã bày tỏ cảm xúc về bài viết của bạn: \"{target_content}...\""
-        elif n.notification_type == 'POST_COMMENT':
-            notif_text = f"đã bình luận về bài viết của bạn: \"{target_content}...\""
-        elif n.notification_type == 'COMMENT_REACTION':
-            notif_text = f"đã bày tỏ cảm xúc về bình luận của bạn: \"{target_content}...\""
-        elif n.notification_type == 'MESSAGE_REACTION': 
-            notif_text = f"đã bày tỏ cảm xúc về tin nhắn của bạn: \"{target_content}...\""
-        elif n.notification_type == 'POST_SHARE':
-            # Nếu người chia sẻ có viết thêm caption (target_content)
-            if target_content:
-                notif_text = f"đã chia sẻ bài viết của bạn: \"{target_content}...\""
-            else:
-                notif_text = "đã chia sẻ bài viết của bạn."
-        elif n.notification_type == 'ADDED_TO_GROUP':
-            group_name = n.target.name if n.target else "Nhóm chưa đặt tên"
-            notif_text = f"đã thêm bạn vào nhóm <strong>{group_name}</strong>."
-        elif n.notification_type == 'GROUP_INVITE_REQUEST':
-            group_name = n.target.name if n.target else "Nhóm chưa đặt tên"
-            notif_text = f"muốn thêm thành viên vào nhóm <strong>{group_name}</strong>."
-        
-        avatar = n.sender.avatar.url if n.sender.avatar else '/static/images/default.jpg'
-
-        notifications_data.append({
-            'id': n.id,
-            'type': notif_text,
-            'sender': n.sender.username,
-            'avatar_url': avatar,
-            'timestamp': timezone.localtime(n.timestamp).strftime('%H:%M %d-%m-%Y'),
-            'link': reverse('notifications:redirect', args=[n.id]),
-            'is_read': n.is_read  
-        })
-
-    notifications_data.sort(key=lambda x: timezone.datetime.strptime(x['timestamp'], '%H:%M %d-%m-%Y'), reverse=True)
+    response = JsonResponse({
+        'notifications': notifications_data,
+        'total_unread': total_unread,
+        'cursor': cursor,
+        'has_more': has_more,
+    })
+    # Trình duyệt luôn hỏi lại server, nhận 304 rỗng nếu hộp thông báo không đổi
+    response['Cache-Control'] = 'private, no-cache'
+    return response
 
+@login_required
+def unread_count(request):
+    # Chỉ phục vụ số đỏ trên chuông thông báo (cache) và trên mục "Tin nhắn"
     return JsonResponse({
-        'notifications': notifications_data,
-        'total_unread': total_unread 
+        'total_unread': get_unread_count(request.user.id),
+        'unread_conversations': get_unread_conversation_count(request.user.id),
     })
 
 @login_required
@@ -156,17 +184,17 @@ def redirect_notification(request, pk):
         return redirect("posts:home")
     
     # 1. Xử lý Tin nhắn
-    if notif.notification_type == "MESSAGE" and notif.target:
-        conv_id = notif.target.conversation_id
-        message_ct = ContentType.objects.get_for_model(Message)
-        message_ids_in_conv = Message.objects.filter(conversation_id=conv_id).values_list('id', flat=True)
+    if notif.notification_type == "MESSAGE" and notif.conversation_id:
+        conv_id = notif.conversation_id
+        # Một câu UPDATE trên index (conversation, recipient, is_read)
         Notification.objects.filter(
+            conversation_id=conv_id,
             recipient=request.user,
             notification_type='MESSAGE',
-            target_content_type=message_ct,
-            target_object_id__in=message_ids_in_conv,
             is_read=False
-        ).update(is_read=True)
+        ).update(is_read=True, updated_at=timezone.now())
+        reset_unread_count(request.user.id)
+        events.publish(request.user.id)
         return redirect('chat:conversation_detail', conversation_id=conv_id)
     
     # 2. Đánh dấu đã đọc cho các loại thông báo khác
@@ -202,8 +230,7 @@ def redirect_notification(request, pk):
 
         if notif.notification_type == "COMMENT_REACTION" and notif.target:
             comment = notif.target
-            post = comment.post
-            return redirect('posts:post_detail', pk=post.id)
+            return redirect('posts:post_detail', pk=comment.post_id)
         
         if notif.notification_type == "MESSAGE_REACTION" and notif.target:
             message = notif.target
@@ -225,7 +252,9 @@ def redirect_notification(request, pk):
 @login_required
 def mark_all_as_read(request):
     # Cập nhật tất cả thông báo của user hiện tại thành đã đọc
-    Notification.objects.filter(recipient=request.user, is_read=False).update(is_read=True)
+    Notification.objects.filter(recipient=request.user, is_read=False).update(is_read=True, updated_at=timezone.now())
+    reset_unread_count(request.user.id, 0)
+    events.publish(request.user.id)
     return JsonResponse({'status': 'ok'})
 
 @login_required
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Post, PostMedia, Comment, Reaction
+from .models import Post, PostMedia, Comment, Reaction, ChunkedUpload
 
 # Hiển thị PostMedia ngay trong trang chỉnh sửa Post
 class PostMediaInline(admin.TabularInline):
@@ -12,4 +12,9 @@ class PostAdmin(admin.ModelAdmin):
 
 admin.site.register(Post, PostAdmin)
 admin.site.register(Comment)
-admin.site.register(Reaction)
\ No newline at end of file
+admin.site.register(Reaction)
+
+@admin.register(ChunkedUpload)
+class ChunkedUploadAdmin(admin.ModelAdmin):
+    list_display = ('filename', 'owner', 'size', 'received_bytes', 'status', 'updated_at')
+    list_filter = ('status',)
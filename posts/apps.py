@@ -1,4 +1,5 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class PostsConfig(AppConfig):
@@ -7,3 +8,9 @@ class PostsConfig(AppConfig):
 
     def ready(self):
         import posts.signals
+        import posts.tasks  # Đăng ký handler outbox
+
+        if getattr(settings, 'REACTION_WRITE_BEHIND', False):
+            from core.cache import require_shared_cache
+            # Chênh lệch chưa flush nằm trong cache: cache riêng từng process sẽ đếm sai
+            require_shared_cache('REACTION_WRITE_BEHIND')
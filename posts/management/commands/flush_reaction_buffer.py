@@ -0,0 +1,25 @@
+# posts/management/commands/flush_reaction_buffer.py
+
+import time
+from django.core.management.base import BaseCommand
+from posts import reaction_buffer
+
+
+class Command(BaseCommand):
+    help = 'Ghi các reaction đang nằm trong bộ đệm ghi trễ xuống database theo lô.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=2.0,
+                            help='Số giây nghỉ giữa hai lần flush khi chạy liên tục.')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--once', action='store_true',
+                            help='Chỉ flush một lần rồi thoát (dùng cho cron).')
+
+    def handle(self, *args, **options):
+        while True:
+            flushed = reaction_buffer.flush(batch_size=options['batch_size'])
+            if flushed:
+                self.stdout.write(f"Đã ghi {flushed} reaction xuống database.")
+            if options['once']:
+                break
+            time.sleep(options['interval'])
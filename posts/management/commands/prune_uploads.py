@@ -0,0 +1,38 @@
+# posts/management/commands/prune_uploads.py
+
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from posts.models import ChunkedUpload
+from posts.uploads import discard_upload
+
+
+class Command(BaseCommand):
+    help = (
+        'Xóa các upload theo mảnh bị bỏ dở, lỗi checksum hoặc tải xong nhưng không được gắn vào '
+        'tin nhắn / bài viết quá UPLOAD_EXPIRY_HOURS giờ (kèm file tạm và file đã lưu). Chạy định kỳ bằng cron.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=settings.UPLOAD_EXPIRY_HOURS)
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['hours'])
+        expired = ChunkedUpload.objects.filter(
+            status__in=['UPLOADING', 'FAILED', 'COMPLETE'], updated_at__lt=cutoff,
+        ).order_by('updated_at')
+
+        total = 0
+        while True:
+            batch = list(expired[:options['batch_size']])
+            if not batch:
+                break
+            for upload in batch:
+                discard_upload(upload)
+            total += len(batch)
+
+        # Upload đã gắn chỉ còn là dấu vết; file thuộc về tin nhắn / bài viết nên giữ nguyên
+        attached, _ = ChunkedUpload.objects.filter(status='ATTACHED', updated_at__lt=cutoff).delete()
+        self.stdout.write(self.style.SUCCESS(f"Đã xóa {total} upload hết hạn và {attached} bản ghi upload đã gắn."))
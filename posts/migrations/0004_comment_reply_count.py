@@ -0,0 +1,28 @@
+# Generated by Django 4.2.24 on 2026-10-19 13:54
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_reply_count(apps, schema_editor):
+    Comment = apps.get_model('posts', 'Comment')
+    # MySQL không cho UPDATE kèm subquery trên cùng bảng, nên gom số đếm trước rồi cập nhật
+    reply_counts = Comment.objects.filter(parent__isnull=False).order_by().values('parent').annotate(c=Count('id'))
+    for row in reply_counts:
+        Comment.objects.filter(pk=row['parent']).update(reply_count=row['c'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0003_report'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='reply_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_reply_count, migrations.RunPython.noop),
+    ]
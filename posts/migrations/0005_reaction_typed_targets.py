@@ -0,0 +1,122 @@
+# Generated by Django 4.2.24 on 2026-10-19 14:00
+
+from django.db import migrations, models
+from django.db.models import F
+import django.db.models.deletion
+
+
+TARGETS = (
+    ('post', 'posts', 'post'),
+    ('comment', 'posts', 'comment'),
+    ('message', 'chat', 'message'),
+)
+
+
+def copy_generic_targets(apps, schema_editor):
+    # Chuyển (content_type, object_id) sang khóa ngoại tương ứng
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    Reaction = apps.get_model('posts', 'Reaction')
+    for field, app_label, model_name in TARGETS:
+        content_type = ContentType.objects.filter(app_label=app_label, model=model_name).first()
+        if content_type is None:
+            continue
+        model = apps.get_model(app_label, model_name)
+        rows = Reaction.objects.filter(content_type=content_type)
+        # Reaction "mồ côi" (đối tượng đã bị xóa) không thể gắn khóa ngoại nên bỏ luôn
+        rows.exclude(object_id__in=model.objects.values('id')).delete()
+        rows.update(**{f'{field}_id': F('object_id')})
+
+    # Reaction trỏ tới loại đối tượng không còn hỗ trợ
+    Reaction.objects.filter(post__isnull=True, comment__isnull=True, message__isnull=True).delete()
+
+
+def copy_typed_targets_back(apps, schema_editor):
+    # Chiều ngược: chép khóa ngoại về (content_type, object_id); reaction mồ côi đã xóa thì không lấy lại được
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    Reaction = apps.get_model('posts', 'Reaction')
+    for field, app_label, model_name in TARGETS:
+        rows = Reaction.objects.filter(**{f'{field}__isnull': False})
+        if not rows.exists():
+            continue
+        content_type, _ = ContentType.objects.get_or_create(app_label=app_label, model=model_name)
+        rows.update(content_type=content_type, object_id=F(f'{field}_id'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('chat', '0006_conversation_hidden_by'),
+        ('posts', '0004_comment_reply_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reaction',
+            name='comment',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='reactions', to='posts.comment'),
+        ),
+        migrations.AddField(
+            model_name='reaction',
+            name='message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='reactions', to='chat.message'),
+        ),
+        migrations.AddField(
+            model_name='reaction',
+            name='post',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='reactions', to='posts.post'),
+        ),
+        # Cho phép NULL trước khi xóa cột để chiều ngược thêm lại được cột trên bảng đã có dữ liệu,
+        # rồi copy_typed_targets_back điền giá trị và AlterField đặt lại NOT NULL
+        migrations.AlterField(
+            model_name='reaction',
+            name='content_type',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype'),
+        ),
+        migrations.AlterField(
+            model_name='reaction',
+            name='object_id',
+            field=models.PositiveIntegerField(null=True),
+        ),
+        migrations.RunPython(copy_generic_targets, copy_typed_targets_back),
+        migrations.AlterUniqueTogether(
+            name='reaction',
+            unique_together=set(),
+        ),
+        migrations.RemoveField(
+            model_name='reaction',
+            name='content_type',
+        ),
+        migrations.RemoveField(
+            model_name='reaction',
+            name='object_id',
+        ),
+        migrations.AddIndex(
+            model_name='reaction',
+            index=models.Index(fields=['post', 'reaction_type'], name='reaction_post_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reaction',
+            index=models.Index(fields=['comment', 'reaction_type'], name='reaction_comment_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reaction',
+            index=models.Index(fields=['message', 'reaction_type'], name='reaction_message_type_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='reaction',
+            constraint=models.UniqueConstraint(fields=('user', 'post'), name='unique_post_reaction_per_user'),
+        ),
+        migrations.AddConstraint(
+            model_name='reaction',
+            constraint=models.UniqueConstraint(fields=('user', 'comment'), name='unique_comment_reaction_per_user'),
+        ),
+        migrations.AddConstraint(
+            model_name='reaction',
+            constraint=models.UniqueConstraint(fields=('user', 'message'), name='unique_message_reaction_per_user'),
+        ),
+        migrations.AddConstraint(
+            model_name='reaction',
+            constraint=models.CheckConstraint(check=models.Q(models.Q(('comment__isnull', True), ('message__isnull', True), ('post__isnull', False)), models.Q(('comment__isnull', False), ('message__isnull', True), ('post__isnull', True)), models.Q(('comment__isnull', True), ('message__isnull', False), ('post__isnull', True)), _connector='OR'), name='reaction_has_exactly_one_target'),
+        ),
+    ]
@@ -1,11 +1,25 @@
+import os
+import uuid
+from collections import namedtuple
 from django.db import models
 from django.conf import settings
-from django.contrib.contenttypes.fields import GenericForeignKey, GenericRelation
-from django.contrib.contenttypes.models import ContentType
 from django.db.models import Count
 from django.urls import reverse
 from django.conf import settings
 
+# Trang bình luận hiển thị sẵn khi render bài viết: next_cursor là con trỏ cho nút "Xem thêm"
+# (None khi không còn), giống next_cursor mà load_more_comments / load_more_replies trả về
+CommentPage = namedtuple('CommentPage', ['comments', 'next_cursor'])
+
+
+def _comment_page(queryset, limit):
+    # Lấy dư một dòng để biết còn bình luận phía sau hay không
+    comments = list(queryset[:limit + 1])
+    if len(comments) > limit:
+        return CommentPage(comments[:limit], comments[limit - 1].cursor)
+    return CommentPage(comments, None)
+
+
 PRIVACY_CHOICES = [
     ('PUBLIC', 'Công khai'),
     ('FRIENDS', 'Bạn bè'),
@@ -31,10 +45,11 @@ class Post(models.Model):
     shared_from = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='shares')
     tags = models.ManyToManyField(Tag, blank=True, related_name='posts')
     
-    reactions = GenericRelation('Reaction')
+    # `reactions` là quan hệ ngược từ Reaction.post
     def get_reaction_stats(self):
+        from .reaction_buffer import apply_pending_deltas
         stats = self.reactions.values('reaction_type').annotate(count=Count('id')).order_by('-count')
-        return {item['reaction_type']: item['count'] for item in stats}
+        return apply_pending_deltas(self, {item['reaction_type']: item['count'] for item in stats})
     
     class Meta:
         ordering = ['-created_at']
@@ -48,8 +63,8 @@ class Post(models.Model):
         return self.comments.filter(parent__isnull=True).count()
 
     def get_initial_comments(self, limit=3):
-        # Trả về các bình luận gốc gần nhất, giới hạn bởi `limit`
-        return self.comments.filter(parent__isnull=True).order_by('-created_at')[:limit]
+        # Các bình luận gốc gần nhất (tối đa `limit`) kèm con trỏ "Xem thêm bình luận"
+        return _comment_page(self.comments.filter(parent__isnull=True).order_by('-created_at', '-id'), limit)
     
 class PostMedia(models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='media')
@@ -61,23 +76,79 @@ class PostMedia(models.Model):
     def __str__(self):
         return f"{self.media_type} for Post {self.post.id}"
 
+class ChunkedUpload(models.Model):
+    """
+    Một file tải lên theo từng mảnh (posts/uploads.py). Các mảnh được nối vào file tạm trên đĩa,
+    khi hoàn tất thì kiểm tra SHA-256 rồi lưu vào storage; tin nhắn / bài viết gắn file bằng
+    upload_id thay vì gửi lại cả file trong một request multipart.
+    """
+    STATUS_CHOICES = [
+        ('UPLOADING', 'Đang tải lên'),
+        ('COMPLETE', 'Đã tải xong'),
+        ('ATTACHED', 'Đã đính kèm'),
+        ('FAILED', 'Lỗi checksum'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='chunked_uploads')
+    filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100, blank=True)
+    size = models.PositiveBigIntegerField()
+    # Số byte đã nhận liên tục từ đầu file; mảnh tiếp theo phải bắt đầu đúng tại đây (resume)
+    received_bytes = models.PositiveBigIntegerField(default=0)
+    # SHA-256 (hex) client khai báo khi bắt đầu; sau khi hoàn tất là checksum đã kiểm tra
+    sha256 = models.CharField(max_length=64, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='UPLOADING')
+    file = models.FileField(upload_to='uploads/', blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'updated_at'], name='chunked_upload_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.filename} ({self.received_bytes}/{self.size}) - {self.status}"
+
+    @property
+    def part_path(self):
+        # File tạm chứa các mảnh đã nhận, nằm ngoài MEDIA_ROOT
+        return os.path.join(settings.UPLOAD_TEMP_DIR, f"{self.id}.part")
+
+    @property
+    def media_type(self):
+        return 'IMAGE' if self.content_type.startswith('image') else 'VIDEO'
+
 class Comment(models.Model):
     author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='comments')
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='comments')
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='replies')
+    # Số câu trả lời trực tiếp, cập nhật khi thêm/xóa reply (tránh COUNT mỗi lần render)
+    reply_count = models.PositiveIntegerField(default=0)
 
     class Meta:
         ordering = ['created_at']
 
     def __str__(self):
         return f"Comment by {self.author.username} on {self.post}"
+
+    @property
+    def cursor(self):
+        # Con trỏ phân trang theo cặp (created_at, id), dùng cho "Xem thêm"
+        return f"{self.created_at.isoformat()}|{self.id}"
+
+    def get_initial_replies(self, limit=3):
+        # Các câu trả lời cũ nhất (tối đa `limit`) kèm con trỏ "Xem thêm câu trả lời"
+        return _comment_page(self.replies.order_by('created_at', 'id'), limit)
     
-    reactions = GenericRelation('Reaction')
+    # `reactions` là quan hệ ngược từ Reaction.comment
     def get_reaction_stats(self):
+        from .reaction_buffer import apply_pending_deltas
         stats = self.reactions.values('reaction_type').annotate(count=Count('id'))
-        return {item['reaction_type']: item['count'] for item in stats}
+        return apply_pending_deltas(self, {item['reaction_type']: item['count'] for item in stats})
 
 class Reaction(models.Model):
     REACTION_CHOICES = [
@@ -92,15 +163,40 @@ class Reaction(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='reactions')
     reaction_type = models.CharField(max_length=10, choices=REACTION_CHOICES)
 
-    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
-    object_id = models.PositiveIntegerField()
-    content_object = GenericForeignKey('content_type', 'object_id')
+    # Mỗi reaction trỏ tới đúng MỘT đối tượng qua khóa ngoại thật (thay cho GenericForeignKey),
+    # nên xóa bài viết / bình luận / tin nhắn sẽ xóa luôn reaction và có thể annotate(Count) trực tiếp
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, null=True, blank=True, related_name='reactions')
+    comment = models.ForeignKey(Comment, on_delete=models.CASCADE, null=True, blank=True, related_name='reactions')
+    message = models.ForeignKey('chat.Message', on_delete=models.CASCADE, null=True, blank=True, related_name='reactions')
+
+    TARGET_FIELDS = ('post', 'comment', 'message')
 
     class Meta:
-        unique_together = ('user', 'content_type', 'object_id')
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'post'], name='unique_post_reaction_per_user'),
+            models.UniqueConstraint(fields=['user', 'comment'], name='unique_comment_reaction_per_user'),
+            models.UniqueConstraint(fields=['user', 'message'], name='unique_message_reaction_per_user'),
+            models.CheckConstraint(
+                check=(
+                    models.Q(post__isnull=False, comment__isnull=True, message__isnull=True)
+                    | models.Q(post__isnull=True, comment__isnull=False, message__isnull=True)
+                    | models.Q(post__isnull=True, comment__isnull=True, message__isnull=False)
+                ),
+                name='reaction_has_exactly_one_target',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['post', 'reaction_type'], name='reaction_post_type_idx'),
+            models.Index(fields=['comment', 'reaction_type'], name='reaction_comment_type_idx'),
+            models.Index(fields=['message', 'reaction_type'], name='reaction_message_type_idx'),
+        ]
 
     def __str__(self):
-        return f"{self.user.username} reacted {self.reaction_type} on {self.content_object}"
+        return f"{self.user.username} reacted {self.reaction_type} on {self.target}"
+
+    @property
+    def target(self):
+        return self.post or self.comment or self.message
     
 class Report(models.Model):
     REPORT_REASONS = [
@@ -124,4 +220,4 @@ class Report(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
-        return f"Report {self.post.id} by {self.reporter.username}"
\ No newline at end of file
+        return f"Report {self.post_id} by {self.reporter.username}"
\ No newline at end of file
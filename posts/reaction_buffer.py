@@ -0,0 +1,274 @@
+# posts/reaction_buffer.py
+"""
+Bộ đệm ghi trễ (write-behind) cho reaction trên các bài viết "viral".
+
+Khi bật REACTION_WRITE_BEHIND, mỗi lần thả/bỏ cảm xúc chỉ:
+  1. ghi thêm một dòng vào file log (append-only),
+  2. lưu trạng thái mới của user vào cache (để reload trang vẫn thấy đúng),
+  3. cộng/trừ bộ đếm chênh lệch theo loại cảm xúc (để trả về số đếm lạc quan).
+Lệnh `python manage.py flush_reaction_buffer` sẽ gom log và ghi xuống DB theo lô.
+
+Chênh lệch và trạng thái chờ nằm trong cache nên bắt buộc CACHES dùng chung (Redis/Memcached,
+kiểm tra ở PostsConfig.ready). Ghi log và đổi tên log khi flush cùng giữ một khóa fcntl.flock
+(chỉ có trên Unix) để không dòng nào bị ghi vào file đã được đem đi xử lý. Sau khi ghi DB, flush
+dựng lại bộ đếm chênh lệch từ log mới nên chạy lại một lần flush bị ngắt không làm lệch số đếm.
+"""
+import json
+import os
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+NO_REACTION = ''  # Đánh dấu user đã bỏ cảm xúc nhưng chưa flush
+
+
+def is_enabled():
+    return getattr(settings, 'REACTION_WRITE_BEHIND', False)
+
+
+def _log_path():
+    return str(getattr(settings, 'REACTION_BUFFER_LOG', settings.BASE_DIR / 'reaction_buffer.log'))
+
+
+@contextmanager
+def _log_lock():
+    """Khóa độc quyền giữa các process trên file .lock cạnh log (không khóa chính file log vì nó bị đổi tên)."""
+    import fcntl
+
+    with open(_log_path() + '.lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+# `target_field` là tên khóa ngoại của Reaction trỏ tới đối tượng: 'post' hoặc 'comment'
+def _pending_key(target_field, object_id, user_id):
+    return f"reaction:pending:{target_field}:{object_id}:{user_id}"
+
+
+def _delta_key(target_field, object_id, reaction_type):
+    return f"reaction:delta:{target_field}:{object_id}:{reaction_type}"
+
+
+def _incr(key, delta):
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        # Khóa chưa tồn tại: khởi tạo rồi cộng (add không ghi đè nếu process khác vừa tạo)
+        cache.add(key, 0, timeout=None)
+        cache.incr(key, delta)
+
+
+def get_user_reaction(user, target_field, object_id):
+    """Reaction hiện tại của user, ưu tiên trạng thái chưa flush trong cache."""
+    from .models import Reaction
+
+    pending = cache.get(_pending_key(target_field, object_id, user.id))
+    if pending is not None:
+        return pending or None
+    return Reaction.objects.filter(
+        user=user, **{f'{target_field}_id': object_id}
+    ).values_list('reaction_type', flat=True).first()
+
+
+def toggle(user, target_field, object_id, reaction_type):
+    """
+    Ghi nhận thao tác thả/đổi/bỏ cảm xúc vào bộ đệm và trả về reaction mới của user.
+    Cùng quy tắc với view đồng bộ: bấm lại đúng loại đang chọn là bỏ cảm xúc.
+    """
+    # Đọc trạng thái cũ, ghi log và cập nhật cache trong cùng một khóa: hai lần bấm song song
+    # không đọc trùng `previous`, và flush không đổi tên log giữa lúc ghi log và cập nhật cache
+    with _log_lock():
+        previous = get_user_reaction(user, target_field, object_id)
+        new = None if previous == reaction_type else reaction_type
+
+        entry = {'user': user.id, 'field': target_field, 'obj': object_id, 'prev': previous, 'new': new}
+        with open(_log_path(), 'a', encoding='utf-8') as log:
+            log.write(json.dumps(entry) + '\n')
+
+        cache.set(_pending_key(target_field, object_id, user.id), new or NO_REACTION, timeout=None)
+        if previous:
+            _incr(_delta_key(target_field, object_id, previous), -1)
+        if new:
+            _incr(_delta_key(target_field, object_id, new), 1)
+    return new
+
+
+def apply_pending_deltas(target, stats):
+    """Cộng chênh lệch chưa flush vào thống kê {reaction_type: count} lấy từ DB."""
+    if not is_enabled():
+        return stats
+
+    from .models import Reaction
+
+    target_field = target._meta.model_name
+    types = [choice[0] for choice in Reaction.REACTION_CHOICES]
+    deltas = cache.get_many([_delta_key(target_field, target.pk, t) for t in types])
+    if not deltas:
+        return stats
+
+    merged = dict(stats)
+    for reaction_type in types:
+        delta = deltas.get(_delta_key(target_field, target.pk, reaction_type), 0)
+        count = merged.get(reaction_type, 0) + delta
+        if count > 0:
+            merged[reaction_type] = count
+        else:
+            merged.pop(reaction_type, None)
+    return dict(sorted(merged.items(), key=lambda item: item[1], reverse=True))
+
+
+def apply_pending_user_reactions(user, target_field, object_ids, reactions_map):
+    """Ghi đè map {object_id: reaction_type} của user bằng trạng thái chưa flush."""
+    if not is_enabled() or not object_ids:
+        return reactions_map
+
+    keys = {_pending_key(target_field, object_id, user.id): object_id for object_id in object_ids}
+    for key, value in cache.get_many(list(keys)).items():
+        if value:
+            reactions_map[keys[key]] = value
+        else:
+            reactions_map.pop(keys[key], None)
+    return reactions_map
+
+
+def _read_log(path):
+    """Trạng thái cuối {(user, field, obj): reaction|None} và chênh lệch {delta_key: n} của một file log."""
+    final_state = {}
+    deltas = defaultdict(int)
+    if not os.path.exists(path):
+        return final_state, deltas
+    with open(path, encoding='utf-8') as log:
+        for line in log:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            final_state[(entry['user'], entry['field'], entry['obj'])] = entry['new']
+            if entry['prev']:
+                deltas[_delta_key(entry['field'], entry['obj'], entry['prev'])] -= 1
+            if entry['new']:
+                deltas[_delta_key(entry['field'], entry['obj'], entry['new'])] += 1
+    return final_state, deltas
+
+
+def flush(batch_size=500):
+    """
+    Gom log hiện có và ghi xuống DB bằng bulk_create / bulk_update.
+    Trả về số cặp (user, đối tượng) đã xử lý.
+    """
+    from accounts.models import User
+    from .models import Comment, Post, Reaction
+
+    path = _log_path()
+    processing_path = path + '.processing'
+    # Đổi tên file trong khóa (không request nào đang ghi dở) để các request mới ghi sang log mới.
+    # Nếu lần flush trước bị gián đoạn thì xử lý lại file .processing còn sót.
+    if not os.path.exists(processing_path):
+        with _log_lock():
+            if not os.path.exists(path):
+                return 0
+            os.replace(path, processing_path)
+
+    final_state, deltas = _read_log(processing_path)
+
+    users_by_target = defaultdict(list)
+    for user_id, target_field, object_id in final_state:
+        users_by_target[(target_field, object_id)].append(user_id)
+
+    # Đối tượng / user đã bị xóa (hoặc tin nhắn đã lưu trữ) từ lúc thả cảm xúc thì bỏ qua:
+    # ignore_conflicts không bỏ qua lỗi khóa ngoại trên các backend kiểm tra FK ngay (sqlite, PostgreSQL)
+    models_by_field = {'post': Post, 'comment': Comment}
+    existing_targets = {
+        target_field: set(model.objects.filter(
+            pk__in=[obj for field, obj in users_by_target if field == target_field]
+        ).values_list('pk', flat=True))
+        for target_field, model in models_by_field.items()
+    }
+    existing_users = set(User.objects.filter(
+        pk__in={user_id for user_id, _, _ in final_state}
+    ).values_list('pk', flat=True))
+
+    to_create, to_update, to_delete = [], [], []
+    new_reactors = {}  # (field, obj) -> user_id của người thả / đổi cảm xúc cuối cùng
+    removed_reactors = defaultdict(list)  # (field, obj) -> user_id của những người đã bỏ cảm xúc
+    with transaction.atomic():
+        for (target_field, object_id), user_ids in users_by_target.items():
+            existing = {
+                r.user_id: r for r in Reaction.objects.filter(
+                    user_id__in=user_ids, **{f'{target_field}_id': object_id}
+                )
+            }
+            for user_id in user_ids:
+                new = final_state[(user_id, target_field, object_id)]
+                current = existing.get(user_id)
+                if new is None:
+                    if current:
+                        to_delete.append(current.id)
+                        removed_reactors[(target_field, object_id)].append(user_id)
+                    continue
+                if current is None:
+                    if object_id not in existing_targets[target_field] or user_id not in existing_users:
+                        continue
+                    to_create.append(Reaction(
+                        user_id=user_id, reaction_type=new, **{f'{target_field}_id': object_id}
+                    ))
+                elif current.reaction_type != new:
+                    current.reaction_type = new
+                    to_update.append(current)
+                else:
+                    # Đã đúng trong DB (vd. chạy lại sau khi flush trước bị ngắt): không báo lại
+                    continue
+                new_reactors[(target_field, object_id)] = user_id
+
+        Reaction.objects.bulk_create(to_create, batch_size=batch_size, ignore_conflicts=True)
+        Reaction.objects.bulk_update(to_update, ['reaction_type'], batch_size=batch_size)
+        for start in range(0, len(to_delete), batch_size):
+            Reaction.objects.filter(id__in=to_delete[start:start + batch_size]).delete()
+
+    # Dữ liệu đã nằm trong DB: dựng lại chênh lệch và trạng thái chờ từ log mới (những thao tác
+    # chưa flush) thay vì trừ dần, nên chạy lại sau khi bị ngắt trước os.remove không trừ hai lần
+    with _log_lock():
+        pending_state, pending_deltas = _read_log(path)
+        for key in set(deltas) | set(pending_deltas):
+            cache.set(key, pending_deltas.get(key, 0), timeout=None)
+        for user_id, target_field, object_id in final_state:
+            if (user_id, target_field, object_id) not in pending_state:
+                cache.delete(_pending_key(target_field, object_id, user_id))
+        os.remove(processing_path)
+
+    _update_notifications(new_reactors, removed_reactors)
+    return len(final_state)
+
+
+def _update_notifications(new_reactors, removed_reactors):
+    from notifications.utils import notify_reaction, withdraw_reaction
+    from accounts.models import User
+    from .models import Comment, Post
+
+    models_by_field = {'post': (Post, 'POST_REACTION'), 'comment': (Comment, 'COMMENT_REACTION')}
+    user_ids = set(new_reactors.values())
+    for removed in removed_reactors.values():
+        user_ids.update(removed)
+    users = User.objects.in_bulk(user_ids)
+
+    # Bỏ người đã bỏ cảm xúc khỏi thông báo gộp trước, rồi mới gộp người thả mới
+    for (target_field, object_id), removed in removed_reactors.items():
+        model, notification_type = models_by_field[target_field]
+        target = model.objects.select_related('author').filter(pk=object_id).first()
+        if target is None:
+            continue
+        for user_id in removed:
+            if user_id in users:
+                withdraw_reaction(target.author, users[user_id], notification_type, target)
+
+    for (target_field, object_id), user_id in new_reactors.items():
+        model, notification_type = models_by_field[target_field]
+        target = model.objects.select_related('author').filter(pk=object_id).first()
+        if target is None or user_id not in users:
+            continue
+        notify_reaction(target.author, users[user_id], notification_type, target)
@@ -1,20 +1,16 @@
 # posts/signals.py
 from django.db.models.signals import post_save
 from django.dispatch import receiver
-from .models import Post, Tag
-import re
+from notifications import outbox
+from .models import Post
 
 @receiver(post_save, sender=Post)
-def extract_hashtags(sender, instance, created, **kwargs):
+def extract_hashtags(sender, instance, created, update_fields=None, **kwargs):
     # Chỉ chạy khi bài viết được tạo hoặc cập nhật nội dung
+    if update_fields is not None and 'content' not in update_fields:
+        return
     if instance.content:
-        # Regex tìm các từ bắt đầu bằng # (ví dụ: #hanoi)
-        hashtags = re.findall(r"#(\w+)", instance.content)
-        
-        # Xóa hết tag cũ để cập nhật lại (phòng trường hợp user sửa bài xóa tag)
-        instance.tags.clear()
-        
-        for tag_name in hashtags:
-            # Tạo tag mới nếu chưa có, hoặc lấy tag cũ nếu đã có
-            tag_obj, _ = Tag.objects.get_or_create(name=tag_name.lower())
-            instance.tags.add(tag_obj)
\ No newline at end of file
+        # Tách hashtag ở worker outbox (posts/tasks.py). Sự kiện chỉ nằm cùng transaction với bài viết
+        # khi nơi lưu bài bọc trong transaction.atomic() (PostCreateView, PostUpdateView, share_post);
+        # lưu ngoài atomic thì bài đã commit trước khi sự kiện được ghi
+        outbox.enqueue('posts.extract_hashtags', {'post_id': instance.pk})
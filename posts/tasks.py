@@ -0,0 +1,22 @@
+# posts/tasks.py
+# Handler outbox của app posts (được nạp trong PostsConfig.ready)
+
+import re
+from django.db import transaction
+from notifications import outbox
+from .models import Post, Tag
+
+
+@outbox.handler('posts.extract_hashtags')
+def extract_hashtags(payload):
+    post = Post.objects.filter(pk=payload['post_id']).first()
+    if post is None or not post.content:
+        return
+    # Regex tìm các từ bắt đầu bằng # (ví dụ: #hanoi)
+    names = {tag_name.lower() for tag_name in re.findall(r"#(\w+)", post.content)}
+
+    with transaction.atomic():
+        # Xóa hết tag cũ để cập nhật lại (phòng trường hợp user sửa bài xóa tag)
+        post.tags.clear()
+        tags = [Tag.objects.get_or_create(name=name)[0] for name in names]
+        post.tags.add(*tags)
@@ -1,3 +1,314 @@
-from django.test import TestCase
+import hashlib
+import os
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from accounts.models import User
+from notifications import outbox
+from notifications.models import OutboxEvent
+from . import reaction_buffer
+from .models import ChunkedUpload, Comment, Post, Reaction
+from .uploads import UploadError, claim_uploads
+
+
+class ReactionWriteBehindConfigTests(SimpleTestCase):
+    @override_settings(
+        REACTION_WRITE_BEHIND=True,
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    )
+    def test_refuses_process_local_cache(self):
+        with self.assertRaises(ImproperlyConfigured):
+            apps.get_app_config('posts').ready()
+
+    @override_settings(
+        REACTION_WRITE_BEHIND=True,
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://'}},
+    )
+    def test_accepts_shared_cache(self):
+        apps.get_app_config('posts').ready()
+
+
+class ReactionTypedTargetsMigrationTests(TransactionTestCase):
+    """posts/0005: (content_type, object_id) -> khóa ngoại post / comment / message và chiều ngược lại."""
+    before = [('posts', '0004_comment_reply_count'), ('chat', '0006_conversation_hidden_by')]
+    after = [('posts', '0005_reaction_typed_targets')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_forward_and_reverse(self):
+        old_apps = self.migrate(self.before)
+        ContentType = old_apps.get_model('contenttypes', 'ContentType')
+        User = old_apps.get_model('accounts', 'User')
+        Post = old_apps.get_model('posts', 'Post')
+        Comment = old_apps.get_model('posts', 'Comment')
+        Conversation = old_apps.get_model('chat', 'Conversation')
+        Message = old_apps.get_model('chat', 'Message')
+        Reaction = old_apps.get_model('posts', 'Reaction')
+
+        user = User.objects.create(username='reactor')
+        post = Post.objects.create(author=user, content='post')
+        comment = Comment.objects.create(post=post, author=user, content='comment')
+        message = Message.objects.create(conversation=Conversation.objects.create(), sender=user, text='hi')
+        content_types = {
+            name: ContentType.objects.get_or_create(app_label=app_label, model=name)[0]
+            for app_label, name in (('posts', 'post'), ('posts', 'comment'), ('chat', 'message'))
+        }
+        for name, obj in (('post', post), ('comment', comment), ('message', message)):
+            Reaction.objects.create(user=user, content_type=content_types[name], object_id=obj.pk, reaction_type='LIKE')
+        # Bài viết đã bị xóa: reaction mồ côi bị bỏ khi chuyển
+        Reaction.objects.create(user=user, content_type=content_types['post'], object_id=post.pk + 100, reaction_type='WOW')
+
+        new_apps = self.migrate(self.after)
+        Reaction = new_apps.get_model('posts', 'Reaction')
+        self.assertEqual(
+            sorted(Reaction.objects.values_list('post_id', 'comment_id', 'message_id'), key=str),
+            sorted([(post.pk, None, None), (None, comment.pk, None), (None, None, message.pk)], key=str),
+        )
+
+        old_apps = self.migrate(self.before)
+        Reaction = old_apps.get_model('posts', 'Reaction')
+        self.assertEqual(
+            sorted(Reaction.objects.values_list('content_type_id', 'object_id')),
+            sorted([
+                (content_types['post'].pk, post.pk),
+                (content_types['comment'].pk, comment.pk),
+                (content_types['message'].pk, message.pk),
+            ]),
+        )
+
+
+class CommentPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('author', password='x')
+        self.post = Post.objects.create(author=self.user, content='post')
+        self.comments = [Comment.objects.create(post=self.post, author=self.user, content=f'c{i}') for i in range(5)]
+        self.client.force_login(self.user)
+
+    def load_more(self, cursor):
+        return self.client.get(reverse('posts:load_more_comments', args=[self.post.pk]), {'cursor': cursor})
+
+    def test_initial_page_cursor_continues_with_load_more(self):
+        page = self.post.get_initial_comments()
+        self.assertEqual(page.comments, self.comments[:1:-1])
+        self.assertEqual(page.next_cursor, self.comments[2].cursor)
+
+        data = self.load_more(page.next_cursor).json()
+        self.assertFalse(data['has_more'])
+        self.assertIsNone(data['next_cursor'])
+        self.assertIn('c1', data['html'])
+        self.assertIn('c0', data['html'])
+
+    def test_last_page_has_no_cursor(self):
+        self.assertIsNone(self.post.get_initial_comments(limit=5).next_cursor)
+
+    def test_rejects_invalid_cursor(self):
+        for cursor in ('garbage', 'not-a-date|1', '2026-01-01T00:00:00|abc', '2026-13-45T00:00:00|1'):
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.load_more(cursor).status_code, 400)
+
+
+class ReactionBufferTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        log_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(log_dir.cleanup)
+        settings_override = override_settings(
+            REACTION_WRITE_BEHIND=True, REACTION_BUFFER_LOG=os.path.join(log_dir.name, 'reactions.log'),
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.author = User.objects.create_user('author', password='x')
+        self.fans = [User.objects.create_user(f'fan{i}', password='x') for i in range(3)]
+        self.post = Post.objects.create(author=self.author, content='viral')
+
+    def test_toggle_flush_keeps_counts(self):
+        for fan in self.fans:
+            reaction_buffer.toggle(fan, 'post', self.post.id, 'LIKE')
+        reaction_buffer.toggle(self.fans[0], 'post', self.post.id, 'LIKE')  # bấm lại: bỏ cảm xúc
+        reaction_buffer.toggle(self.fans[1], 'post', self.post.id, 'LOVE')  # đổi loại
+        expected = {'LIKE': 1, 'LOVE': 1}
+        self.assertEqual(self.post.get_reaction_stats(), expected)
+        self.assertFalse(Reaction.objects.exists())
+
+        self.assertEqual(reaction_buffer.flush(), 3)
+        self.assertEqual(self.post.get_reaction_stats(), expected)
+        self.assertEqual(
+            dict(Reaction.objects.values_list('user_id', 'reaction_type')),
+            {self.fans[1].id: 'LOVE', self.fans[2].id: 'LIKE'},
+        )
+        self.assertIsNone(reaction_buffer.get_user_reaction(self.fans[0], 'post', self.post.id))
+        self.assertEqual(reaction_buffer.flush(), 0)
+
+    def test_rerun_after_interrupted_settlement_does_not_subtract_twice(self):
+        for fan in self.fans:
+            reaction_buffer.toggle(fan, 'post', self.post.id, 'LIKE')
+        # Bị ngắt sau khi commit, trước khi xóa file .processing
+        with mock.patch('posts.reaction_buffer.os.remove', side_effect=RuntimeError('boom')):
+            with self.assertRaises(RuntimeError):
+                reaction_buffer.flush()
+        reaction_buffer.toggle(self.author, 'post', self.post.id, 'WOW')  # ghi vào log mới
+
+        reaction_buffer.flush()
+        self.assertEqual(self.post.get_reaction_stats(), {'LIKE': 3, 'WOW': 1})
+        reaction_buffer.flush()
+        self.assertEqual(self.post.get_reaction_stats(), {'LIKE': 3, 'WOW': 1})
+        self.assertEqual(Reaction.objects.count(), 4)
+
+    def test_skips_targets_deleted_before_flush(self):
+        comment = Comment.objects.create(post=self.post, author=self.author, content='c')
+        reaction_buffer.toggle(self.fans[0], 'comment', comment.id, 'HAHA')
+        reaction_buffer.toggle(self.fans[0], 'post', self.post.id, 'LIKE')
+        comment.delete()
+
+        reaction_buffer.flush()
+        self.assertEqual(list(Reaction.objects.values_list('post_id', 'comment_id')), [(self.post.id, None)])
+
+
+class ChunkedUploadTests(TestCase):
+    data = b'0123456789'
+
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        settings_override = override_settings(
+            UPLOAD_TEMP_DIR=os.path.join(temp_dir.name, 'tmp'), MEDIA_ROOT=os.path.join(temp_dir.name, 'media'),
+            UPLOAD_MAX_SIZE=16, UPLOAD_CHUNK_SIZE=4,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = User.objects.create_user('uploader', password='x')
+        self.client.force_login(self.user)
+
+    def start(self, **fields):
+        data = {'filename': 'clip.mp4', 'size': len(self.data), 'sha256': hashlib.sha256(self.data).hexdigest()}
+        data.update(fields)
+        return self.client.post(reverse('posts:upload_start'), data, content_type='application/json')
+
+    def chunk(self, upload_id, offset, body, sha256=None):
+        headers = {'HTTP_X_CHUNK_SHA256': sha256} if sha256 is not None else {}
+        return self.client.post(
+            f"{reverse('posts:upload_chunk', args=[upload_id])}?offset={offset}", body,
+            content_type='application/octet-stream', **headers,
+        )
+
+    def complete(self, upload_id):
+        return self.client.post(reverse('posts:upload_complete', args=[upload_id]))
+
+    def upload_all(self, **fields):
+        upload_id = self.start(**fields).json()['upload_id']
+        for offset in range(0, len(self.data), 4):
+            self.assertEqual(self.chunk(upload_id, offset, self.data[offset:offset + 4]).status_code, 200)
+        return upload_id
+
+    def test_start_validation(self):
+        cases = [
+            ({'size': 0}, 400), ({'size': 'abc'}, 400), ({'filename': ''}, 400),
+            ({'size': 17}, 413), ({'sha256': 'xyz'}, 400), ({'sha256': 'g' * 64}, 400),
+        ]
+        for fields, status in cases:
+            with self.subTest(fields=fields):
+                self.assertEqual(self.start(**fields).status_code, status)
+        self.assertFalse(ChunkedUpload.objects.exists())
+        self.assertEqual(self.start(size=17).json()['max_size'], 16)
+
+    def test_chunks_complete_and_store_file(self):
+        upload_id = self.upload_all()
+        data = self.complete(upload_id).json()
+        self.assertEqual(data['upload_status'], 'COMPLETE')
+        upload = ChunkedUpload.objects.get(id=upload_id)
+        with upload.file.open('rb') as stored:
+            self.assertEqual(stored.read(), self.data)
+        self.assertFalse(os.path.exists(upload.part_path))
+
+    def test_wrong_offset_returns_received_bytes(self):
+        upload_id = self.start().json()['upload_id']
+        self.chunk(upload_id, 0, b'0123')
+        for offset in (0, 8):
+            with self.subTest(offset=offset):
+                response = self.chunk(upload_id, offset, b'45')
+                self.assertEqual(response.status_code, 409)
+                self.assertEqual(response.json()['received_bytes'], 4)
+
+    def test_bad_chunk_checksum_is_rejected(self):
+        upload_id = self.start().json()['upload_id']
+        response = self.chunk(upload_id, 0, b'0123', sha256=hashlib.sha256(b'other').hexdigest())
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(ChunkedUpload.objects.get(id=upload_id).received_bytes, 0)
+        self.assertEqual(self.chunk(upload_id, 0, b'0123', sha256=hashlib.sha256(b'0123').hexdigest()).status_code, 200)
+
+    def test_resume_truncates_partial_write(self):
+        upload_id = self.start().json()['upload_id']
+        self.chunk(upload_id, 0, b'0123')
+        # Lần ghi trước bị ngắt sau khi ghi vài byte vào .part nhưng trước khi cập nhật received_bytes
+        upload = ChunkedUpload.objects.get(id=upload_id)
+        with open(upload.part_path, 'ab') as part:
+            part.write(b'xx')
+
+        status = self.client.get(reverse('posts:upload_status', args=[upload_id])).json()
+        self.assertEqual(status['received_bytes'], 4)
+        for offset in (4, 8):
+            self.chunk(upload_id, offset, self.data[offset:offset + 4])
+        self.assertEqual(self.complete(upload_id).status_code, 200)
+        with ChunkedUpload.objects.get(id=upload_id).file.open('rb') as stored:
+            self.assertEqual(stored.read(), self.data)
+
+    def test_wrong_file_checksum_fails_upload(self):
+        upload_id = self.upload_all(sha256=hashlib.sha256(b'other').hexdigest())
+        response = self.complete(upload_id)
+        self.assertEqual(response.status_code, 422)
+        upload = ChunkedUpload.objects.get(id=upload_id)
+        self.assertEqual(upload.status, 'FAILED')
+        self.assertFalse(os.path.exists(upload.part_path))
+        self.assertFalse(upload.file)
+
+    def test_claim_only_once_and_only_own_uploads(self):
+        upload_id = self.upload_all()
+        self.complete(upload_id)
+        other = User.objects.create_user('other', password='x')
+
+        with self.assertRaises(UploadError):
+            claim_uploads(other, [upload_id])
+        self.assertEqual([str(upload.id) for upload in claim_uploads(self.user, [upload_id])], [upload_id])
+        with self.assertRaises(UploadError):
+            claim_uploads(self.user, [upload_id])
+        self.assertEqual(ChunkedUpload.objects.get().status, 'ATTACHED')
+
+
+class HashtagOutboxTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('author', password='x')
+        self.client.force_login(self.user)
+
+    def test_extracts_tags_in_worker(self):
+        post = Post.objects.create(author=self.user, content='Đi #HaNoi và #hue')
+        self.assertFalse(post.tags.exists())
+        self.assertEqual(outbox.drain(), (1, 0))
+        self.assertEqual(set(post.tags.values_list('name', flat=True)), {'hanoi', 'hue'})
+        # Chạy lại handler (hết hạn thuê) không nhân đôi tag
+        self.assertEqual(outbox.process_events(list(OutboxEvent.objects.all())), (1, 0))
+        self.assertEqual(post.tags.count(), 2)
+
+    def test_privacy_change_does_not_enqueue(self):
+        post = Post.objects.create(author=self.user, content='#tag')
+        OutboxEvent.objects.all().delete()
+        self.client.post(reverse('posts:change_post_privacy', args=[post.pk]), {'privacy': 'FRIENDS'})
+        post.refresh_from_db()
+        self.assertEqual(post.privacy, 'FRIENDS')
+        self.assertFalse(OutboxEvent.objects.exists())
@@ -0,0 +1,210 @@
+# posts/uploads.py
+"""
+Tải file lớn (video, file đính kèm chat) theo từng mảnh, có thể tiếp tục khi bị ngắt.
+
+Luồng phía client:
+  1. start: khai báo tên file, kích thước, content type, (tùy chọn) SHA-256 -> nhận upload_id.
+  2. chunk: gửi body thô của từng mảnh kèm ?offset=; mảnh phải bắt đầu đúng tại received_bytes.
+     Mất kết nối thì hỏi lại status để biết received_bytes rồi gửi tiếp từ đó.
+  3. complete: server băm lại cả file (đọc từng khối), so với SHA-256 đã khai báo rồi lưu vào storage.
+  4. Gửi upload_id cho send_message_api / PostCreateView để gắn file theo tham chiếu.
+
+Mỗi request chỉ đọc body theo khối STREAM_BLOCK_SIZE xuống file tạm, nên bộ nhớ không phụ thuộc
+kích thước file; row upload chỉ bị khóa trong lúc nối mảnh đã kiểm tra vào file .part.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+import uuid
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ChunkedUpload
+
+STREAM_BLOCK_SIZE = 64 * 1024
+
+
+class _PartFile(File):
+    # FileSystemStorage thấy temporary_file_path() sẽ chuyển (rename) file .part vào MEDIA_ROOT
+    # thay vì chép lại từng khối, giống TemporaryUploadedFile của Django
+    def temporary_file_path(self):
+        return self.file.name
+
+
+class UploadError(Exception):
+    """Lỗi phía client; `status` là HTTP status trả về, `extra` được gộp vào JSON."""
+
+    def __init__(self, message, status=400, **extra):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.extra = extra
+
+
+def _ensure_temp_dir():
+    os.makedirs(settings.UPLOAD_TEMP_DIR, exist_ok=True)
+
+
+def start_upload(user, filename, size, content_type='', sha256=''):
+    filename = os.path.basename(filename or '').strip()
+    if not filename:
+        raise UploadError('Thiếu tên file')
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        raise UploadError('Kích thước file không hợp lệ')
+    if size <= 0:
+        raise UploadError('Kích thước file không hợp lệ')
+    if size > settings.UPLOAD_MAX_SIZE:
+        raise UploadError('File quá lớn', status=413, max_size=settings.UPLOAD_MAX_SIZE)
+    sha256 = (sha256 or '').lower()
+    if sha256 and (len(sha256) != 64 or any(c not in '0123456789abcdef' for c in sha256)):
+        raise UploadError('SHA-256 không hợp lệ')
+
+    upload = ChunkedUpload.objects.create(
+        owner=user, filename=filename[:255], content_type=(content_type or '')[:100],
+        size=size, sha256=sha256,
+    )
+    _ensure_temp_dir()
+    open(upload.part_path, 'wb').close()
+    return upload
+
+
+def _spool_chunk(stream, length, expected_sha256=''):
+    """
+    Đọc đúng `length` byte từ stream vào file tạm theo khối nhỏ, vừa đọc vừa băm.
+    Trả về file tạm (đã seek về đầu); người gọi phải đóng file.
+    """
+    digest = hashlib.sha256()
+    spool = tempfile.TemporaryFile(dir=settings.UPLOAD_TEMP_DIR)
+    remaining = length
+    try:
+        while remaining:
+            block = stream.read(min(STREAM_BLOCK_SIZE, remaining))
+            if not block:
+                break
+            spool.write(block)
+            digest.update(block)
+            remaining -= len(block)
+        if remaining:
+            raise UploadError('Mảnh bị thiếu dữ liệu')
+        if expected_sha256 and digest.hexdigest() != expected_sha256.lower():
+            raise UploadError('Checksum của mảnh không khớp', status=422)
+    except Exception:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool
+
+
+def write_chunk(upload, offset, stream, length, chunk_sha256=''):
+    """
+    Nhận một mảnh bắt đầu tại `offset`. Mảnh đến sai vị trí (gửi trùng, gửi nhảy cóc) bị từ chối
+    với status 409 kèm received_bytes hiện tại để client gửi lại đúng chỗ.
+    """
+    if upload.status != 'UPLOADING':
+        raise UploadError('Upload đã kết thúc', status=409, received_bytes=upload.received_bytes)
+    if length <= 0 or length > settings.UPLOAD_CHUNK_SIZE:
+        raise UploadError('Kích thước mảnh không hợp lệ', max_chunk_size=settings.UPLOAD_CHUNK_SIZE)
+    if offset + length > upload.size:
+        raise UploadError('Mảnh vượt quá kích thước file')
+    if offset != upload.received_bytes:
+        raise UploadError('Sai vị trí mảnh', status=409, received_bytes=upload.received_bytes)
+
+    _ensure_temp_dir()
+    spool = _spool_chunk(stream, length, chunk_sha256)
+    try:
+        with transaction.atomic():
+            locked = ChunkedUpload.objects.select_for_update().get(pk=upload.pk)
+            # Kiểm tra lại sau khi khóa: request song song có thể đã ghi mảnh này
+            if locked.status != 'UPLOADING' or locked.received_bytes != offset:
+                raise UploadError('Sai vị trí mảnh', status=409, received_bytes=locked.received_bytes)
+            with open(locked.part_path, 'r+b') as part:
+                # Cắt phần thừa của lần ghi trước bị ngắt giữa chừng (chưa kịp cập nhật received_bytes)
+                part.truncate(offset)
+                part.seek(offset)
+                shutil.copyfileobj(spool, part, STREAM_BLOCK_SIZE)
+            locked.received_bytes = offset + length
+            locked.save(update_fields=['received_bytes', 'updated_at'])
+    finally:
+        spool.close()
+    return locked
+
+
+def complete_upload(upload):
+    """
+    Kiểm tra đủ byte, băm lại file .part theo khối và so với SHA-256 đã khai báo, rồi chuyển
+    file vào storage (upload_to='uploads/'). Sai checksum thì upload chuyển FAILED và file tạm bị xóa.
+    """
+    with transaction.atomic():
+        upload = ChunkedUpload.objects.select_for_update().get(pk=upload.pk)
+        if upload.status == 'COMPLETE':
+            return upload
+        if upload.status != 'UPLOADING':
+            raise UploadError('Upload đã kết thúc', status=409)
+        if upload.received_bytes != upload.size:
+            raise UploadError('Chưa nhận đủ dữ liệu', status=409, received_bytes=upload.received_bytes)
+
+        digest = hashlib.sha256()
+        with open(upload.part_path, 'rb') as part:
+            for block in iter(lambda: part.read(STREAM_BLOCK_SIZE), b''):
+                digest.update(block)
+        checksum = digest.hexdigest()
+        if upload.sha256 and checksum != upload.sha256:
+            upload.status = 'FAILED'
+            upload.save(update_fields=['status', 'updated_at'])
+        else:
+            with open(upload.part_path, 'rb') as part:
+                upload.file.save(upload.filename, _PartFile(part), save=False)
+            upload.sha256 = checksum
+            upload.status = 'COMPLETE'
+            upload.save(update_fields=['file', 'sha256', 'status', 'updated_at'])
+    _remove_part(upload)
+    if upload.status == 'FAILED':
+        raise UploadError('Checksum của file không khớp', status=422, sha256=checksum)
+    return upload
+
+
+def claim_uploads(user, upload_ids):
+    """
+    Đánh dấu ATTACHED các upload đã hoàn tất của `user` để gắn vào tin nhắn / bài viết; mỗi upload
+    chỉ được gắn một lần. Dùng một câu UPDATE có điều kiện nên hai request không thể cùng nhận một upload.
+    Gọi trong transaction của thao tác tạo tin nhắn / bài viết để lỗi phía sau trả upload về COMPLETE.
+    """
+    try:
+        upload_ids = list(dict.fromkeys(uuid.UUID(str(upload_id)) for upload_id in upload_ids if upload_id))
+    except ValueError:
+        raise UploadError('Upload không tồn tại')
+    if not upload_ids:
+        return []
+    uploads = {
+        upload.id: upload
+        for upload in ChunkedUpload.objects.filter(id__in=upload_ids, owner=user, status='COMPLETE')
+    }
+    if len(uploads) != len(upload_ids):
+        raise UploadError('Upload không tồn tại hoặc đã được sử dụng')
+    claimed = ChunkedUpload.objects.filter(id__in=upload_ids, status='COMPLETE').update(
+        status='ATTACHED', updated_at=timezone.now(),
+    )
+    if claimed != len(upload_ids):
+        raise UploadError('Upload đã được sử dụng', status=409)
+    return [uploads[upload_id] for upload_id in upload_ids]
+
+
+def _remove_part(upload):
+    try:
+        os.remove(upload.part_path)
+    except FileNotFoundError:
+        pass
+
+
+def discard_upload(upload):
+    """Xóa upload cùng file tạm và file đã lưu (nếu chưa được gắn vào đâu)."""
+    _remove_part(upload)
+    if upload.file and upload.status != 'ATTACHED':
+        upload.file.delete(save=False)
+    upload.delete()
@@ -24,6 +24,7 @@ urlpatterns = [
     path('comment/<int:comment_id>/get-edit-form/', get_comment_edit_form, name='get_comment_edit_form'),
     path('comment/<int:comment_id>/react/', views.react_to_comment, name='react_to_comment'), 
     path('post/<int:pk>/load-comments/', load_more_comments, name='load_more_comments'),
+    path('comment/<int:comment_id>/load-replies/', views.load_more_replies, name='load_more_replies'),
     path('post/<int:post_id>/reactions/', get_reaction_list, name='get_reaction_list'),
     path('post/<int:post_id>/modal/', views.post_detail_modal, name='post_detail_modal'),
     path('comment/<int:comment_id>/reactions/', views.get_comment_reactions, name='comment_reactions'),
@@ -35,4 +36,8 @@ urlpatterns = [
     path('saved/', views.SavedPostsView.as_view(), name='saved_posts'),
     path('post/<int:post_id>/save/', views.save_post, name='save_post'),
     path('post/<int:post_id>/report/', views.report_post, name='report_post'),
+    path('upload/start/', views.upload_start, name='upload_start'),
+    path('upload/<uuid:upload_id>/', views.upload_status, name='upload_status'),
+    path('upload/<uuid:upload_id>/chunk/', views.upload_chunk, name='upload_chunk'),
+    path('upload/<uuid:upload_id>/complete/', views.upload_complete, name='upload_complete'),
 ]
\ No newline at end of file
@@ -5,8 +5,8 @@ from django.shortcuts import render, get_object_or_404
 from django.urls import reverse_lazy, reverse
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.views.generic import ListView, CreateView, DeleteView, UpdateView, DetailView
-from django.db.models import Q, Count
-from .models import Post, PostMedia, Reaction, Comment, PRIVACY_CHOICES, Tag, Report
+from django.db.models import Q, Count, F
+from .models import Post, PostMedia, Reaction, Comment, PRIVACY_CHOICES, Tag, Report, ChunkedUpload
 from .forms import PostCreateForm, CommentCreateForm
 from accounts.models import Friendship, User
 from chat.models import Conversation
@@ -16,7 +16,13 @@ from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_POST
 from django.contrib.contenttypes.models import ContentType
 from django.template.loader import render_to_string
+from django.utils.dateparse import parse_datetime
+from django.db import transaction
+from django.conf import settings
 from notifications.models import Notification
+from notifications.utils import notify_reaction, withdraw_reaction
+from . import reaction_buffer
+from .uploads import UploadError, claim_uploads, complete_upload, start_upload, write_chunk
 from django.urls import reverse_lazy
 from .forms import PostCreateForm 
 
@@ -47,31 +53,27 @@ class HomePageView(ListView):
         context = super().get_context_data(**kwargs)
         if self.request.user.is_authenticated:
             post_ids = [post.id for post in context['posts']]
-            post_content_type = ContentType.objects.get_for_model(Post)
             user_post_reactions = Reaction.objects.filter(
                 user=self.request.user, 
-                object_id__in=post_ids,
-                content_type=post_content_type
-            ).values('object_id', 'reaction_type')
+                post_id__in=post_ids,
+            ).values('post_id', 'reaction_type')
             
-            context['user_reactions_map'] = {
-                reaction['object_id']: reaction['reaction_type'] 
-                for reaction in user_post_reactions
-            }
-            comment_content_type = ContentType.objects.get_for_model(Comment)
-            comment_ids = Comment.objects.filter(post_id__in=post_ids).values_list('id', flat=True)
+            context['user_reactions_map'] = reaction_buffer.apply_pending_user_reactions(
+                self.request.user, 'post', post_ids,
+                {reaction['post_id']: reaction['reaction_type'] for reaction in user_post_reactions}
+            )
+            comment_ids = list(Comment.objects.filter(post_id__in=post_ids).values_list('id', flat=True))
             user_comment_reactions = Reaction.objects.filter(
                 user=self.request.user,
-                object_id__in=comment_ids,
-                content_type=comment_content_type
-            ).values('object_id', 'reaction_type')
+                comment_id__in=comment_ids,
+            ).values('comment_id', 'reaction_type')
             
             context['post_form'] = PostCreateForm()
             
-            context['comment_user_reactions_map'] = {
-                reaction['object_id']: reaction['reaction_type']
-                for reaction in user_comment_reactions
-            }
+            context['comment_user_reactions_map'] = reaction_buffer.apply_pending_user_reactions(
+                self.request.user, 'comment', comment_ids,
+                {reaction['comment_id']: reaction['reaction_type'] for reaction in user_comment_reactions}
+            )
         return context
 
 class PostDetailView(DetailView):
@@ -85,25 +87,25 @@ class PostDetailView(DetailView):
             post = self.get_object()
             
             # Lấy reaction của user cho bài viết này
-            post_content_type = ContentType.objects.get_for_model(Post)
             user_post_reaction = Reaction.objects.filter(
                 user=self.request.user, 
-                object_id=post.id,
-                content_type=post_content_type
+                post=post,
             ).first()
-            context['user_reactions_map'] = {post.id: user_post_reaction.reaction_type} if user_post_reaction else {}
+            context['user_reactions_map'] = reaction_buffer.apply_pending_user_reactions(
+                self.request.user, 'post', [post.id],
+                {post.id: user_post_reaction.reaction_type} if user_post_reaction else {}
+            )
 
             # Lấy reaction của user cho các bình luận của bài viết này
-            comment_content_type = ContentType.objects.get_for_model(Comment)
-            comment_ids = post.comments.values_list('id', flat=True)
+            comment_ids = list(post.comments.values_list('id', flat=True))
             user_comment_reactions = Reaction.objects.filter(
                 user=self.request.user,
-                object_id__in=comment_ids,
-                content_type=comment_content_type
-            ).values('object_id', 'reaction_type')
-            context['comment_user_reactions_map'] = {
-                r['object_id']: r['reaction_type'] for r in user_comment_reactions
-            }
+                comment_id__in=comment_ids,
+            ).values('comment_id', 'reaction_type')
+            context['comment_user_reactions_map'] = reaction_buffer.apply_pending_user_reactions(
+                self.request.user, 'comment', comment_ids,
+                {r['comment_id']: r['reaction_type'] for r in user_comment_reactions}
+            )
         return context
     
 class PostCreateView(LoginRequiredMixin, CreateView):
@@ -113,10 +115,22 @@ class PostCreateView(LoginRequiredMixin, CreateView):
 
     def form_valid(self, form):
         form.instance.author = self.request.user
-        response = super().form_valid(form)
-        for file in self.request.FILES.getlist('media_files'):
-            media_type = 'IMAGE' if 'image' in file.content_type else 'VIDEO'
-            PostMedia.objects.create(post=self.object, file=file, media_type=media_type)
+        try:
+            with transaction.atomic():
+                # File lớn được tải trước theo mảnh (posts/uploads.py), form chỉ gửi upload_ids
+                uploads = claim_uploads(self.request.user, self.request.POST.getlist('upload_ids'))
+                response = super().form_valid(form)
+                order = 0
+                for file in self.request.FILES.getlist('media_files'):
+                    media_type = 'IMAGE' if 'image' in file.content_type else 'VIDEO'
+                    PostMedia.objects.create(post=self.object, file=file, media_type=media_type, order=order)
+                    order += 1
+                for upload in uploads:
+                    PostMedia.objects.create(post=self.object, file=upload.file.name, media_type=upload.media_type, order=order)
+                    order += 1
+        except UploadError as e:
+            form.add_error(None, e.message)
+            return self.form_invalid(form)
         return response
     
     def get_success_url(self):
@@ -149,6 +163,11 @@ class PostUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
         post = self.get_object()
         return self.request.user == post.author
 
+    def form_valid(self, form):
+        # Bài viết và sự kiện tách hashtag (posts/signals.py) được ghi cùng một transaction
+        with transaction.atomic():
+            return super().form_valid(form)
+
     def get_success_url(self):
         # 1. Ưu tiên: Kiểm tra xem form có gửi kèm tham số 'next' không
         next_url = self.request.POST.get('next')
@@ -190,10 +209,21 @@ def react_to_post(request, post_id):
         if not can_react:
             return JsonResponse({'status': 'error', 'message': 'Không có quyền thực hiện hành động này'}, status=403)
 
-        content_type = ContentType.objects.get_for_model(Post)
-        existing_reaction = Reaction.objects.filter(
-            user=viewer, content_type=content_type, object_id=post.id
-        ).first()
+        # Chế độ ghi trễ: ghi nhận vào bộ đệm, trả về số đếm lạc quan, flush xuống DB sau
+        if reaction_buffer.is_enabled():
+            valid_reactions = [choice[0] for choice in Reaction.REACTION_CHOICES]
+            if reaction_type not in valid_reactions:
+                return JsonResponse({'status': 'error', 'message': 'Loại reaction không hợp lệ'}, status=400)
+            current_user_reaction = reaction_buffer.toggle(viewer, 'post', post.id, reaction_type)
+            stats_dict = post.get_reaction_stats()
+            return JsonResponse({
+                'status': 'ok',
+                'total_reactions': sum(stats_dict.values()),
+                'reaction_stats': stats_dict,
+                'current_user_reaction': current_user_reaction 
+            })
+
+        existing_reaction = Reaction.objects.filter(user=viewer, post=post).first()
         
         current_user_reaction = None
         if existing_reaction:
@@ -204,28 +234,19 @@ def react_to_post(request, post_id):
                 existing_reaction.reaction_type = reaction_type
                 existing_reaction.save()
                 current_user_reaction = reaction_type
-                if viewer != author:
-                    Notification.objects.create(
-                        recipient=author, sender=viewer, notification_type='POST_REACTION',
-                        target_content_type=content_type, target_object_id=post.id
-                    )
         else:
             Reaction.objects.create(
                 user=viewer,
-                content_type=content_type,
-                object_id=post.id,
+                post=post,
                 reaction_type=reaction_type
             )
             current_user_reaction = reaction_type
-        
-            if viewer != author:
-                Notification.objects.create(
-                    recipient=author,
-                    sender=viewer,
-                    notification_type='POST_REACTION',
-                    target_content_type=content_type,
-                    target_object_id=post.id
-                )
+
+        # Gộp thông báo: mỗi bài viết chỉ có một dòng "A và N người khác..."
+        if current_user_reaction:
+            notify_reaction(author, viewer, 'POST_REACTION', post)
+        elif existing_reaction:
+            withdraw_reaction(author, viewer, 'POST_REACTION', post)
             
         reaction_stats = post.reactions.values('reaction_type').annotate(count=Count('id')).order_by('-count')
         stats_dict = {item['reaction_type']: item['count'] for item in reaction_stats}
@@ -243,12 +264,7 @@ def react_to_post(request, post_id):
 
 def reaction_detail(request, pk):
     post = Post.objects.get(pk=pk)
-    post_type = ContentType.objects.get_for_model(Post)
-
-    reactions = Reaction.objects.filter(
-        content_type=post_type,
-        object_id=post.id
-    )
+    reactions = Reaction.objects.filter(post=post).select_related('user')
 
     data = {}
     for reaction in reactions:
@@ -298,6 +314,8 @@ def add_comment(request, post_id):
         content=content,
         parent=parent_comment
     )
+    if parent_comment:
+        Comment.objects.filter(id=parent_comment.id).update(reply_count=F('reply_count') + 1)
 
     # === TẠO THÔNG BÁO ===
     if request.user != post.author:
@@ -340,6 +358,8 @@ def delete_comment(request, comment_id):
     comment = get_object_or_404(Comment, id=comment_id)
     # Chỉ tác giả bình luận hoặc chủ bài viết mới có quyền xóa
     if comment.author == request.user or comment.post.author == request.user:
+        if comment.parent_id:
+            Comment.objects.filter(id=comment.parent_id, reply_count__gt=0).update(reply_count=F('reply_count') - 1)
         comment.delete()
         return JsonResponse({'status': 'ok'})
     else:
@@ -406,10 +426,17 @@ def react_to_comment(request, comment_id):
     if reaction_type not in valid_reactions:
         return JsonResponse({'status': 'error', 'message': 'Loại reaction không hợp lệ'}, status=400)
 
-    content_type = ContentType.objects.get_for_model(Comment)
-    existing_reaction = Reaction.objects.filter(
-        user=viewer, content_type=content_type, object_id=comment.id
-    ).first()
+    if reaction_buffer.is_enabled():
+        current_user_reaction = reaction_buffer.toggle(viewer, 'comment', comment.id, reaction_type)
+        stats_dict = comment.get_reaction_stats()
+        return JsonResponse({
+            'status': 'ok',
+            'total_reactions': sum(stats_dict.values()),
+            'reaction_stats': stats_dict,
+            'current_user_reaction': current_user_reaction
+        })
+
+    existing_reaction = Reaction.objects.filter(user=viewer, comment=comment).first()
 
     current_user_reaction = None
     if existing_reaction:
@@ -420,25 +447,14 @@ def react_to_comment(request, comment_id):
             existing_reaction.reaction_type = reaction_type
             existing_reaction.save()
             current_user_reaction = reaction_type
-            if viewer != comment.author:
-                Notification.objects.create(
-                    recipient=comment.author, sender=viewer, notification_type='COMMENT_REACTION',
-                    target_content_type=content_type, target_object_id=comment.id
-                )
     else:
-        Reaction.objects.create(
-            user=viewer, content_type=content_type, object_id=comment.id, reaction_type=reaction_type
-        )
+        Reaction.objects.create(user=viewer, comment=comment, reaction_type=reaction_type)
         current_user_reaction = reaction_type
 
-        if viewer != comment.author:
-            Notification.objects.create(
-                recipient=comment.author,
-                sender=viewer,
-                notification_type='COMMENT_REACTION',
-                target_content_type=content_type,
-                target_object_id=comment.id
-            )
+    if current_user_reaction:
+        notify_reaction(comment.author, viewer, 'COMMENT_REACTION', comment)
+    elif existing_reaction:
+        withdraw_reaction(comment.author, viewer, 'COMMENT_REACTION', comment)
         
     reaction_stats = comment.reactions.values('reaction_type').annotate(count=Count('id'))
     stats_dict = {item['reaction_type']: item['count'] for item in reaction_stats}
@@ -451,57 +467,91 @@ def react_to_comment(request, comment_id):
         'current_user_reaction': current_user_reaction
     })
 
-@login_required
-def load_more_comments(request, pk):
-    post = get_object_or_404(Post, pk=pk)
-    offset = int(request.GET.get('offset', 0))
-    limit = 3  # Tải 3 bình luận mỗi lần bấm
+COMMENT_PAGE_SIZE = 3  # Số bình luận tải thêm mỗi lần bấm
+
+def _paginate_comments(queryset, cursor, newest_first=True, limit=COMMENT_PAGE_SIZE):
+    """
+    Phân trang keyset theo cặp (created_at, id) thay cho offset.
+    Lấy dư 1 dòng để biết còn trang sau hay không mà không cần COUNT.
+    Ném ValueError nếu con trỏ không hợp lệ.
+    """
+    if cursor:
+        created_at_raw, _, id_raw = cursor.rpartition('|')
+        created_at = parse_datetime(created_at_raw)
+        if created_at is None:
+            raise ValueError('Invalid cursor')
+        last_id = int(id_raw)
+        if newest_first:
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=last_id)
+            )
+        else:
+            queryset = queryset.filter(
+                Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=last_id)
+            )
 
-    # Lấy các bình luận tiếp theo
-    comments = post.comments.filter(parent__isnull=True).order_by('-created_at')[offset:offset + limit]
+    ordering = ('-created_at', '-id') if newest_first else ('created_at', 'id')
+    rows = list(queryset.select_related('author').order_by(*ordering)[:limit + 1])
+    has_more = len(rows) > limit
+    return rows[:limit], has_more
 
+def _render_comment_page(request, post, comments, has_more):
+    # Render cả lô bình luận bằng một lần gọi template (context processors chỉ chạy 1 lần)
     if not comments:
-        return JsonResponse({'html': '', 'has_more': False})
+        return JsonResponse({'html': '', 'has_more': False, 'next_cursor': None})
 
-    # Lấy reaction map cho các bình luận sắp được render
     comment_ids = [c.id for c in comments]
-    comment_content_type = ContentType.objects.get_for_model(Comment)
     user_comment_reactions = Reaction.objects.filter(
         user=request.user,
-        object_id__in=comment_ids,
-        content_type=comment_content_type
-    ).values('object_id', 'reaction_type')
-    
-    comment_user_reactions_map = {
-        r['object_id']: r['reaction_type'] for r in user_comment_reactions
-    }
+        comment_id__in=comment_ids,
+    ).values('comment_id', 'reaction_type')
 
-    # Render các bình luận ra HTML
-    html = ""
-    for comment in comments:
-        context = {
-            'comment': comment,
-            'post': post,
-            'user': request.user,
-            'comment_user_reactions_map': comment_user_reactions_map
-        }
-        html += render_to_string('posts/_single_comment.html', context, request=request)
-    
-    # Kiểm tra xem còn bình luận để tải nữa không
-    new_offset = offset + len(comments)
-    has_more = post.comment_count > new_offset
+    comment_user_reactions_map = reaction_buffer.apply_pending_user_reactions(
+        request.user, 'comment', comment_ids,
+        {r['comment_id']: r['reaction_type'] for r in user_comment_reactions}
+    )
+
+    html = render_to_string('posts/_comment_list.html', {
+        'comments': comments,
+        'post': post,
+        'comment_user_reactions_map': comment_user_reactions_map,
+    }, request=request)
+
+    return JsonResponse({
+        'html': html,
+        'has_more': has_more,
+        'next_cursor': comments[-1].cursor if has_more else None,
+    })
+
+@login_required
+def load_more_comments(request, pk):
+    post = get_object_or_404(Post, pk=pk)
+    try:
+        comments, has_more = _paginate_comments(
+            post.comments.filter(parent__isnull=True), request.GET.get('cursor'), newest_first=True
+        )
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Con trỏ không hợp lệ'}, status=400)
+
+    return _render_comment_page(request, post, comments, has_more)
+
+@login_required
+def load_more_replies(request, comment_id):
+    comment = get_object_or_404(Comment.objects.select_related('post'), id=comment_id)
+    try:
+        replies, has_more = _paginate_comments(
+            comment.replies.all(), request.GET.get('cursor'), newest_first=False
+        )
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Con trỏ không hợp lệ'}, status=400)
 
-    return JsonResponse({'html': html, 'has_more': has_more, 'new_offset': new_offset})
+    return _render_comment_page(request, comment.post, replies, has_more)
 
 @login_required
 def get_reaction_list(request, post_id):
     post = get_object_or_404(Post, id=post_id)
-    content_type = ContentType.objects.get_for_model(Post)
     
-    reactions = Reaction.objects.filter(
-        content_type=content_type,
-        object_id=post.id
-    ).select_related('user').order_by('-id')
+    reactions = Reaction.objects.filter(post=post).select_related('user').order_by('-id')
 
     current_user_friends_qs = Friendship.get_friends(request.user)
     current_user_friend_ids = set(current_user_friends_qs.values_list('id', flat=True))
@@ -556,6 +606,7 @@ def post_detail_modal(request, post_id):
         user_reaction = post.reactions.filter(user=request.user).first()
         if user_reaction:
             user_reactions_map[post.id] = user_reaction.reaction_type
+        reaction_buffer.apply_pending_user_reactions(request.user, 'post', [post.id], user_reactions_map)
 
     # Lấy comments
     comments = post.comments.filter(parent=None).order_by('-created_at')
@@ -659,23 +710,25 @@ def share_post(request, post_id):
     # Nếu bài gốc vốn đã là một bài chia sẻ, ta chia sẻ bài gốc CỦA bài chia sẻ đó 
     source_post = original_post.shared_from if original_post.shared_from else original_post
 
-    new_post = Post.objects.create(
-        author=request.user,
-        content=content,
-        privacy=new_privacy,
-        shared_from=source_post # Liên kết đến bài gốc
-    )
-    
-    # Tạo thông báo cho chủ bài viết gốc
-    if request.user != source_post.author:
-        Notification.objects.create(
-            recipient=source_post.author,
-            sender=request.user,
-            notification_type='POST_SHARE', 
-            target_content_type=ContentType.objects.get_for_model(new_post),
-            target_object_id=new_post.id
+    # Bài chia sẻ, sự kiện tách hashtag và thông báo được ghi cùng một transaction
+    with transaction.atomic():
+        new_post = Post.objects.create(
+            author=request.user,
+            content=content,
+            privacy=new_privacy,
+            shared_from=source_post # Liên kết đến bài gốc
         )
 
+        # Tạo thông báo cho chủ bài viết gốc
+        if request.user != source_post.author:
+            Notification.objects.create(
+                recipient=source_post.author,
+                sender=request.user,
+                notification_type='POST_SHARE', 
+                target_content_type=ContentType.objects.get_for_model(new_post),
+                target_object_id=new_post.id
+            )
+
     return JsonResponse({'status': 'ok', 'message': 'Đã chia sẻ bài viết!'})
 
 @login_required
@@ -694,7 +747,7 @@ def change_post_privacy(request, pk):
     
     if new_privacy in valid_privacy_keys:
         post.privacy = new_privacy
-        post.save()
+        post.save(update_fields=['privacy'])  # Nội dung không đổi: không cần tách lại hashtag
         return JsonResponse({'status': 'ok', 'new_privacy': new_privacy})
     else:
         return JsonResponse({'status': 'error', 'message': 'Dữ liệu không hợp lệ'}, status=400)
@@ -782,4 +835,73 @@ def report_post(request, post_id):
         reason=reason
     )
     
-    return JsonResponse({'status': 'ok', 'message': 'Cảm ơn bạn đã báo cáo. Chúng tôi sẽ xem xét.'})
\ No newline at end of file
+    return JsonResponse({'status': 'ok', 'message': 'Cảm ơn bạn đã báo cáo. Chúng tôi sẽ xem xét.'})
+
+
+# ------------------- TẢI FILE THEO MẢNH -------------------
+def _upload_error(e):
+    return JsonResponse({'status': 'error', 'message': e.message, **e.extra}, status=e.status)
+
+
+def _upload_data(upload):
+    return {
+        'status': 'ok',
+        'upload_id': str(upload.id),
+        'upload_status': upload.status,
+        'size': upload.size,
+        'received_bytes': upload.received_bytes,
+        'chunk_size': settings.UPLOAD_CHUNK_SIZE,
+    }
+
+
+@login_required
+@require_POST
+def upload_start(request):
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Invalid JSON'}, status=400)
+    try:
+        upload = start_upload(
+            request.user, data.get('filename'), data.get('size'),
+            content_type=data.get('content_type'), sha256=data.get('sha256'),
+        )
+    except UploadError as e:
+        return _upload_error(e)
+    return JsonResponse(_upload_data(upload), status=201)
+
+
+@login_required
+@require_POST
+def upload_chunk(request, upload_id):
+    # Body là dữ liệu thô của mảnh (application/octet-stream); đọc dần bằng request.read()
+    # thay vì request.body để không nạp cả mảnh vào bộ nhớ
+    upload = get_object_or_404(ChunkedUpload, id=upload_id, owner=request.user)
+    try:
+        offset = int(request.GET.get('offset', ''))
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Invalid offset'}, status=400)
+    try:
+        upload = write_chunk(upload, offset, request, length, request.headers.get('X-Chunk-SHA256', ''))
+    except UploadError as e:
+        return _upload_error(e)
+    return JsonResponse(_upload_data(upload))
+
+
+@login_required
+def upload_status(request, upload_id):
+    # Client hỏi lại sau khi mất kết nối để tiếp tục từ received_bytes
+    upload = get_object_or_404(ChunkedUpload, id=upload_id, owner=request.user)
+    return JsonResponse(_upload_data(upload))
+
+
+@login_required
+@require_POST
+def upload_complete(request, upload_id):
+    upload = get_object_or_404(ChunkedUpload, id=upload_id, owner=request.user)
+    try:
+        upload = complete_upload(upload)
+    except UploadError as e:
+        return _upload_error(e)
+    return JsonResponse({**_upload_data(upload), 'sha256': upload.sha256, 'file_url': upload.file.url})